@@ -0,0 +1,469 @@
+from TwitchAPI import TwitchAPI
+from Exceptions import CoordinatorError, Error
+from EventSub import EventSub
+from Streamer import Streamer
+from Planner import Planner
+from Metrics import Metrics
+from Config import Config
+from Logger import Log
+import hashlib
+import sqlite3
+import asyncio
+import bisect
+import socket
+import time
+import os
+
+
+# A Class for Running Several Instances (Nodes) on the Same Watchlist Without Duplicate Alerts
+# Streamers are Assigned to Nodes With a Consistent Hash Ring, so a Node Joining or Leaving Only Moves the Streamers on Its Part of the Ring
+# Nodes Find Each Other Through a Coordinator, Which Also Records Who Owns Each Streamer and Its Last-Known State
+# A Node Only Polls the Streamers the Coordinator Says It Owns. Ownership Changes Hands Along With the State, so the New Owner
+# Picks Up Where the Old One Stopped: Changes That Happened During a Handoff are Alerted Once
+# State is Only Saved Every Heartbeat, so When a Node Crashes, Changes It Saw Since Its Last Heartbeat May be Alerted Again
+# by the New Owner, and Alerts It Hadn't Sent Yet Wait in Its Outbox Until It Restarts
+class Cluster():
+
+	SETTINGS_KEY = "Cluster Settings"
+
+	enabled = False
+	coordinator = None
+	node_id = None
+
+	streamer_dict = None # Every Streamer in the Config. Alerts and Reloads Use These
+	owned = {}           # The Streamers This Node Polls. Shared With the Polling Loops and EventSub
+	assigned = set()     # User ID's the Ring Gives This Node. Some May Still be Waiting to be Handed Over
+	members = []         # Node ID's That are Alive, Sorted
+	ring = None
+	saved = {}           # User ID -> State Last Written to the Coordinator, so Only Changes are Written
+	removed = set()      # User ID's Removed From the Config Whose Coordinator Rows Haven't Been Deleted Yet
+	watchlist_changed = False
+
+	last_heartbeat = 0
+	changed = asyncio.Event() # Set When the Watchlist Changes, so the Next Rebalance Doesn't Wait for the Heartbeat
+	task = None
+
+
+	# Loads the Cluster Settings and Opens the Coordinator
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	# Post-Condition: The Coordinator is Ready or a CoordinatorError Was Raised
+	def init(config):
+		Cluster.enabled = Cluster.SETTINGS_KEY in config
+		if not Cluster.enabled:
+			return
+
+		settings = config[Cluster.SETTINGS_KEY]
+		Cluster.node_id = str(settings.get("Node ID", socket.gethostname()))
+		Cluster.HEARTBEAT = float(settings.get("Heartbeat", 5))
+		Cluster.NODE_TIMEOUT = float(settings.get("Node Timeout", 3 * Cluster.HEARTBEAT))
+		Cluster.VIRTUAL_NODES = int(settings.get("Virtual Nodes", 64))
+
+		if Cluster.coordinator == None:
+			Cluster.coordinator = COORDINATORS[settings.get("Coordinator", "SQLite")](settings)
+
+		Metrics.collect("Cluster", Cluster.metrics)
+
+
+
+	# Joins the Cluster and Takes Over This Node's Share of the Streamers
+	# Returns the Dictionary of Streamers This Node Polls. It's Updated in Place as Streamers Move Between Nodes
+	# Pre-Condition: 'streamer_dict' Holds Every Streamer in the Config, Created Without Polling (See Streamer.add_all())
+	async def join(streamer_dict):
+		Cluster.streamer_dict = streamer_dict
+		Cluster.owned = {}
+		Cluster.saved = {}
+		Cluster.members = []
+		Cluster.watchlist_changed = True
+
+		await Cluster.rebalance()
+		return Cluster.owned
+
+
+
+	# Starts the Heartbeat
+	def start():
+		Cluster.task = asyncio.get_event_loop().create_task(Cluster.run())
+
+
+
+	# Stops the Heartbeat, Hands Every Streamer Back With Its State, and Leaves the Cluster
+	# The Other Nodes Take the Streamers Over on Their Next Heartbeat Instead of Waiting for This Node to Time Out
+	async def stop():
+		if Cluster.task != None and not Cluster.task.done():
+			Cluster.task.cancel()
+			await asyncio.gather(Cluster.task, return_exceptions=True)
+
+		if not Cluster.enabled or Cluster.coordinator == None or Cluster.streamer_dict == None:
+			return
+
+		rows = [(user_id, None) + Cluster.__state(streamer) for user_id, streamer in Cluster.owned.items()]
+		try:
+			await Cluster.__call(Cluster.coordinator.leave, Cluster.node_id, rows)
+		except CoordinatorError as err:
+			Log.logger.warning("Couldn't Leave the Cluster Cleanly. The Other Nodes Will Take Over Once This Node Times Out.\nDetails:\n" + err.details)
+
+		Cluster.__drop(list(Cluster.owned))
+		Cluster.coordinator.close()
+		Cluster.coordinator = None
+
+
+
+	# Rebalances Soon After the Watchlist Changed. Used by the Reloader
+	# Streamers in 'removed' Stop Being Polled Now, and Their Coordinator Rows are Deleted on the Next Rebalance
+	def update(removed=()):
+		Cluster.__drop(removed)
+		Cluster.assigned.difference_update(removed)
+		Cluster.removed.update(removed)
+
+		Cluster.watchlist_changed = True
+		Cluster.changed.set()
+
+
+
+	# Sends a Heartbeat and Rebalances Every 'Heartbeat' Seconds
+	# Errors Here Are Never Fatal. A Node That Can't Reach the Coordinator for Longer Than 'Node Timeout' Stops Polling,
+	# Since the Other Nodes Will Have Taken Its Streamers Over by Then
+	async def run():
+		while True:
+			try:
+				await asyncio.wait_for(Cluster.changed.wait(), Cluster.HEARTBEAT)
+			except asyncio.TimeoutError:
+				pass
+
+			try:
+				await Cluster.rebalance()
+			except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+				raise
+			except BaseException as err:
+				Log.logger.warning("Cluster Heartbeat Failed.\nDetails:\n" + Error.exception_str(err))
+
+				if time.time() > Cluster.last_heartbeat + Cluster.NODE_TIMEOUT and len(Cluster.owned):
+					Log.logger.warning("Lost Contact With the Cluster Coordinator. Pausing Polling Until It's Back")
+					Cluster.__drop(list(Cluster.owned))
+					Cluster.__replan()
+
+
+
+	# Brings This Node's Streamers in Line With the Ring
+	# Post-Condition: State Changes Have Been Saved, Streamers That Belong to Other Nodes Were Handed Off,
+	# and Streamers That Belong Here Were Taken Over (Unless Their Old Owner Hasn't Let Go of Them Yet)
+	async def rebalance():
+		Cluster.changed.clear()
+		now = time.time()
+
+		# Heartbeat, and Rebuild the Ring if a Node Joined or Left
+		members = await Cluster.__call(Cluster.coordinator.heartbeat, Cluster.node_id, now, Cluster.NODE_TIMEOUT)
+		Cluster.last_heartbeat = now
+		ring_changed = (members != Cluster.members)
+
+		if ring_changed:
+			Log.logger.info("Cluster Members: " + ", ".join(members) + " (This Node: " + Cluster.node_id + ")")
+			Cluster.members = members
+			Cluster.ring = HashRing(members, Cluster.VIRTUAL_NODES)
+
+		if ring_changed or Cluster.watchlist_changed:
+			Cluster.watchlist_changed = False
+			Cluster.assigned = set([user_id for user_id in Cluster.streamer_dict if Cluster.ring.owner(user_id) == Cluster.node_id])
+
+		# Forget Streamers Removed From the Config, Unless They Were Added Back Since
+		removed = list(Cluster.removed)
+		forgotten = [user_id for user_id in removed if user_id not in Cluster.streamer_dict]
+		if len(forgotten):
+			await Cluster.__call(Cluster.coordinator.forget, Cluster.node_id, forgotten)
+		Cluster.removed.difference_update(removed)
+
+		# Save What Changed Since the Last Heartbeat. Streamers Another Node Took Over While We Were Out of Contact are Dropped
+		states = dict([(user_id, Cluster.__state(streamer)) for user_id, streamer in Cluster.owned.items()])
+		rows = [(user_id,) + state for user_id, state in states.items() if Cluster.saved.get(user_id) != state]
+
+		still_owned = await Cluster.__call(Cluster.coordinator.save, Cluster.node_id, rows)
+		for row in rows:
+			if row[0] in Cluster.owned:
+				Cluster.saved[row[0]] = states[row[0]]
+
+		lost = [user_id for user_id in Cluster.owned if user_id not in still_owned]
+		if len(lost):
+			Log.logger.warning(str(len(lost)) + " Streamer(s) Were Taken Over by Another Node")
+			Cluster.__drop(lost)
+
+		# Hand Off Streamers That Belong to Another Node Now, Along With Their State
+		moving = [user_id for user_id in Cluster.owned if user_id not in Cluster.assigned]
+		if len(moving):
+			rows = [(user_id, Cluster.ring.owner(user_id)) + Cluster.__state(Cluster.owned[user_id]) for user_id in moving]
+			await Cluster.__call(Cluster.coordinator.release, Cluster.node_id, rows)
+			Cluster.__drop(moving)
+			Metrics.inc("fta_cluster_handoffs_total", (("direction", "out"),), len(moving))
+
+		# Take Over Streamers That Belong Here. Ones Still Owned by a Live Node are Claimed Once It Hands Them Off
+		wanted = [user_id for user_id in Cluster.assigned if user_id not in Cluster.owned]
+		claimed = {}
+		if len(wanted):
+			claimed = await Cluster.__call(Cluster.coordinator.claim, Cluster.node_id, wanted, members)
+			await Cluster.__acquire(claimed)
+			Metrics.inc("fta_cluster_handoffs_total", (("direction", "in"),), len(claimed))
+
+		if len(lost) or len(moving) or len(claimed):
+			Log.logger.info("Rebalanced Cluster: Took Over " + str(len(claimed)) + " Streamer(s), Handed Off " + str(len(moving) + len(lost)) + ". Polling " + str(len(Cluster.owned)) + " Streamer(s)")
+
+		if len(lost) or len(moving) or len(claimed) or len(forgotten):
+			Cluster.__replan()
+
+
+
+	# Starts Polling Claimed Streamers
+	# Streamers With a Saved State Continue From It, so Anything That Changed During the Handoff is Alerted on the First Poll
+	# Streamers Nobody Has Polled Before Start From Their Current State, Like at Startup
+	async def __acquire(claimed):
+		fresh = {}
+
+		for user_id, state in claimed.items():
+			streamer = Cluster.streamer_dict.get(user_id)
+			if streamer == None:
+				continue
+
+			if state == None:
+				fresh[streamer.name] = {"User ID" : user_id, "Ban Status" : streamer.ban_status}
+				continue
+
+			# The Old Owner May Have Seen a Rename or Ban That This Node's config.json Doesn't Have Yet
+			name, title, game, is_live, ban_status, last_live = state
+			if name != streamer.name:
+				await streamer.rename(name)
+			if ban_status != streamer.ban_status:
+				await Config.update_ban_status(streamer.name, ban_status)
+
+			streamer.apply_state(title, game, is_live, ban_status)
+			streamer.last_live = last_live
+			TwitchAPI.add_streamer(user_id, is_live)
+
+			Cluster.owned[user_id] = streamer
+			Cluster.saved[user_id] = Cluster.__state(streamer)
+
+		if not len(fresh):
+			return
+
+		# Request Their State Into Temporary Objects, Then Copy It Into the Streamers Plugins Already Know About
+		requested = {}
+		await Streamer.add_all(requested, fresh)
+		for user_id, new in requested.items():
+			streamer = Cluster.streamer_dict[user_id]
+			streamer.apply_state(new.last_title, new.last_game, new.is_live, new.ban_status)
+			Cluster.owned[user_id] = streamer
+
+
+
+	# Stops Polling Streamers. Their Objects Stay in the Streamer Dict. so Queued Alerts are Still Sent
+	def __drop(user_ids):
+		for user_id in user_ids:
+			Cluster.owned.pop(user_id, None)
+			Cluster.saved.pop(user_id, None)
+			Streamer.live.discard(user_id)
+			TwitchAPI.remove_streamer(user_id)
+
+
+
+	# Plans the Refresh Rates Again and Subscribes to New Streamers After the Streamers This Node Polls Changed
+	def __replan():
+		Planner.plan()
+		EventSub.update()
+
+
+
+	# The Part of a Streamer's State That's Handed Off
+	def __state(streamer):
+		return (streamer.name, streamer.last_title, streamer.last_game, streamer.is_live, streamer.ban_status, streamer.last_live)
+
+
+
+	# Runs a Coordinator Method in a Worker Thread, Since Coordinators are Allowed to Block
+	async def __call(function, *args):
+		try:
+			return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+		except CoordinatorError:
+			raise
+		except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+			raise
+		except BaseException as err:
+			raise CoordinatorError(err)
+
+
+
+	# Returns Cluster Gauges for the Metrics Endpoint
+	def metrics():
+		return [
+			("fta_cluster_nodes", (), len(Cluster.members)),
+			("fta_cluster_streamers", (("state", "owned"),), len(Cluster.owned)),
+			("fta_cluster_streamers", (("state", "waiting"),), len([user_id for user_id in Cluster.assigned if user_id not in Cluster.owned]))
+		]
+
+
+
+# Maps Keys to Nodes. Each Node is Placed on the Ring 'replicas' Times, and a Key Belongs to the Next Node Point Clockwise From It
+# Adding or Removing a Node Only Moves the Keys Between Its Points and the Ones Before Them
+class HashRing():
+
+	def __init__(self, nodes, replicas):
+		points = sorted([(HashRing.hash(node + "#" + str(index)), node) for node in nodes for index in range(replicas)])
+		self.points = [point for point, node in points]
+		self.nodes = [node for point, node in points]
+
+
+
+	# A Stable 64-Bit Hash. Python's Built-In hash() Changes Between Runs
+	def hash(text):
+		return int.from_bytes(hashlib.blake2b(str(text).encode(), digest_size=8).digest(), "big")
+
+
+
+	# Returns the Node a Key Belongs To, or None if There are No Nodes
+	def owner(self, key):
+		if not len(self.points):
+			return None
+		return self.nodes[bisect.bisect(self.points, HashRing.hash(key)) % len(self.points)]
+
+
+
+# A Coordinator That Keeps Cluster Membership and Streamer Ownership in a SQLite File
+# Every Change Runs in a Write Transaction, so SQLite's File Lock Keeps Nodes From Claiming the Same Streamer
+# Meant for Nodes on One Machine (or Testing). The File Needs a Filesystem With Working Locks, Which Rules Out Most Network Shares
+#
+# Other Coordinators (for a Database or Key-Value Store Shared by Every Host) Need the Same Methods, and are Added to COORDINATORS Below
+# Methods are Called From a Worker Thread and May Block. Errors Should be Raised as CoordinatorError
+#	heartbeat(node_id, now, timeout) -> Sorted List of Node ID's Seen Within 'timeout' Seconds, Including This One
+#	save(node_id, rows)              -> Updates the State of Streamers Still Owned by 'node_id', Then Returns the Set of User ID's It Owns
+#	release(node_id, rows)           -> Passes Streamers Owned by 'node_id' to the Node in Each Row, Along With Their State
+#	claim(node_id, user_ids, live)   -> Takes Streamers That Have No Owner, are Already Owned by 'node_id', or Whose Owner Isn't in 'live'.
+#	                                    Returns User ID -> Saved State (or None if There Isn't Any) for Each Streamer Claimed
+#	leave(node_id, rows)             -> Saves the State of Every Streamer Owned by 'node_id' Without an Owner, Then Removes the Node
+#	forget(node_id, user_ids)        -> Deletes Streamers Removed From the Config, Unless Another Live Node Still Owns Them
+#	close()
+# 'rows' are (User ID, State...) for save() and (User ID, New Owner, State...) for release() and leave(). State is (Name, Title, Game, Is Live, Ban Status, Last Live)
+class SQLiteCoordinator():
+
+	DEFAULT_FILE = "cluster.db"
+	LOCK_TIMEOUT = 30 # Seconds to Wait for Another Node's Transaction
+
+
+	# Opens (or Creates) the Database
+	# Relative Paths are Relative to the Folder With config.json
+	def __init__(self, settings):
+		self.filename = os.path.join(os.path.dirname(os.path.abspath(Config.filename)), settings.get("Database", SQLiteCoordinator.DEFAULT_FILE))
+
+		try:
+			self.connection = sqlite3.connect(self.filename, timeout=SQLiteCoordinator.LOCK_TIMEOUT, isolation_level=None, check_same_thread=False)
+			self.connection.execute("PRAGMA journal_mode=WAL")
+			with self.__transaction():
+				self.connection.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+				self.connection.execute(
+					"CREATE TABLE IF NOT EXISTS streamers (user_id TEXT PRIMARY KEY, owner TEXT, name TEXT, title TEXT, game TEXT, " +
+					"is_live INTEGER, ban_status INTEGER, last_live REAL, updated REAL)"
+				)
+				self.connection.execute("CREATE INDEX IF NOT EXISTS streamers_owner ON streamers (owner)")
+
+		except sqlite3.Error as err:
+			raise CoordinatorError(err)
+
+
+
+	def heartbeat(self, node_id, now, timeout):
+		with self.__transaction():
+			self.connection.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?)", (node_id, now))
+			self.connection.execute("DELETE FROM nodes WHERE heartbeat < ?", (now - timeout,))
+			return [row[0] for row in self.connection.execute("SELECT node_id FROM nodes ORDER BY node_id")]
+
+
+
+	def save(self, node_id, rows):
+		with self.__transaction():
+			self.connection.executemany(
+				"UPDATE streamers SET name = ?, title = ?, game = ?, is_live = ?, ban_status = ?, last_live = ?, updated = ? WHERE user_id = ? AND owner = ?",
+				[tuple(row[1:]) + (time.time(), row[0], node_id) for row in rows]
+			)
+			return set([row[0] for row in self.connection.execute("SELECT user_id FROM streamers WHERE owner = ?", (node_id,))])
+
+
+
+	def release(self, node_id, rows):
+		with self.__transaction():
+			self.connection.executemany(
+				"UPDATE streamers SET owner = ?, name = ?, title = ?, game = ?, is_live = ?, ban_status = ?, last_live = ?, updated = ? WHERE user_id = ? AND owner = ?",
+				[tuple(row[1:]) + (time.time(), row[0], node_id) for row in rows]
+			)
+
+
+
+	def claim(self, node_id, user_ids, live):
+		claimed = {}
+		live = set(live)
+
+		with self.__transaction():
+			for user_id in user_ids:
+				row = self.connection.execute("SELECT owner, name, title, game, is_live, ban_status, last_live FROM streamers WHERE user_id = ?", (user_id,)).fetchone()
+
+				if row == None:
+					self.connection.execute("INSERT INTO streamers (user_id, owner, updated) VALUES (?, ?, ?)", (user_id, node_id, time.time()))
+					claimed[user_id] = None
+
+				elif row[0] == None or row[0] == node_id or row[0] not in live:
+					self.connection.execute("UPDATE streamers SET owner = ? WHERE user_id = ?", (node_id, user_id))
+					name, title, game, is_live, ban_status, last_live = row[1:]
+					claimed[user_id] = None if name == None else (name, title, game, bool(is_live), bool(ban_status), last_live)
+
+		return claimed
+
+
+
+	def forget(self, node_id, user_ids):
+		with self.__transaction():
+			self.connection.executemany(
+				"DELETE FROM streamers WHERE user_id = ? AND (owner IS NULL OR owner = ? OR owner NOT IN (SELECT node_id FROM nodes))",
+				[(user_id, node_id) for user_id in user_ids]
+			)
+
+
+
+	def leave(self, node_id, rows):
+		self.release(node_id, rows)
+		with self.__transaction():
+			self.connection.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+
+
+	def close(self):
+		self.connection.close()
+
+
+
+	# Runs a Block in a Write Transaction. BEGIN IMMEDIATE Takes the File Lock Up Front, so Two Nodes Can't Interleave Reads and Writes
+	def __transaction(self):
+		return SQLiteTransaction(self.connection)
+
+
+
+# Context Manager for SQLiteCoordinator Transactions. Any sqlite3 Error is Raised as a CoordinatorError
+class SQLiteTransaction():
+
+	def __init__(self, connection):
+		self.connection = connection
+
+	def __enter__(self):
+		try:
+			self.connection.execute("BEGIN IMMEDIATE")
+		except sqlite3.Error as err:
+			raise CoordinatorError(err)
+
+	def __exit__(self, exc_type, exc, tb):
+		try:
+			self.connection.execute("COMMIT" if exc_type == None else "ROLLBACK")
+		except sqlite3.Error as err:
+			raise CoordinatorError(err)
+
+		if isinstance(exc, sqlite3.Error):
+			raise CoordinatorError(exc)
+
+
+
+# Coordinators That Can be Chosen With the "Coordinator" Setting
+COORDINATORS = {
+	"SQLite" : SQLiteCoordinator
+}
@@ -1,5 +1,8 @@
 from Exceptions import ConfigFileError
 from Validate import is_alert_specific
+from Tracing import Tracing
+from Metrics import Metrics
+import threading
 import asyncio
 import json
 import os
@@ -10,95 +13,266 @@ class Config():
 
 	enabled_modules = []
 	file_lock = asyncio.Lock()
+	journal_lock = threading.Lock() # Keeps Journal Appends (on the Event Loop) From Landing in a Journal That's Being Replaced (in a Worker Thread)
+	filename = os.path.join(os.path.dirname(__file__), 'config.json')
+
+	FLUSH_DELAY = 5 # Seconds to Collect Changes Before Rewriting config.json
+
+	pending = []      # Changes Made Since config.json Was Last Written. Also Stored in the Journal File
+	flush_task = None
+	last_saved = None # Modification Time of Our Own Last Write, so the Reloader Can Ignore It
+	last_read = None  # Modification Time of the Last config.json We Parsed
+	forward = None    # In a Shard Worker, Changes are Passed Here Instead of Being Written. The Main Process Records Them
 
 
 	# Loads the config file and stores it in a dictionary
+	# Changes Left in the Journal by a Previous Session are Replayed on Top of It
 	# Post-Condition: Config File Has Been Loaded into Config.config_file if No Syntax Errors Have Been Found
 	async def load():
 
-		await Config.file_lock.acquire()
-		try:
-			# Generate filepath
-			dirname = os.path.dirname(__file__)
-			Config.filename = os.path.join(dirname, 'config.json')
+		async with Config.file_lock:
+			try:
+				# Open the file and save it
+				Config.last_read = Config.__mtime()
+				with open(Config.filename, 'r') as file:
+					Config.config_file = json.load(file)
 
-			# Open the file and save it
-			file = open(Config.filename, 'r')
-			Config.config_file = json.load(file)
+				# Replay Unsaved Changes
+				Config.pending = Config.__read_journal()
+				for entry in Config.pending:
+					Config.__apply(Config.config_file, entry)
 
-			file.close()
-			Config.file_lock.release()
+			# Handle Exceptions
+			except (KeyboardInterrupt, GeneratorExit):
+				raise
+			except BaseException as err:
+				raise ConfigFileError(err)
 
-		# Handle Exceptions
-		except (KeyboardInterrupt, GeneratorExit):
-			raise
-		except BaseException as err:
-			raise ConfigFileError(err)
+		# Write Replayed Changes Back Into config.json
+		if len(Config.pending):
+			Config.__schedule_flush()
 
 
 
-	# Dumps the Contents of Config.config_file Back into the Original Config File
-	# Pre-Condition: Config.config_file Contains the Updated Contents of config.json
-	# Post-Condition: The Contents of Config.config_file Have Been Saved in config.json
+	# Writes Pending Changes Into config.json
+	# The Changes are Applied to the File on Disk Instead of Config.config_file, so Hand Edits the Reloader Hasn't Picked Up
+	# (or Rejected) are Kept. If the File Can't be Parsed, Nothing is Written and the Changes Stay in the Journal
+	# The File is Written in a Worker Thread and Swapped In With an Atomic Rename, so a Crash Never Leaves a Half-Written config.json
+	# Post-Condition: The Pending Changes Have Been Saved in config.json and the Journal Only Holds Newer Changes
 	async def save():
 
-		# Try to dump the updated config_file into the config.json
-		await Config.file_lock.acquire()
-		try:
-			file = open(Config.filename, "w")
-			json.dump(Config.config_file, file, indent='\t', separators=(',',' : '))
+		async with Config.file_lock:
+			try:
+				# A File We Haven't Parsed Has Hand Edits, so the Reloader Still Needs to See Our Write
+				edited = Config.__mtime() not in (Config.last_saved, Config.last_read)
+				config = await asyncio.get_running_loop().run_in_executor(None, Config.__read_file, Config.filename)
+
+				# Snapshot the Changes on the Event Loop so Later Ones Can't Tear It
+				saved = len(Config.pending)
+				for entry in Config.pending:
+					Config.__apply(config, entry)
+				text = json.dumps(config, indent='\t', separators=(',',' : '))
+
+				await asyncio.get_running_loop().run_in_executor(None, Config.__write_atomic, Config.filename, text)
+				if not edited:
+					Config.last_saved = Config.__mtime()
+				Metrics.inc("fta_config_writes_total", (("file", "config"),))
+
+				# Changes Made While We Were Writing Stay in the Journal
+				Config.pending = Config.pending[saved:]
+				await asyncio.get_running_loop().run_in_executor(None, Config.__rewrite_journal)
+				Metrics.inc("fta_config_writes_total", (("file", "journal"),))
+
+				# Flush the Changes That Came in While We Were Writing
+				if len(Config.pending):
+					Config.__schedule_flush()
+
+			# Handle Exceptions
+			except (KeyboardInterrupt, GeneratorExit):
+				raise
+			except BaseException as err:
+				raise ConfigFileError(err)
+
+
+
+	# Reads config.json Again Without Touching Config.config_file
+	# Unsaved Changes are Applied on Top, so They Aren't Lost if the User Edited the File Before We Flushed
+	# Post-Condition: The Current Contents of config.json Have Been Returned or a ConfigFileError Was Raised
+	async def read():
+
+		async with Config.file_lock:
+			try:
+				Config.last_read = Config.__mtime()
+				config = await asyncio.get_running_loop().run_in_executor(None, Config.__read_file, Config.filename)
+				for entry in Config.pending:
+					Config.__apply(config, entry)
+				return config
+
+			# Handle Exceptions
+			except (KeyboardInterrupt, GeneratorExit):
+				raise
+			except BaseException as err:
+				raise ConfigFileError(err)
+
+
+
+	# Writes Any Pending Changes Immediately
+	# Post-Condition: config.json is Up to Date
+	async def flush():
+		if Config.flush_task != None and not Config.flush_task.done():
+			Config.flush_task.cancel()
+		Config.flush_task = None
+
+		if len(Config.pending):
+			await Config.save()
+
+
+
+	# Used By Streamer.py to Alter a Streamer's Ban Status in the Config File
+	async def update_ban_status(streamer, status):
+		Config.__record(["ban", streamer, status])
+
+
+
+	# Used By Streamer.rename() to Update Streamer Usernames that May Have Changed
+	# Post-Condition: The Streamer's Entry in the Streamer Dictionary has Been Updated Without Changing the Order
+	async def update_username(old_name, new_name):
+		Config.__record(["rename", old_name, new_name])
+
+
+
+	# Applies a Change in Memory, Appends It to the Journal, and Schedules a Flush
+	# Post-Condition: The Change Will Survive a Crash Even Though config.json Hasn't Been Rewritten Yet
+	def __record(entry):
+		Config.__apply(Config.config_file, entry)
+		if Config.forward != None:
+			return Config.forward(entry)
 
-			file.close()
-			Config.file_lock.release()
+		Config.pending.append(entry)
 
-		# Handle Exceptions
+		try:
+			with Tracing.span("Journal Append"), Config.journal_lock, open(Config.journal_name(), 'a') as file:
+				file.write(json.dumps(entry) + "\n")
+			Metrics.inc("fta_config_writes_total", (("file", "journal"),))
 		except (KeyboardInterrupt, GeneratorExit):
 			raise
 		except BaseException as err:
 			raise ConfigFileError(err)
 
+		Config.__schedule_flush()
 
 
-	# Used By Streamer.py to Alter a Streamer's Ban Status in the Config File
-	async def update_ban_status(streamer, status):
 
-		# Reload the config file before altering it
-		await Config.load()
+	# Applies a Single Journal Entry to a Config Dictionary
+	# Entries are Idempotent, so Replaying One That Was Already Saved is Harmless
+	def __apply(config, entry):
+		streamers = config["Streamers"]
 
-		# Update the Config JSON
-		if streamer in Config.config_file["Streamers"]:
-			Config.config_file["Streamers"][streamer]["Ban Status"] = status
+		if entry[0] == "ban":
+			if entry[1] in streamers:
+				streamers[entry[1]]["Ban Status"] = entry[2]
 
-		# Save the JSON
-		await Config.save()
+		# Rebuild the Dict. so the Renamed Streamer Keeps Its Position
+		elif entry[0] == "rename":
+			if entry[1] in streamers and entry[2] not in streamers:
+				config["Streamers"] = dict([((entry[2] if name == entry[1] else name), streamers[name]) for name in streamers])
 
 
 
-	# Used By TwitchAPI.__check_username() to Update Streamer Usernames that May Have Changed
-	# Post-Condition: The Streamer's Entry in the Streamer Dictionary has Been Updated Without Changing the Order
-	async def update_username(old_name, new_name):
+	# Starts a Delayed Flush Unless One is Already Waiting
+	# A Flush That's Already Saving Doesn't Count, Since It Won't Pick Up Anything New
+	def __schedule_flush():
+		if Config.flush_task == None or Config.flush_task.done() or Config.flush_task is asyncio.current_task():
+			Config.flush_task = asyncio.get_running_loop().create_task(Config.__delayed_flush())
+
+
+
+	# Waits for More Changes to Pile Up, Then Saves Them All at Once
+	# Failures are Logged and Retried Later Since the Changes are Still in the Journal
+	async def __delayed_flush():
+		await asyncio.sleep(Config.FLUSH_DELAY)
+
+		try:
+			await Config.save()
+		except ConfigFileError as err:
+			from Logger import Log
+			if Log.logger != None:
+				Log.logger.warning("Failed to Save config.json. Retrying in " + str(Config.FLUSH_DELAY) + "s.\nDetails:\n" + str(err))
+			Config.flush_task = None
+			Config.__schedule_flush()
+
+
+
+	# The Journal Lives Next to the Config File
+	def journal_name():
+		return Config.filename + ".journal"
+
+
+
+	# Reads Every Complete Entry in the Journal
+	# A Torn Final Line (From a Crash Mid-Write) is Ignored
+	def __read_journal():
+		if not os.path.exists(Config.journal_name()):
+			return []
+
+		entries = []
+		with open(Config.journal_name(), 'r') as file:
+			for line in file:
+				try:
+					entries.append(json.loads(line))
+				except ValueError:
+					break
+		return entries
+
+
+
+	# Returns config.json's Modification Time, or None if It's Missing
+	def __mtime():
+		try:
+			return os.stat(Config.filename).st_mtime_ns
+		except OSError:
+			return None
+
+
+
+	# Parses a JSON File. Runs in a Worker Thread
+	def __read_file(path):
+		with open(path, 'r') as file:
+			return json.load(file)
+
+
+
+	# Writes a File to a Temporary Path, Then Renames It Over the Original
+	# Runs in a Worker Thread
+	def __write_atomic(path, text):
+		temp = path + ".tmp"
+		with open(temp, 'w') as file:
+			file.write(text)
+			file.flush()
+			os.fsync(file.fileno())
+		os.replace(temp, path)
 
-		# Reload the config file before altering it
-		await Config.load()
 
-		# Separate Key/Value Pairs into Lists
-		keys = list(Config.config_file["Streamers"].keys())
-		vals = list(Config.config_file["Streamers"].values())
 
-		# Replace the Old Key With the New One
-		if old_name in keys:
-			keys[ keys.index(old_name) ] = new_name
+	# Replaces the Journal With the Changes That Still Aren't in config.json. Runs in a Worker Thread
+	# Changes Recorded While the New Journal is Being Written Would be Lost in the Rename, so It's Written Again Until None Came In
+	def __rewrite_journal():
+		path = Config.journal_name()
+		temp = path + ".tmp"
 
-		# Create a New Dict. From the Key/Value Lists
-		temp_dict = {}
-		for index, name in enumerate(keys):
-			temp_dict[name] = vals[index]
+		while True:
+			pending = Config.pending
+			count = len(pending)
 
-		# Replace Old Dictionary With New One
-		Config.config_file["Streamers"] = temp_dict
+			with open(temp, 'w') as file:
+				file.write("".join([json.dumps(entry) + "\n" for entry in pending[:count]]))
+				file.flush()
+				os.fsync(file.fileno())
 
-		# Save the JSON
-		await Config.save()
+			with Config.journal_lock:
+				if pending is Config.pending and len(pending) == count:
+					os.replace(temp, path)
+					return
 
 
 
@@ -0,0 +1,301 @@
+from TwitchAPI import TwitchAPI
+from Exceptions import *
+from Logger import Log
+import aiohttp
+import asyncio
+import json
+import time
+
+
+# A Class for Receiving Stream Events Through Twitch's EventSub WebSocket Transport
+# While Every Streamer is Covered by Subscriptions, Polling Drops to the Reconciliation Rate
+class EventSub():
+
+	DEFAULT_URL = "wss://eventsub.wss.twitch.tv/ws"
+	SUBSCRIPTION_TYPES = (("stream.online", "1"), ("stream.offline", "1"), ("channel.update", "2"))
+	MAX_SUBSCRIPTIONS = 300 # Twitch's Limit for a Single WebSocket Connection
+	KEEPALIVE_GRACE = 5     # Extra Seconds to Wait for a Message Before Assuming the Connection is Dead
+	SEEN_MESSAGES = 1000    # Number of Message ID's to Remember for Deduplication
+
+	enabled = False
+	active = asyncio.Event()
+	task = None
+	update_task = None
+
+
+	# Initialize the Module
+	# Pre-Condition: The Config File Has Been Loaded and Validated, and TwitchAPI Has Been Initialized
+	def init(config):
+
+		# EventSub is Only Enabled if the User Gives Us a User Access Token
+		EventSub.enabled = "EventSub Token" in config["Twitch Settings"]
+		if not EventSub.enabled:
+			return
+
+		# Load Constants
+		EventSub.TOKEN = config["Twitch Settings"]["EventSub Token"]
+		EventSub.URL = config["Twitch Settings"].get("EventSub URL", EventSub.DEFAULT_URL)
+		EventSub.RECONCILIATION_RATE = float(config["Twitch Settings"].get("Reconciliation Rate", 0.1))
+
+		# Session State
+		EventSub.session_id = None
+		EventSub.streamers = {}
+		EventSub.subscriptions = {}
+		EventSub.seen = {}
+		EventSub.total_cost = 0
+		EventSub.max_total_cost = None
+		EventSub.coverage = None # (Covered, Total) Streamers Last Reported, so Partial Coverage is Only Logged When It Changes
+
+		# Start requests session
+		client_timeout = aiohttp.ClientTimeout(total=10)
+		EventSub.requests = aiohttp.ClientSession(timeout=client_timeout)
+
+
+
+	# Starts the Background Task That Maintains the WebSocket Connection
+	# Pre-Condition: The Streamer Dictionary Has Been Populated
+	def start(streamer_dict):
+		if not EventSub.enabled:
+			return
+
+		EventSub.streamers = streamer_dict # Already Keyed by User ID
+		EventSub.task = asyncio.get_event_loop().create_task(EventSub.run())
+
+
+
+	# Cancels the Background Task and Closes the Requests Session
+	async def stop():
+		EventSub.active.clear()
+
+		for task in (EventSub.task, EventSub.update_task):
+			if task != None and not task.done():
+				task.cancel()
+				await asyncio.gather(task, return_exceptions=True)
+
+		if hasattr(EventSub, 'requests'):
+			await EventSub.requests.close()
+
+
+
+	# Brings Subscriptions in Line With the Streamer Dict. After Streamers Were Added or Removed
+	# Subscriptions for Removed Streamers are Left Alone. Their Events are Simply Ignored
+	def update():
+		if not EventSub.enabled or EventSub.session_id == None:
+			return
+
+		EventSub.__update_coverage()
+		if EventSub.update_task == None or EventSub.update_task.done():
+			EventSub.update_task = asyncio.get_event_loop().create_task(EventSub.__update_helper())
+
+
+
+	# Subscribes to the New Streamers. Failures Leave Them Polling-Only Until the Next Reconnect
+	async def __update_helper():
+		try:
+			await EventSub.__subscribe_missing()
+		except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+			raise
+		except BaseException as err:
+			Log.logger.warning("Failed to Subscribe to New Streamers Over EventSub.\nDetails:\n" + Error.exception_str(err))
+
+
+
+	# Keeps a WebSocket Session Open, Reconnecting After Every Failure
+	# Errors Here Are Never Fatal Since Polling Keeps Running Without Us
+	async def run():
+		while True:
+			try:
+				await EventSub.__session(EventSub.URL)
+				Log.logger.info("EventSub Connection Closed by Twitch. Reconnecting...")
+
+			except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+				raise
+			except BaseException as err:
+				Log.logger.warning("EventSub Connection Failed. Polling at the Full Refresh Rate Until It Recovers.\nDetails:\n" + Error.exception_str(err))
+
+			EventSub.active.clear()
+			EventSub.session_id = None
+			await asyncio.sleep(TwitchAPI.RECONNECT_COOLDOWN)
+
+
+
+	# Opens a Session, Subscribes to Every Streamer, and Handles Messages Until the Connection Drops
+	async def __session(url):
+		ws = await EventSub.requests.ws_connect(url)
+
+		try:
+			# Twitch Sends a Welcome Message Immediately After Connecting
+			keepalive = EventSub.__welcome(await EventSub.__receive(ws, 10))
+			await EventSub.__subscribe_all()
+
+			while True:
+				message = await EventSub.__receive(ws, keepalive + EventSub.KEEPALIVE_GRACE)
+				message_type = message["metadata"]["message_type"]
+
+				# Ignore Messages We've Already Handled
+				message_id = message["metadata"].get("message_id")
+				if message_id in EventSub.seen:
+					continue
+				EventSub.seen[message_id] = True
+				if len(EventSub.seen) > EventSub.SEEN_MESSAGES:
+					del EventSub.seen[next(iter(EventSub.seen))]
+
+				if message_type == "notification":
+					EventSub.__notify(message["payload"])
+
+				# Move to the New Connection Before Closing the Old One. Subscriptions Carry Over
+				elif message_type == "session_reconnect":
+					new_ws = await EventSub.requests.ws_connect(message["payload"]["session"]["reconnect_url"])
+					try:
+						keepalive = EventSub.__welcome(await EventSub.__receive(new_ws, 10))
+					except:
+						await new_ws.close()
+						raise
+
+					await ws.close()
+					ws = new_ws
+
+				# Twitch Revoked a Subscription, So That Streamer is Polling-Only Now
+				elif message_type == "revocation":
+					subscription = message["payload"]["subscription"]
+					EventSub.subscriptions.pop(subscription["id"], None)
+					EventSub.__update_coverage()
+					Log.logger.warning("EventSub Subscription Revoked (" + subscription["type"] + ", Status=" + str(subscription.get("status")) + ")")
+
+				# Keepalives Only Exist to Reset the Receive Timeout
+		finally:
+			await ws.close()
+
+
+
+	# Waits for the Next Message. Raises an Error if the Connection Closes or Stays Silent Too Long
+	async def __receive(ws, timeout):
+		message = await ws.receive(timeout=timeout)
+
+		if message.type != aiohttp.WSMsgType.TEXT:
+			raise RequestsError(ConnectionError("EventSub WebSocket Closed (Type=" + str(message.type) + ", Code=" + str(ws.close_code) + ")"))
+		return json.loads(message.data)
+
+
+
+	# Reads a Welcome Message and Returns the Keepalive Timeout
+	def __welcome(message):
+		if message["metadata"]["message_type"] != "session_welcome":
+			raise RequestsError(ValueError("Expected session_welcome, Got " + str(message["metadata"]["message_type"])))
+
+		EventSub.session_id = message["payload"]["session"]["id"]
+		return float(message["payload"]["session"]["keepalive_timeout_seconds"] or 10)
+
+
+
+	# Creates Subscriptions for Every Streamer Until We Hit a Cost or Connection Limit
+	# Live/Offline Subscriptions Come First Since They Matter Most for Alert Latency
+	async def __subscribe_all():
+		EventSub.subscriptions = {}
+		EventSub.total_cost = 0
+
+		await EventSub.__subscribe_missing()
+
+
+
+	# Creates Every Subscription We Don't Have Yet, Until We Hit a Cost or Connection Limit
+	async def __subscribe_missing():
+		existing = set(EventSub.subscriptions.values())
+
+		for sub_type, version in EventSub.SUBSCRIPTION_TYPES:
+			for user_id in list(EventSub.streamers):
+				if (sub_type, user_id) in existing:
+					continue
+
+				# Stop Once We've Hit Either Limit
+				if len(EventSub.subscriptions) >= EventSub.MAX_SUBSCRIPTIONS or (EventSub.max_total_cost != None and EventSub.total_cost >= EventSub.max_total_cost):
+					EventSub.__update_coverage()
+					return
+
+				if not await EventSub.__subscribe(sub_type, version, user_id):
+					EventSub.__update_coverage()
+					return
+
+		EventSub.__update_coverage()
+
+
+
+	# Creates a Single Subscription
+	# Returns False if Twitch Won't Let Us Create Any More. Other Failures are Raised as a RequestsError
+	async def __subscribe(sub_type, version, user_id):
+		headers = {
+			'Client-ID' : TwitchAPI.CLIENT_ID,
+			'Authorization' : 'Bearer ' + EventSub.TOKEN
+		}
+		body = {
+			"type" : sub_type,
+			"version" : version,
+			"condition" : {"broadcaster_user_id" : user_id},
+			"transport" : {"method" : "websocket", "session_id" : EventSub.session_id}
+		}
+
+		while True:
+			try:
+				response = await EventSub.requests.post(TwitchAPI.API_URL + "eventsub/subscriptions", json=body, headers=headers)
+			except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+				raise
+			except BaseException as err:
+				raise RequestsError(err)
+
+			# Wait Out Helix Rate Limits and Try Again
+			if response.status == 429 and response.headers.get("Ratelimit-Remaining") == "0":
+				await asyncio.sleep(max(0, float(response.headers.get("Ratelimit-Reset", time.time() + 1)) - time.time()))
+				continue
+			break
+
+		# Subscription Already Exists
+		if response.status == 409:
+			return True
+
+		if response.status // 100 != 2:
+			text = str(await response.text())
+
+			# Any Other 429, or a 403 About the Cost, Means We've Hit the Cost or Subscription Limit
+			if response.status == 429 or (response.status == 403 and "cost" in text.lower()):
+				Log.logger.warning("EventSub Subscription Limit Reached (Status Code: " + str(response.status) + "): " + text)
+				return False
+
+			# Anything Else (a Rejected Token, a Closed Session, a Bad Request) is a Real Failure
+			# It Ends the Session, and run() Tries Again After the Reconnect Cooldown
+			raise RequestsError(ConnectionError("Failed to Create EventSub Subscription (" + sub_type + " for " + user_id + ", Status Code: " + str(response.status) + "): " + text))
+
+		resp_json = await response.json_safe()
+		EventSub.subscriptions[resp_json["data"][0]["id"]] = (sub_type, user_id)
+		EventSub.total_cost = resp_json.get("total_cost", EventSub.total_cost)
+		EventSub.max_total_cost = resp_json.get("max_total_cost", EventSub.max_total_cost)
+		return True
+
+
+
+	# Lowers the Polling Rate Only if Every Streamer Has Every Subscription Type
+	def __update_coverage():
+		counts = {}
+		for sub_type, user_id in EventSub.subscriptions.values():
+			counts[user_id] = counts.get(user_id, 0) + 1
+
+		covered = len([user_id for user_id in EventSub.streamers if counts.get(user_id, 0) == len(EventSub.SUBSCRIPTION_TYPES)])
+		coverage = (covered, len(EventSub.streamers))
+		if covered == len(EventSub.streamers):
+			if not EventSub.active.is_set():
+				Log.logger.info("EventSub Connected. Polling at the Reconciliation Rate")
+			EventSub.active.set()
+		else:
+			if coverage != EventSub.coverage:
+				Log.logger.warning("EventSub Covers " + str(covered) + "/" + str(len(EventSub.streamers)) + " Streamers. Polling at the Full Refresh Rate")
+			EventSub.active.clear()
+		EventSub.coverage = coverage
+
+
+
+	# Hands a Notification to the Streamer It Belongs To
+	def __notify(payload):
+		event = payload["event"]
+		streamer = EventSub.streamers.get(event["broadcaster_user_id"])
+
+		if streamer != None:
+			streamer.push_event(payload["subscription"]["type"], event, time.time())
@@ -69,4 +69,16 @@ class ConfigFileError(Error):
 # Error for Missing or Incorrect Config Fields
 class ConfigFormatError(Error):
 	def __init__(self, details):
-		self.details = details
\ No newline at end of file
+		self.details = details
+
+# *** Outbox Errors ***
+# Called When the Alert Outbox Can't be Opened, Read, or Written
+class OutboxError(Error):
+	def __init__(self, exception):
+		self.details = Error.exception_str(exception)
+
+# *** Cluster Errors ***
+# Called When the Cluster Coordinator Can't be Opened, Read, or Written
+class CoordinatorError(Error):
+	def __init__(self, exception):
+		self.details = Error.exception_str(exception)
@@ -43,6 +43,7 @@ class Log():
 		if Config.config_file[Log.SETTINGS_KEY]["Log Level"].upper() in {"ALERT", "DEBUG"}:
 			
 			global_settings = Config.parse_preferences("GLOBAL", Log)
+			Notifications.check_templates(global_settings, Log.SETTINGS_KEY)
 			for msg in ALERT_TYPES:
 
 				text = Notifications.preference_resolver("Message Text", msg, global_settings)
@@ -56,9 +57,10 @@ class Log():
 
 
 	# Sets Up the Log File and Error Handler
+	# Pass 'handler' to Send Log Records Somewhere Other Than the Log File (Used by Shard Workers)
 	# Pre-condition: Log Level Has Been Set in Config File
 	# Post-condition: Logger Has Been Created and A Log File Has Been Generated in logs/
-	def init(config=None):
+	def init(config=None, handler=None):
 
 		if Log.initialized.is_set():
 			return
@@ -68,18 +70,20 @@ class Log():
 			if config == None:
 				config = Config.config_file
 
-			# Set Log File Path
-			rel_path = str(config[Log.SETTINGS_KEY]["Log Filepath"]).replace("\\", os.sep).replace("/", os.sep)
-			logs_file = os.path.normpath( os.path.join(os.getcwd(), rel_path) )
+			if handler == None:
 
-			# Format Log File
-			temp_file = open(logs_file, 'a')
-			temp_file.write("\n" + '-'*64 + "\n\n")
-			temp_file.close()
+				# Set Log File Path
+				rel_path = str(config[Log.SETTINGS_KEY]["Log Filepath"]).replace("\\", os.sep).replace("/", os.sep)
+				logs_file = os.path.normpath( os.path.join(os.getcwd(), rel_path) )
 
-			# Create Error Handler
-			handler = logging.FileHandler(logs_file, 'a', 'utf-8')
-			handler.setFormatter(logging.Formatter('%(asctime)s (%(levelname)s) --> %(message)s', datefmt='%m-%d-%y %H:%M:%S'))
+				# Format Log File
+				temp_file = open(logs_file, 'a')
+				temp_file.write("\n" + '-'*64 + "\n\n")
+				temp_file.close()
+
+				# Create Error Handler
+				handler = logging.FileHandler(logs_file, 'a', 'utf-8')
+				handler.setFormatter(logging.Formatter('%(asctime)s (%(levelname)s) --> %(message)s', datefmt='%m-%d-%y %H:%M:%S'))
 
 			Log.logger = logging.getLogger("Log")
 			Log.logger.addHandler(handler)
@@ -126,6 +130,41 @@ class Log():
 
 
 
+	# Called By Notifications Module When an Alert Couldn't be Delivered
+	# These Errors are Logged Without Interrupting the Program. The Alert Stays in the Outbox and is Sent Again Later
+	async def delivery_failed(streamer_obj, message, module, exception):
+
+		if type(exception) == OutboxError:
+			Log.logger.warning("Couldn't Write to the Alert Outbox. Undelivered Alerts May Be Lost if the Program Stops.\nDetails:\n" + exception.details)
+			return
+
+		msg = module + " Gave Up Sending the '" + str(message) + "' Alert for " + streamer_obj.name + "."
+		if type(exception) == BadResponseCodeError:
+			msg += " Status Code: " + str(exception.status_code)
+			try:
+				msg += "\nRequest URL:\n" + str(exception.response.request_info.real_url).split("?")[0]
+				msg += "\nResponse:\n"    + str(await exception.response.text())
+			except: pass
+		else:
+			msg += " Error: " + str(exception.details).strip().split("\n")[-1]
+			Log.logger.debug("Delivery Error Details:\n" + str(exception.details))
+
+		Log.logger.warning(msg)
+
+
+
+	# Called By Notifications Module When a Live Alert Reached a Module Later Than the Live Alert SLO Allows
+	# 'stages' is a List of (Stage Name, Seconds) Pairs. The Slowest Stage is Named First
+	def slo_breach(streamer_obj, module, lag, stages):
+		stages = sorted(stages, key=lambda item: -item[1])
+		Log.logger.warning(
+			"The Live Alert for " + streamer_obj.name + " Reached " + module + " " + str(round(lag, 1)) + "s After the Stream Started" +
+			" (SLO: " + str(round(Notifications.LIVE_ALERT_SLO, 1)) + "s). Slowest Stage: " + stages[0][0].title() + " (" +
+			", ".join([name + " " + str(round(seconds, 1)) + "s" for name, seconds in stages]) + ")"
+		)
+
+
+
 	# Attempts to Reconnect to the Network by Recycling the get_token() Function
 	# Pre-condition: A Network-Related Exception has Been Triggered
 	# Post-condition: The Network Condition Has Been Reestablished or an Error Was Raised
@@ -215,6 +254,18 @@ class Log():
 			Log.logger.error("Problem With config.json:\n\n" + exception.details + "\n")
 			return True
 
+		# Outbox Errors
+		# Alerts are Still Sent When the Outbox Fails, They Just Aren't Replayed if the Program Stops First
+		elif type(exception) == OutboxError:
+			Log.logger.warning("Couldn't Write to the Alert Outbox. Undelivered Alerts May Be Lost if the Program Stops.\nDetails:\n" + exception.details)
+			return False
+
+		# Cluster Errors
+		# After Startup the Heartbeat Handles These Itself, so This Only Happens When a Node Can't Join
+		elif type(exception) == CoordinatorError:
+			Log.logger.error("Couldn't Reach the Cluster Coordinator.\nDetails:\n" + exception.details)
+			return True
+
 		# Catch-All
 		else:
 			Log.logger.exception("Unrecognized Exception:\n")
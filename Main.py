@@ -1,5 +1,13 @@
 from Notifications import Notifications
 from TwitchAPI import TwitchAPI
+from EventSub import EventSub
+from Planner import Planner
+from Reloader import Reloader
+from Tracing import Tracing
+from Metrics import Metrics
+from Outbox import Outbox
+from Shards import Shards
+from Cluster import Cluster
 from Streamer import Streamer
 from Validate import validate
 from Config import Config
@@ -16,10 +24,13 @@ Config.enabled_modules = [Pushover, Discord]
 
 
 streamer_dict = {}
-refresh_rate = 1
 initialized = asyncio.Event()
 terminate = asyncio.Event()
 
+# Metric Labels for the Two Polling Loops
+STREAMS_LABELS = (("loop", "streams"),)
+CHANNELS_LABELS = (("loop", "channels"),)
+
 
 
 # Runs Once to Initialize Modules and Builds Streamer Dict.
@@ -27,7 +38,6 @@ terminate = asyncio.Event()
 # Post-Condition: All Modules Have Been Initialized and the Streamer Dictionary has Been Populated
 async def init():
 	global streamer_dict
-	global refresh_rate
 
 	# Load and Validate The Config File
 	await Config.load()
@@ -40,13 +50,15 @@ async def init():
 			ret = await to_async(module.validate)()
 			if type(ret) == list: validation_warnings += ret
 
-	# Fetch Refresh Rate
-	refresh_rate = float(Config.config_file["Twitch Settings"]["Refresh Rate"])
-
 	# Initialize Modules
 	Log.init(Config.config_file)
 	TwitchAPI.init(Config.config_file)
+	EventSub.init(Config.config_file)
 	Notifications.init(Config.config_file)
+	Planner.init(Config.config_file)
+	Tracing.init(Config.config_file)
+	Shards.init(Config.config_file)
+	Cluster.init(Config.config_file)
 
 	# Display Any Warnings that Arose During the Config Validation Process
 	# We Had to Wait for Logs to Initialize Before Showing These
@@ -54,23 +66,50 @@ async def init():
 		Log.logger.warning(warning)
 
 	# Initialize the Dictionary of Streamers
-	streamer_dict = await Streamer.init_all(Config.config_file)
+	# In Shard Mode the Shards Request Their Streamers' State, so None is Requested Here
+	# In Cluster Mode Every Streamer Gets an Object for Alerts, but Only the Ones This Node Owns are Requested and Polled
+	all_streamers = await Streamer.init_all(Config.config_file, poll=not (Shards.enabled() or Cluster.enabled))
+	streamer_dict = await Cluster.join(all_streamers) if Cluster.enabled else all_streamers
+
+	# Choose Refresh Rates That Fit the Watchlist
+	# Shards Make Their Own Plans
+	if not Shards.enabled():
+		Planner.plan()
 
 	# >>> INITIALIZE PLUGINS <<<
 	for module in Config.enabled_modules:
 		if hasattr(module, "init"):
-			await to_async(module.init)(streamer_dict)
+			await to_async(module.init)(all_streamers)
 
 	# >>> SET PLUGIN ALERT CALLBACK <<<
-	Notifications.alert_callbacks = [Log.alert]
+	Notifications.alert_callbacks = {"Logger" : Log.alert}
 	for module in Config.enabled_modules:
 		if hasattr(module, "alert"):
-			Notifications.alert_callbacks.append(to_async(module.alert))
+			Notifications.alert_callbacks[module.__name__] = to_async(module.alert)
+	Notifications.failure_callback = Log.delivery_failed
+	Notifications.breach_callback = Log.slo_breach
 	
 	# Start the Notification Handler
 	# Any Alerts that Arose During Initialization Will Now Be Sent
-	Notifications.Handler.streamer_dict = streamer_dict
+	Notifications.Handler.streamer_dict = all_streamers
 	Notifications.Handler.ready.set()
+
+	# Start Listening for Pushed Events (if Enabled), or Start the Shards, Which Do Their Own Polling and Listening
+	if Shards.enabled():
+		Shards.start(streamer_dict)
+	else:
+		EventSub.start(streamer_dict)
+
+	# Keep Sending Heartbeats and Moving Streamers as Nodes Join and Leave
+	if Cluster.enabled:
+		Cluster.start()
+
+	# Apply Edits to config.json Without Restarting
+	Reloader.start(all_streamers)
+
+	# Serve Metrics (if Enabled)
+	Metrics.collect("Streamer", lambda: Streamer.metrics(streamer_dict))
+	await Metrics.start(Config.config_file)
 	
 	# Set 'Initialized' Event
 	initialized.set()
@@ -79,9 +118,33 @@ async def init():
 
 
 # Loop to Pull Data and Send Alerts
+# Runs the Fast /streams Loop and the Slow /channels Loop Side by Side
 # Pre-condition: init() has Executed Successfully
 # Post-Condition: Loop has Terminated Due to an Error/Interrupt
 async def poll():
+
+	# Resend Alerts Left Over From the Last Session or From the Error We Just Recovered From
+	replayed, expired = await Notifications.Handler.replay()
+	if replayed or expired:
+		Log.logger.info("Resending " + str(replayed) + " Undelivered Alert(s) From the Outbox" + (". Dropped " + str(expired) + " Older Than the Outbox Max Age" if expired else ""))
+
+	if Shards.enabled():
+		loops = [asyncio.ensure_future(poll_shards())]
+	else:
+		loops = [asyncio.ensure_future(poll_streams()), asyncio.ensure_future(poll_channels())]
+
+	# If Either Loop Fails, Stop the Other One Before Passing the Error On
+	try:
+		await asyncio.gather(*loops)
+	finally:
+		for loop in loops:
+			loop.cancel()
+		await asyncio.gather(*loops, return_exceptions=True)
+
+
+
+# Fast Loop That Drives Live/Offline Alerts
+async def poll_streams():
 	global streamer_dict
 
 	# Continuously Update Streamer Data
@@ -90,15 +153,56 @@ async def poll():
 		# Start a Timer
 		start = time.time()
 
-		# Checks Errors that Arose While Sending Notifications
+		with Tracing.cycle("Stream Cycle", 1.0 / Planner.stream_rate):
+
+			# Checks Errors that Arose While Sending Notifications
+			Notifications.Handler.check_tasks()
+
+			# Get New Info on Streamers
+			await Streamer.refresh_streams(streamer_dict)
+
+		await pace(start, Planner.stream_rate, STREAMS_LABELS)
+
+
+
+# Slow Loop That Drives Title, Game and Ban Alerts
+async def poll_channels():
+	global streamer_dict
+
+	while True:
+		start = time.time()
+		with Tracing.cycle("Channel Cycle", 1.0 / Planner.channel_rate):
+			await Streamer.refresh_channels(streamer_dict)
+		await pace(start, Planner.channel_rate, CHANNELS_LABELS)
+
+
+
+# Used Instead of the Polling Loops in Shard Mode, Where the Shards Do the Polling
+# Raises Errors From Sending Alerts and From Handling Shard Messages
+async def poll_shards():
+	while True:
 		Notifications.Handler.check_tasks()
+		Shards.check_tasks()
+		await asyncio.sleep(1)
+
+
 
-		# Get New Info on Streamers
-		await Streamer.refresh_all(streamer_dict)
+# Sleeps Until a Loop Running at 'rate' Cycles Per Second Should Start Its Next Cycle
+# The Cycle's Duration is Recorded Under 'labels', and Cycles That Took Too Long are Counted as Overruns
+async def pace(start, rate, labels=()):
+	elapsed = time.time() - start
+	Metrics.observe("fta_poll_cycle_seconds", elapsed, labels)
+	if elapsed > 1.0 / rate:
+		Metrics.inc("fta_poll_overruns_total", labels)
 
-		# Try to Maintain a Constant Refresh Rate
-		time_remaining = (start + 1.0 / refresh_rate) - time.time()
-		await asyncio.sleep( (time_remaining if time_remaining > 0 else 0) )
+	# Polling Only Reconciles State While EventSub Covers Every Streamer
+	# Keep Checking at the Normal Rate so We Resume Quickly if EventSub Drops
+	while EventSub.active.is_set() and time.time() < start + 1.0 / EventSub.RECONCILIATION_RATE:
+		await asyncio.sleep(1.0 / rate)
+
+	# Try to Maintain a Constant Refresh Rate
+	time_remaining = (start + 1.0 / rate) - time.time()
+	await asyncio.sleep( (time_remaining if time_remaining > 0 else 0) )
 
 
 
@@ -148,6 +252,15 @@ async def shutdown():
 
 	# Kill All Alert Tasks
 	await Notifications.Handler.stop()
+	await Shards.stop()
+	await Cluster.stop()
+	await EventSub.stop()
+	await Reloader.stop()
+	await Metrics.stop()
+
+	# Finish Writing the Outbox. Alerts That Weren't Delivered are Sent on the Next Start
+	try: await Outbox.close()
+	except: pass
 
 	# Kill ClientSession Objects
 	if hasattr(TwitchAPI, 'requests'):
@@ -156,6 +269,15 @@ async def shutdown():
 	if hasattr(Notifications, 'requests'):
 		await Notifications.requests.close()
 
+	# Finish Writing Traces
+	try: await Tracing.flush()
+	except: pass
+
+	# Save Config Changes That are Still Waiting to be Written
+	# They're Also in the Journal, so Failing Here Loses Nothing
+	try: await Config.flush()
+	except: pass
+
 	# >>> KILL PLUGINS <<<
 	for module in Config.enabled_modules:
 		if hasattr(module, 'terminate'):
@@ -0,0 +1,166 @@
+from Exceptions import ConfigFormatError
+from aiohttp import web
+import bisect
+
+
+# A Class for Exporting Runtime Metrics in the Prometheus Text Format
+# Recording a Sample is a Dictionary Lookup and an Addition, so Instrumentation Can Stay on at High Refresh Rates
+# Gauges Cost Nothing Between Scrapes. They're Computed by Collector Functions When the Endpoint is Read
+# Labels are Tuples of (Name, Value) Pairs, so Callers Can Reuse Them
+class Metrics():
+
+	SETTINGS_KEY = "Metrics Settings"
+	DEFAULT_HOST = "127.0.0.1"
+	DEFAULT_PORT = 9180
+
+	BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # Histogram Upper Bounds, in Seconds
+	LAG_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)     # Upper Bounds for Alert Lag, Which is Measured in Tens of Seconds
+
+	# Every Metric That Can be Exported: Name -> (Type, Help Text)
+	DESCRIPTIONS = {
+		"fta_poll_cycle_seconds"           : ("histogram", "Time spent on one cycle of a polling loop"),
+		"fta_poll_overruns_total"          : ("counter", "Polling cycles that took longer than the refresh rate allows"),
+		"fta_helix_request_seconds"        : ("histogram", "Helix request latency by endpoint and batch"),
+		"fta_helix_unchanged_batches_total": ("counter", "Helix batches skipped because their body matched the last cycle"),
+		"fta_twitch_token_refreshes_total" : ("counter", "OAuth token requests by result"),
+		"fta_helix_ratelimit_remaining"    : ("gauge", "Helix rate-limit points left for each credential"),
+		"fta_helix_throttling"             : ("gauge", "1 while a credential's requests are being slowed down to fit its rate limit"),
+		"fta_helix_throttle_waits_total"   : ("counter", "Helix requests that waited for rate-limit budget"),
+		"fta_helix_throttled_seconds_total": ("counter", "Time Helix requests spent waiting for rate-limit budget"),
+		"fta_helix_rate_limited_total"     : ("counter", "Helix requests retried after a 429"),
+		"fta_alert_queue_depth"            : ("gauge", "Alerts waiting for a worker"),
+		"fta_alert_workers_busy"           : ("gauge", "Alert workers currently sending"),
+		"fta_alert_send_seconds"           : ("histogram", "Time taken by each plugin to send an alert"),
+		"fta_alert_failures_total"         : ("counter", "Alerts a plugin gave up on"),
+		"fta_live_detection_lag_seconds"   : ("histogram", "Time from a stream starting to its live alert being created"),
+		"fta_live_alert_lag_seconds"       : ("histogram", "Time from a stream starting to each plugin sending its live alert"),
+		"fta_live_slo_breaches_total"      : ("counter", "Live alerts sent later than the SLO allows, by the stage that took longest"),
+		"fta_config_writes_total"          : ("counter", "Writes to config.json and its journal"),
+		"fta_streamers"                    : ("gauge", "Streamers being tracked, live, and banned"),
+		"fta_shards_ready"                 : ("gauge", "Shard processes that are polling"),
+		"fta_shard_restarts_total"         : ("counter", "Shard processes restarted after stopping unexpectedly"),
+		"fta_cluster_nodes"                : ("gauge", "Cluster nodes with a recent heartbeat"),
+		"fta_cluster_streamers"            : ("gauge", "Streamers this node polls, and ones it's waiting to take over"),
+		"fta_cluster_handoffs_total"       : ("counter", "Streamers taken over from or handed off to other nodes")
+	}
+
+	counters = dict([(name, {}) for name, (kind, _) in DESCRIPTIONS.items() if kind == "counter"])     # Name -> {Labels -> Value}
+	histograms = dict([(name, {}) for name, (kind, _) in DESCRIPTIONS.items() if kind == "histogram"]) # Name -> {Labels -> [Bucket Counts..., +Inf Count, Sum]}
+	bucket_bounds = {"fta_live_detection_lag_seconds" : LAG_BUCKETS, "fta_live_alert_lag_seconds" : LAG_BUCKETS} # Histograms That Don't Use BUCKETS
+	collectors = {} # Module Name -> Function Returning a List of (Name, Labels, Value) Gauge Samples
+
+	runner = None
+
+
+	# Starts the HTTP Endpoint if the Config File Has a Metrics Settings Section
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	# Post-Condition: GET /metrics is Being Served, or a ConfigFormatError Was Raised
+	async def start(config):
+		if Metrics.SETTINGS_KEY not in config or Metrics.runner != None:
+			return
+
+		host = config[Metrics.SETTINGS_KEY].get("Host", Metrics.DEFAULT_HOST)
+		port = config[Metrics.SETTINGS_KEY].get("Port", Metrics.DEFAULT_PORT)
+
+		app = web.Application()
+		app.router.add_get("/metrics", Metrics.__handle)
+
+		runner = web.AppRunner(app, access_log=None)
+		await runner.setup()
+		try:
+			await web.TCPSite(runner, host, port).start()
+		except OSError as err:
+			await runner.cleanup()
+			raise ConfigFormatError("Couldn't Start the Metrics Endpoint on " + str(host) + ":" + str(port) + " (" + str(err) + "). Change the Host or Port in " + Metrics.SETTINGS_KEY)
+
+		Metrics.runner = runner
+
+
+
+	# Stops the HTTP Endpoint
+	async def stop():
+		if Metrics.runner != None:
+			await Metrics.runner.cleanup()
+			Metrics.runner = None
+
+
+
+	# Adds to a Counter
+	def inc(name, labels=(), amount=1):
+		series = Metrics.counters[name]
+		series[labels] = series.get(labels, 0) + amount
+
+
+
+	# Records a Value in a Histogram
+	def observe(name, value, labels=()):
+		series = Metrics.histograms[name]
+		bounds = Metrics.bucket_bounds.get(name, Metrics.BUCKETS)
+		counts = series.get(labels)
+		if counts == None:
+			counts = series[labels] = [0] * (len(bounds) + 2)
+
+		counts[bisect.bisect_left(bounds, value)] += 1
+		counts[-1] += value
+
+
+
+	# Registers a Function That Returns Gauge Samples When the Endpoint is Scraped
+	# Registering Again Under the Same Name Replaces the Old Function
+	def collect(name, function):
+		Metrics.collectors[name] = function
+
+
+
+	# Returns Every Metric in the Prometheus Text Exposition Format
+	def render():
+		gauges = {}
+		for function in list(Metrics.collectors.values()):
+			for name, labels, value in function():
+				gauges.setdefault(name, []).append((labels, value))
+
+		lines = []
+		for name, (kind, description) in Metrics.DESCRIPTIONS.items():
+			lines.append("# HELP " + name + " " + description)
+			lines.append("# TYPE " + name + " " + kind)
+
+			if kind == "counter":
+				for labels, value in Metrics.counters[name].items():
+					lines.append(name + Metrics.__labels(labels) + " " + Metrics.__number(value))
+
+			elif kind == "gauge":
+				for labels, value in gauges.get(name, []):
+					lines.append(name + Metrics.__labels(labels) + " " + Metrics.__number(value))
+
+			else:
+				for labels, counts in Metrics.histograms[name].items():
+					total = 0
+					for bound, count in zip(Metrics.bucket_bounds.get(name, Metrics.BUCKETS) + ("+Inf",), counts):
+						total += count
+						lines.append(name + "_bucket" + Metrics.__labels(labels + (("le", str(bound)),)) + " " + str(total))
+					lines.append(name + "_sum" + Metrics.__labels(labels) + " " + Metrics.__number(counts[-1]))
+					lines.append(name + "_count" + Metrics.__labels(labels) + " " + str(total))
+
+		return "\n".join(lines) + "\n"
+
+
+
+	# Serves GET /metrics
+	async def __handle(request):
+		return web.Response(body=Metrics.render().encode(), headers={"Content-Type" : "text/plain; version=0.0.4; charset=utf-8"})
+
+
+
+	# Formats a Label Tuple, Escaping Backslashes, Quotes, and Newlines
+	def __labels(labels):
+		if not len(labels):
+			return ""
+		return "{" + ",".join([key + "=\"" + str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") + "\"" for key, value in labels]) + "}"
+
+
+
+	# Formats a Sample Value
+	def __number(value):
+		if type(value) == bool:
+			value = int(value)
+		return repr(value) if type(value) == float else str(value)
@@ -1,31 +1,66 @@
-from Validate import is_alert_specific
+from Validate import is_alert_specific, ALERT_TYPES
 from Exceptions import *
+from Metrics import Metrics
+from Outbox import Outbox
 import aiohttp
+import collections
 import asyncio
+import calendar
+import random
+import json
 import time
 
 
 # A Class for Constructing and Sending Notifications
 class Notifications():
 
-	alert_callbacks = [] # A List of Functions to Call When We Want to Send an Alert
+	alert_callbacks = {} # Functions to Call When We Want to Send an Alert, Keyed by Module Name
+	templates = {}       # Compiled Templates, Keyed by Template String
+	shared_tables = {}   # Resolved Preference Tables (and Their Rows), Keyed by Their JSON so Identical Ones are Stored Once
+	failure_callback = None # Called With (Streamer, Message, Module Name, Exception) When an Alert Can't be Delivered. Set by Main.py
+	breach_callback = None  # Called With (Streamer, Module Name, Lag, Stages) When a Live Alert Misses the SLO. Set by Main.py
+
+	RETRY_STATUSES = (408, 429) # Client Errors Worth Retrying. Server Errors are Always Retried
+	LIVE_COOLDOWN = 15          # Seconds Without a Live Response Before a Streamer Counts as Offline
 
 
 	# Initialize the Module
 	# Pre-Condition: The Config File Has Been Loaded and Validated
 	def init(config):
-		Notifications.LIVE_COOLDOWN = 15
+
+		# Load Delivery Limits
+		settings = config.get("Alert Settings", {})
+		Notifications.ALERT_WORKERS = int(settings.get("Alert Workers", 8))
+		Notifications.DESTINATION_CONCURRENCY = int(settings.get("Destination Concurrency", 4))
+		Notifications.destinations = {}
+
+		# Load the Retry Policy
+		Notifications.RETRY_ATTEMPTS = int(settings.get("Retry Attempts", 5))
+		Notifications.RETRY_BASE_DELAY = float(settings.get("Retry Base Delay", 1))
+		Notifications.RETRY_MAX_DELAY = float(settings.get("Retry Max Delay", 60))
+		Notifications.backoff = {}
+
+		# Load the Live Alert Target (Seconds From the Stream Starting to the Alert Being Sent)
+		Notifications.LIVE_ALERT_SLO = float(settings.get("Live Alert SLO", 60))
+
+		# Open the File That Keeps Alerts Until They're Delivered
+		Outbox.open(config)
 
 		# Start requests session
 		client_timeout = aiohttp.ClientTimeout(total=10)
 		Notifications.requests = aiohttp.ClientSession(timeout=client_timeout)
 
+		# Start the Workers That Deliver Queued Alerts
+		Notifications.Handler.start_workers(Notifications.ALERT_WORKERS)
+		Metrics.collect("Notifications", Notifications.Handler.metrics)
+
 
 
 	# General Function for Sending Pushover and Discord Alerts
+	# Status Codes in 'allowed_statuses' are Returned to the Caller Instead of Raising an Error
 	# Pre-Condition: A Message Payload Has Been Generated in the Pushover/Discord Modules
-	# Post-Condition: The Message Has Been Sent or An Error Occurred
-	async def send(coro):
+	# Post-Condition: The Message Has Been Sent and the Response Returned, or An Error Occurred
+	async def send(coro, allowed_statuses=()):
 		try: response = await coro
 		
 		except (KeyboardInterrupt, GeneratorExit):
@@ -33,27 +68,91 @@ class Notifications():
 		except BaseException as err:
 			raise RequestsError(err)		
 
-		if response.status // 100 != 2:
+		if response.status // 100 != 2 and response.status not in allowed_statuses:
 			raise BadResponseCodeError(response)
 
+		return response
+
+
+
+	# Sends a POST Request Through Notifications.send(), Limiting How Many Requests Can Be Open to the Same Destination at Once
+	# Destinations are Full URL's Without the Query String, so Each Discord Webhook Gets Its Own Limit
+	# Network Errors, Server Errors, and the Statuses in RETRY_STATUSES are Retried With Exponential Backoff
+	# While a Destination is Backing Off, Every Request to It Waits, but Other Destinations Aren't Affected
+	# Pre-Condition: A Message Payload Has Been Generated in a Plugin
+	# Post-Condition: The Message Has Been Sent and the Response Returned, or the Last Attempt's Error Was Raised
+	async def post(url, allowed_statuses=(), **kwargs):
+		destination = str(url).split("?")[0]
+		if destination not in Notifications.destinations:
+			Notifications.destinations[destination] = asyncio.Semaphore(Notifications.DESTINATION_CONCURRENCY)
+			Notifications.backoff[destination] = [0, 0] # Consecutive Failures, Time of the Next Attempt
+
+		backoff = Notifications.backoff[destination]
+		for attempt in range(1, Notifications.RETRY_ATTEMPTS + 1):
+
+			# Wait Out the Destination's Backoff
+			while time.time() < backoff[1]:
+				await asyncio.sleep(backoff[1] - time.time())
+
+			try:
+				async with Notifications.destinations[destination]:
+					response = await Notifications.send(Notifications.requests.post(url, **kwargs), allowed_statuses)
+
+			except RequestsError as err:
+				if attempt == Notifications.RETRY_ATTEMPTS:
+					raise
+				Notifications.__back_off(backoff)
+
+			except BadResponseCodeError as err:
+				if attempt == Notifications.RETRY_ATTEMPTS or not (err.status_code // 100 == 5 or err.status_code in Notifications.RETRY_STATUSES):
+					raise
+
+				try: retry_after = float(err.response.headers.get("Retry-After", 0))
+				except (AttributeError, ValueError): retry_after = 0
+				Notifications.__back_off(backoff, retry_after)
+
+			else:
+				backoff[0] = 0
+				return response
+
+
+
+	# Pushes a Destination's Next Attempt Back After a Failure
+	# The Delay Doubles With Each Consecutive Failure, Up to RETRY_MAX_DELAY, and is Randomly Shortened by Up to Half
+	# so Requests That Failed Together Don't All Retry at the Same Moment
+	def __back_off(backoff, minimum=0):
+		delay = min(Notifications.RETRY_MAX_DELAY, Notifications.RETRY_BASE_DELAY * 2 ** backoff[0])
+		delay *= random.uniform(0.5, 1)
+
+		backoff[0] += 1
+		backoff[1] = max(backoff[1], time.time() + max(delay, minimum))
+
 
 
 	# Parse Python Expressions Enclosed in Curly Braces
+	# Templates are Compiled Once and Cached, so Only the Expressions Themselves Run per Alert
 	# Post-Condition: The String Has Been Formatted or an Error Occurred
 	def special_format(format_string, **replace_vars):
+		return Notifications.compile_template(format_string)(replace_vars)
 
-		# Define Some Extra Local Variables
-		replace_vars['time'] = time.localtime()
-		replace_vars['nl'] = "\n"
-		replace_vars['tb'] = "\t"
-		replace_vars['dq'] = "\""
-		replace_vars["sq"] = "\'"
 
-		out_string = str(format_string)
+
+	# Splits a Template Into Literal Text and Compiled Expressions
+	# Returns a Function That Renders the Template Given a Dictionary of Variables
+	# Post-Condition: The Compiled Template Has Been Cached and Returned, or a SyntaxError Was Raised
+	def compile_template(format_string):
+		format_string = str(format_string)
+
+		if format_string in Notifications.templates:
+			return Notifications.templates[format_string]
+
+		parts = [] # Literal Strings, and Indexes Into 'codes' for Expressions
+		codes = [] # Each Distinct Expression is Compiled (and Evaluated) Once
+		seen = {}
 
 		start_index = 0
 		while 1:
-			
+
 			# Search for open brackets
 			open_index = format_string.find('{', start_index)
 			if open_index == -1:
@@ -62,15 +161,60 @@ class Notifications():
 			# Search for closed brackets
 			close_index = format_string.find('}', open_index)
 			if close_index == -1:
-				raise Exception
-			
-			# Evaluate the contents of the brackets and replace the brackets w/ the new string
-			eval_str = str(eval(format_string[open_index+1 : close_index], replace_vars))
-			out_string = out_string.replace( format_string[open_index : close_index+1], eval_str)
-			
-			start_index = close_index
+				raise SyntaxError("Unmatched '{' at Position " + str(open_index) + " in Template: " + format_string)
+
+			# Compile the contents of the brackets
+			expression = format_string[open_index+1 : close_index]
+			if expression not in seen:
+				seen[expression] = len(codes)
+				codes.append(compile(expression, "<template>", "eval"))
+
+			parts.append(format_string[start_index : open_index])
+			parts.append(seen[expression])
 
-		return out_string
+			start_index = close_index + 1
+
+		parts.append(format_string[start_index:])
+
+		# Templates Without Expressions Never Change
+		if not len(codes):
+			render = lambda replace_vars: format_string
+		else:
+			def render(replace_vars):
+
+				# Define Some Extra Local Variables
+				replace_vars['time'] = time.localtime()
+				replace_vars['nl'] = "\n"
+				replace_vars['tb'] = "\t"
+				replace_vars['dq'] = "\""
+				replace_vars["sq"] = "\'"
+
+				values = [str(eval(code, replace_vars)) for code in codes]
+				return "".join([(part if type(part) == str else values[part]) for part in parts])
+
+		Notifications.templates[format_string] = render
+		return render
+
+
+
+	# Compiles Every String in a Settings Dictionary (Including Lists and Nested Dictionaries Like Embeds)
+	# Used by Validators so Template Errors Show Up at Startup Instead of on the First Alert
+	# Post-Condition: Every Template Has Been Compiled and Cached, or a ConfigFormatError Was Raised
+	def check_templates(settings, location):
+		if type(settings) == str:
+			try:
+				Notifications.compile_template(settings)
+			except SyntaxError as err:
+				raise ConfigFormatError("Invalid Template in " + location + ": " + str(err))
+
+		elif type(settings) == dict:
+			for key in settings:
+				if key != "Alerts":
+					Notifications.check_templates(settings[key], location + "/" + str(key))
+
+		elif type(settings) == list:
+			for index, item in enumerate(settings):
+				Notifications.check_templates(item, location + "/" + str(index))
 
 
 
@@ -93,31 +237,172 @@ class Notifications():
 
 
 
+	# Resolves Every Setting in 'keys' for Every Alert Type Ahead of Time
+	# The Result Maps Alert Type -> {Setting -> Value}, so Plugins Only Need One Lookup per Alert
+	# Tables are Shared Between Streamers, so They Must Never be Modified
+	# Pass the Same 'cache' Dictionary for Every Streamer of a Plugin to Skip Streamers With Identical Settings
+	# Post-Condition: A Shared, Read-Only Preference Table Has Been Returned
+	def preference_table(keys, global_settings={}, streamer_settings={}, cache=None):
+
+		cache_key = json.dumps(streamer_settings, sort_keys=True)
+		if cache != None and cache_key in cache:
+			return cache[cache_key]
+
+		table = {}
+		for message_type in sorted(ALERT_TYPES):
+			row = dict([(key, Notifications.preference_resolver(key, message_type, global_settings, streamer_settings)) for key in keys])
+			table[message_type] = Notifications.__share(row)
+
+		table = Notifications.__share(table)
+		if cache != None:
+			cache[cache_key] = table
+		return table
+
+
+
+	# Returns the Stored Copy of an Identical Object if There is One
+	def __share(obj):
+		return Notifications.shared_tables.setdefault(json.dumps(obj, sort_keys=True), obj)
+
+
+
 	# A Helper Function for Handler.new_alert()
-	# Post-Condition: Notifications Have Been Sent By Logger and All Enabled Modules
-	async def send_helper(streamer, message):
+	# 'streamer' is the User ID the Streamer Dict is Keyed By, 'key' is the Alert's Outbox Key,
+	# and Modules Named in 'done' Already Sent This Alert Before a Restart or Failure
+	# 'timing' is (Stream Start, Detection Time) for Live Alerts With a Known Start Time, and None Otherwise
+	# Post-Condition: Notifications Have Been Sent By Logger and All Enabled Modules, or the First Error Was Raised
+	async def send_helper(streamer, message, key=None, done=(), timing=None):
 
 		# Wait for the Handler to Finish Initializing
 		await Notifications.Handler.ready.wait()
 
+		# The Streamer May Have Been Removed From the Config Since the Alert Was Created
+		streamer_obj = Notifications.Handler.streamer_dict.get(streamer)
+		if streamer_obj == None:
+			Outbox.complete(key)
+			return
+
 		# Send Module Notifications
+		# Every Module Gets to Finish, so Each Success is Recorded Even if Another Module Fails
 		coros = []
-		for func in Notifications.alert_callbacks:
-			coros.append(func(Notifications.Handler.streamer_dict[streamer], message))
+		for name, func in Notifications.alert_callbacks.items():
+			if name not in done:
+				coros.append(Notifications.__deliver(key, name, func, streamer_obj, message, timing))
+
+		results = await asyncio.gather(*coros, return_exceptions=True)
+		for result in results:
+			if isinstance(result, BaseException):
+				raise result
+
+		# Alerts That a Module Gave Up On Stay in the Outbox and are Sent Again on the Next Replay
+		if all(results):
+			Outbox.complete(key)
+
+
+
+	# Sends an Alert Through One Module and Records the Success in the Outbox
+	# Delivery Failures are Reported to failure_callback Instead of Being Raised, so They Never Interrupt Polling
+	# Returns True if the Alert Was Sent
+	async def __deliver(key, name, func, streamer_obj, message, timing=None):
+		labels = (("plugin", name),)
+		start = time.time()
+
+		try:
+			sent = await func(streamer_obj, message)
+
+		except (RequestsError, BadResponseCodeError) as err:
+			Notifications.Handler.failed += 1
+			Metrics.inc("fta_alert_failures_total", labels)
+			await Notifications.report(streamer_obj, message, name, err)
+			return False
 
-		if len(coros):
-			await asyncio.gather(*coros, return_exceptions=False)
+		Metrics.observe("fta_alert_send_seconds", time.time() - start, labels)
+		Outbox.done(key, name)
 
+		# Only Alerts a Module Actually Sent Count Towards the SLO
+		# Modules Return False When They Skip an Alert, and the Logger Only Writes it to the Log
+		if timing != None and sent != False and name != "Logger":
+			Notifications.__record_lag(streamer_obj, name, timing[0], timing[1], start)
+		return True
 
 
-	# Creates asyncio Tasks for Incoming Alerts and Manages Exceptions & Cancellations Related to Those Tasks
+
+	# Records How Long a Live Alert Took to Reach a Module, and Which Stage Was Slowest if It Missed the SLO
+	# Stages: 'detection' (Stream Start to the Alert Being Created, Including Twitch's Own Delay), 'queue' (Waiting for a Worker
+	# and the Outbox), and 'delivery' (The Module Sending It, Including Retries)
+	def __record_lag(streamer_obj, name, started, detected, sending):
+		stages = (
+			("detection", max(0, detected - started)),
+			("queue", max(0, sending - detected)),
+			("delivery", max(0, time.time() - sending))
+		)
+		lag = sum([seconds for _, seconds in stages])
+		Metrics.observe("fta_live_alert_lag_seconds", lag, (("plugin", name),))
+
+		if lag > Notifications.LIVE_ALERT_SLO:
+			stage = max(stages, key=lambda item: item[1])[0]
+			Metrics.inc("fta_live_slo_breaches_total", (("plugin", name), ("stage", stage)))
+
+			if Notifications.breach_callback != None:
+				Notifications.breach_callback(streamer_obj, name, lag, stages)
+
+
+
+	# Converts a Twitch Timestamp Like "2021-03-10T15:04:21Z" to Seconds Since the Epoch
+	# EventSub Timestamps Also Have Fractional Seconds (Up to Nanoseconds), Like "2021-03-10T15:04:21.123456789Z"
+	# Returns None if the Timestamp is Missing or Can't be Read
+	def parse_timestamp(timestamp):
+		try:
+			if not timestamp.endswith("Z"):
+				return None
+
+			whole, _, fraction = timestamp[:-1].partition(".")
+			seconds = calendar.timegm(time.strptime(whole, "%Y-%m-%dT%H:%M:%S"))
+			return seconds + (float("0." + fraction) if len(fraction) else 0)
+		except (AttributeError, TypeError, ValueError):
+			return None
+
+
+
+	# Passes a Delivery Problem to failure_callback, or to check_tasks() if There Isn't One
+	async def report(streamer_obj, message, name, exception):
+		if Notifications.failure_callback == None:
+			Notifications.Handler.errors.append(exception)
+			return
+
+		try:
+			await Notifications.failure_callback(streamer_obj, message, name, exception)
+		except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+			raise
+		except BaseException as err:
+			Notifications.Handler.errors.append(err)
+
+
+
+	# Queues Incoming Alerts and Delivers Them With a Fixed Pool of Worker Tasks
+	# Every Alert is Also Kept in the Outbox Until It's Delivered, so replay() Can Send it Again After a Restart or Failure
+	# Delivery Failures are Only Reported (See report()). Any Other Exception Raised While Sending is Saved and Re-Raised by check_tasks()
 	class Handler:
 
-		all_tasks = []
+		MAX_ERRORS = 100 # Unraised Exceptions Kept at Once. Older Ones are Dropped
+
+		all_tasks = set() # Running Worker Tasks. Finished Tasks Remove Themselves (See __task_done())
+		errors = collections.deque(maxlen=MAX_ERRORS) # Unexpected Exceptions Raised While Sending Alerts, Oldest First
+		outbox_error = None # The Last Outbox Write Failure That Was Reported
+		forward = None # In a Shard Worker, New Alerts are Passed Here (With the Same Arguments) Instead of Being Queued
+		inflight = set() # Outbox Keys of Alerts That are Queued or Being Sent
 		ready = asyncio.Event()
 
 		main_loop = None
 		streamer_dict = None
+		queue = None
+
+		# Queue Statistics (See stats())
+		busy = 0
+		delivered = 0
+		failed = 0
+		max_depth = 0
+		waits = collections.deque(maxlen=1000) # Seconds the Most Recent Alerts Spent in the Queue
 
 
 		# Initializes the Handler With the Info Needed to Make Alerts
@@ -125,60 +410,169 @@ class Notifications():
 			Notifications.Handler.main_loop = loop
 			Notifications.Handler.main_loop.set_exception_handler(lambda l, c: None) # Suppress Errors
 
+			if Notifications.Handler.queue == None:
+				Notifications.Handler.queue = asyncio.Queue()
+
+
+
+		# Tops the Worker Pool Up to 'count' Workers
+		# Pre-Condition: start() Has Been Called
+		def start_workers(count):
+			while len(Notifications.Handler.all_tasks) < count:
+				task = Notifications.Handler.main_loop.create_task(Notifications.Handler.__worker())
+				task.add_done_callback(Notifications.Handler.__task_done)
+				Notifications.Handler.all_tasks.add(task)
+
+
+
+		# Forgets a Finished Worker, Saving Its Exception (if Any) for check_tasks()
+		def __task_done(task):
+			Notifications.Handler.all_tasks.discard(task)
+			if not task.cancelled() and task.exception() != None:
+				Notifications.Handler.errors.append(task.exception())
+
 
 
 		# Cancels All Pending Tasks
+		# Alerts Still in the Queue are Dropped From Memory, but Stay in the Outbox
 		# Post-Condition: All Tasks Have Been Cancelled
 		async def stop():
 
 			# Call Cancel Functions
-			for task in Notifications.Handler.all_tasks:
+			tasks = list(Notifications.Handler.all_tasks)
+			for task in tasks:
 				if not task.done():
 					task.cancel()
 
 			# Wait for All the Tasks to Finish
 			# No Exception Handling Since the Program is Exiting
-			await asyncio.gather(*Notifications.Handler.all_tasks, return_exceptions=True)
+			await asyncio.gather(*tasks, return_exceptions=True)
+			Notifications.Handler.all_tasks.clear()
 
 
 
-		# Create a New Alert Task
+		# Queue a New Alert
+		# Live Alerts Can Pass the Stream's 'started_at' Timestamp so Their Lag is Measured (See __record_lag())
+		# 'streamer' is the Streamer Object Raising the Alert. Shard Workers Forward Its Title and Game With the Alert,
+		# Since It May Not be in the Streamer Dict Yet
 		# Pre-Condition: An Alert Has Been Triggered in the Streamer Module
-		# Post-Condition: A New Task Has Been Created and Appended to the all_tasks List
-		def new_alert(username, message):
+		# Post-Condition: The Alert Has Been Added to the Queue and Will be Written to the Outbox Before It's Sent
+		def new_alert(user_id, message, started_at=None, streamer=None):
+			if Notifications.Handler.forward != None:
+				return Notifications.Handler.forward(user_id, message, started_at, streamer)
 
-			# Construct Coroutine
-			coro = Notifications.send_helper(username, message)
+			started = Notifications.parse_timestamp(started_at) if started_at != None else None
+			if started != None:
+				Metrics.observe("fta_live_detection_lag_seconds", max(0, time.time() - started))
 
-			# Create Task and Add it to List
-			Notifications.Handler.all_tasks.append( Notifications.Handler.main_loop.create_task(coro) )
+			key, written = Outbox.add(user_id, message)
+			Notifications.Handler.__enqueue(key, user_id, message, written, set(), started)
 
 
 
-		# Cleans the 'all_tasks' List and Raises Exceptions if There are Any
-		# Post-Condition: Functions that Finished Successfully Have Been Removed from the List and the Oldest Exception (if Any) Has Been Raised and Removed
-		def check_tasks():
-			first_err = None
-			out = []
-
-			for task in Notifications.Handler.all_tasks:
-				
-				# Save Pending Tasks
-				if task.done():
-
-					# Store the First Exception we Find
-					# Save All Other Exceptions
-					if task.exception():
-						if first_err == None:
-							first_err = task.exception()
-						else:
-							out.append(task)
+		# Queues Every Alert in the Outbox That Isn't Already Queued. Called at Startup and After Recovering From an Error
+		# Alerts Older Than 'Outbox Max Age' are Dropped Instead. Replayed Alerts Don't Count Towards the Live Alert SLO
+		# Returns the Number of Alerts Queued and the Number Dropped
+		# Pre-Condition: Notifications.init() Has Been Called
+		async def replay():
+
+			# Alerts Finishing While We Read Aren't Queued or Completed Yet in the Outbox, so Skip Everything in Flight Now
+			inflight = set(Notifications.Handler.inflight)
+			replayed = expired = 0
+
+			for key, user_id, message, created, done in await Outbox.undelivered():
+				if key in inflight or key in Notifications.Handler.inflight:
+					continue
+
+				if created < time.time() - Outbox.MAX_AGE:
+					Outbox.complete(key)
+					expired += 1
 				else:
-					out.append(task)
-			
-			# Replace Old List With Cleaned List
-			Notifications.Handler.all_tasks = out
-
-			# Raise the First Error if THere Was One
-			if first_err:
-				raise first_err
+					Notifications.Handler.__enqueue(key, user_id, message, None, done)
+					replayed += 1
+
+			return replayed, expired
+
+
+
+		# Adds an Alert to the Queue. 'started' is When the Stream Started for Live Alerts, if Known
+		def __enqueue(key, user_id, message, written, done, started=None):
+			Notifications.Handler.inflight.add(key)
+			Notifications.Handler.queue.put_nowait((key, user_id, message, written, done, time.time(), started))
+			Notifications.Handler.max_depth = max(Notifications.Handler.max_depth, Notifications.Handler.queue.qsize())
+
+
+
+		# Takes Alerts Off the Queue One at a Time and Sends Them
+		async def __worker():
+			while True:
+				key, user_id, message, written, done, queued_at, started = await Notifications.Handler.queue.get()
+				Notifications.Handler.waits.append(time.time() - queued_at)
+				Notifications.Handler.busy += 1
+
+				try:
+
+					# Make Sure the Alert Can be Replayed Before Sending It
+					# If the Outbox Can't be Written, Send the Alert Anyway and Report the Error Once per Failed Write
+					if written != None:
+						try:
+							await written
+						except OutboxError as err:
+							if err is not Notifications.Handler.outbox_error:
+								Notifications.Handler.outbox_error = err
+								await Notifications.report(None, message, "Outbox", err)
+
+					timing = (started, queued_at) if started != None else None
+					await Notifications.send_helper(user_id, message, key, done, timing)
+					Notifications.Handler.delivered += 1
+
+				except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+					raise
+				except BaseException as err:
+					Notifications.Handler.errors.append(err)
+
+				finally:
+					Notifications.Handler.inflight.discard(key)
+					Notifications.Handler.busy -= 1
+					Notifications.Handler.queue.task_done()
+
+
+
+		# Returns Queue Statistics for Sizing the Worker Pool
+		# Wait Times Cover the Most Recent Alerts and Include Time Spent Waiting for Initialization
+		def stats():
+			waits = sorted(Notifications.Handler.waits)
+			percentile = lambda pct: waits[ max(0, int(round(pct / 100.0 * len(waits))) - 1) ] if len(waits) else None
+
+			return {
+				"depth" : Notifications.Handler.queue.qsize() if Notifications.Handler.queue != None else 0,
+				"max_depth" : Notifications.Handler.max_depth,
+				"workers" : len(Notifications.Handler.all_tasks),
+				"busy" : Notifications.Handler.busy,
+				"delivered" : Notifications.Handler.delivered,
+				"failed" : Notifications.Handler.failed,
+				"wait_p50" : percentile(50),
+				"wait_p95" : percentile(95),
+				"wait_max" : waits[-1] if len(waits) else None
+			}
+
+
+
+		# Returns Queue Gauges for the Metrics Endpoint
+		def metrics():
+			return [
+				("fta_alert_queue_depth", (), Notifications.Handler.queue.qsize() if Notifications.Handler.queue != None else 0),
+				("fta_alert_workers_busy", (), Notifications.Handler.busy)
+			]
+
+
+
+		# Raises the Oldest Exception From a Failed Alert, if There is One
+		# Also Replaces Workers That Stopped Unexpectedly
+		# Post-Condition: The Oldest Exception (if Any) Has Been Raised and Removed
+		def check_tasks():
+			if hasattr(Notifications, 'ALERT_WORKERS'):
+				Notifications.Handler.start_workers(Notifications.ALERT_WORKERS)
+
+			if len(Notifications.Handler.errors):
+				raise Notifications.Handler.errors.popleft()
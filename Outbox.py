@@ -0,0 +1,157 @@
+from Exceptions import OutboxError
+from Config import Config
+import sqlite3
+import asyncio
+import uuid
+import time
+import os
+
+
+# A Class for Keeping Alerts on Disk Until Every Module Has Sent Them
+# Alerts are Written Before They're Delivered, and Each Module's Success is Recorded Separately,
+# so Alerts Left Over From a Crash or a Network Outage are Replayed Without Re-Sending Them to Modules That Already Did
+# Writes are Grouped: Everything Recorded While One Write is Running Goes Into the Next Transaction
+class Outbox():
+
+	DEFAULT_FILE = "outbox.db"
+	DEFAULT_MAX_AGE = 3600 # Seconds. Older Alerts Aren't Worth Sending Anymore
+
+	connection = None
+	pending = []      # (Statement, Parameters) Pairs Waiting to be Written
+	waiters = []      # Futures Resolved Once Everything in 'pending' Has Been Committed
+	write_task = None
+
+
+	# Opens (or Creates) the Outbox File
+	# Relative Paths are Relative to the Folder With config.json
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	# Post-Condition: The Outbox is Ready or an OutboxError Was Raised
+	def open(config):
+		settings = config.get("Alert Settings", {})
+		Outbox.MAX_AGE = float(settings.get("Outbox Max Age", Outbox.DEFAULT_MAX_AGE))
+		Outbox.filename = os.path.join(os.path.dirname(os.path.abspath(Config.filename)), settings.get("Outbox File", Outbox.DEFAULT_FILE))
+
+		if Outbox.connection != None:
+			return
+
+		try:
+			Outbox.connection = sqlite3.connect(Outbox.filename, check_same_thread=False)
+			Outbox.connection.execute("PRAGMA journal_mode=WAL")
+			Outbox.connection.execute("PRAGMA synchronous=NORMAL")
+			with Outbox.connection:
+				Outbox.connection.execute("CREATE TABLE IF NOT EXISTS alerts (key TEXT PRIMARY KEY, user_id TEXT NOT NULL, message TEXT NOT NULL, created REAL NOT NULL)")
+				Outbox.connection.execute("CREATE TABLE IF NOT EXISTS deliveries (key TEXT NOT NULL, module TEXT NOT NULL, PRIMARY KEY (key, module))")
+
+		except sqlite3.Error as err:
+			Outbox.connection = None
+			raise OutboxError(err)
+
+
+
+	# Writes Everything That's Still Pending and Closes the File
+	async def close():
+		await Outbox.flush()
+		if Outbox.connection != None:
+			Outbox.connection.close()
+			Outbox.connection = None
+
+
+
+	# Records a New Alert
+	# Returns the Alert's Key and a Future That Completes Once the Alert is on Disk
+	def add(user_id, message):
+		key = uuid.uuid4().hex
+		Outbox.__write("INSERT OR IGNORE INTO alerts VALUES (?, ?, ?, ?)", (key, user_id, message, time.time()))
+
+		# Nothing to Wait for if the Outbox Isn't Open
+		written = asyncio.get_running_loop().create_future()
+		if Outbox.connection == None:
+			written.set_result(None)
+		else:
+			Outbox.waiters.append(written)
+		return key, written
+
+
+
+	# Records That a Module Has Sent an Alert, so Replays Skip That Module
+	def done(key, module):
+		if key != None:
+			Outbox.__write("INSERT OR IGNORE INTO deliveries VALUES (?, ?)", (key, module))
+
+
+
+	# Forgets an Alert That Every Module Has Sent (or That Can't be Sent Anymore)
+	def complete(key):
+		if key != None:
+			Outbox.__write("DELETE FROM alerts WHERE key = ?", (key,))
+			Outbox.__write("DELETE FROM deliveries WHERE key = ?", (key,))
+
+
+
+	# Returns Every Alert That Hasn't Been Completed, Oldest First
+	# Each Entry is (Key, User ID, Message, Creation Time, Set of Modules That Already Sent It)
+	# Pre-Condition: open() Has Been Called
+	async def undelivered():
+
+		# Pending Writes Go First so We Don't Return Alerts That Were Just Completed
+		# The Writer is Idle Once flush() Returns, so Reading Here Can't Overlap With a Write
+		await Outbox.flush()
+		if Outbox.connection == None:
+			return []
+
+		try:
+			alerts = Outbox.connection.execute("SELECT key, user_id, message, created FROM alerts ORDER BY created").fetchall()
+			deliveries = Outbox.connection.execute("SELECT key, module FROM deliveries").fetchall()
+		except sqlite3.Error as err:
+			raise OutboxError(err)
+
+		done = {}
+		for key, module in deliveries:
+			done.setdefault(key, set()).add(module)
+
+		return [(key, user_id, message, created, done.get(key, set())) for key, user_id, message, created in alerts]
+
+
+
+	# Waits Until Every Pending Write Has Been Committed
+	async def flush():
+		while Outbox.write_task != None and not Outbox.write_task.done():
+			await asyncio.shield(Outbox.write_task)
+
+
+
+	# Adds a Statement to the Next Write, Starting the Writer if Needed
+	def __write(statement, parameters):
+		if Outbox.connection == None:
+			return
+
+		Outbox.pending.append((statement, parameters))
+		if Outbox.write_task == None or Outbox.write_task.done():
+			Outbox.write_task = asyncio.get_running_loop().create_task(Outbox.__writer())
+
+
+
+	# Commits Pending Statements One Transaction at a Time Until There are None Left
+	# A Failed Write Fails the Alerts Waiting on It. Lost Done Marks Only Mean a Module May be Sent the Alert Again
+	async def __writer():
+		while len(Outbox.pending):
+			statements, Outbox.pending = Outbox.pending, []
+			waiters, Outbox.waiters = Outbox.waiters, []
+
+			try:
+				await asyncio.get_running_loop().run_in_executor(None, Outbox.__commit, statements)
+			except sqlite3.Error as err:
+				error = OutboxError(err)
+				for waiter in waiters:
+					if not waiter.done(): waiter.set_exception(error)
+			else:
+				for waiter in waiters:
+					if not waiter.done(): waiter.set_result(None)
+
+
+
+	# Runs a List of Statements in a Single Transaction (Executed in a Worker Thread)
+	def __commit(statements):
+		with Outbox.connection:
+			for statement, parameters in statements:
+				Outbox.connection.execute(statement, parameters)
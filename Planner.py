@@ -0,0 +1,92 @@
+from Notifications import Notifications
+from TwitchAPI import TwitchAPI, Batches
+from Logger import Log
+import math
+
+
+# A Class for Choosing Refresh Rates That Fit Inside the Helix Rate-Limit Budget
+# Each /streams Cycle Costs One Request per Stream Batch, and Each /channels Cycle Costs One Request per Channel Batch
+class Planner():
+
+	BUDGET_SHARE = 0.9    # Fraction of the Rate Limit That Polling is Allowed to Use. The Rest is Headroom
+	CHANNEL_RATIO = 0.25  # Channel Loop Speed Relative to the Stream Loop When Both Rates are "auto"
+	MAX_AUTO_RATE = 10    # Upper Bound for "auto" Rates, so Tiny Watchlists Don't Spin
+
+	stream_rate = 1
+	channel_rate = 1
+
+
+	# Loads the Requested Rates
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	def init(config):
+		Planner.REQUESTED_STREAM_RATE = config["Twitch Settings"]["Refresh Rate"]
+		Planner.REQUESTED_CHANNEL_RATE = config["Twitch Settings"].get("Channel Refresh Rate", Planner.REQUESTED_STREAM_RATE)
+
+
+
+	# Computes the Refresh Rates for the Current Watchlist. Called at Startup and Whenever the Watchlist Changes
+	# The Budget is the Combined Rate Limit of Every Twitch Credential
+	# Pre-Condition: TwitchAPI.url_string_gen() Has Been Called for the Current Watchlist
+	# Post-Condition: stream_rate and channel_rate Have Been Set and the Plan Has Been Logged
+	def plan():
+		stream_batches = max(1, len(TwitchAPI.URL_STRINGS["Stream"]))
+
+		# Worst Case: Every Streamer is Offline. Live Streamers Aren't in the Channel Batches, so Count the Whole Watchlist
+		channel_batches = max(1, math.ceil(len(TwitchAPI.batches["Stream"]) / Batches.BATCH_SIZE), len(TwitchAPI.URL_STRINGS["Channel"]))
+		budget = TwitchAPI.rate_limit() * Planner.BUDGET_SHARE / 60.0 # Requests per Second
+
+		stream_auto = (Planner.REQUESTED_STREAM_RATE == "auto")
+		channel_auto = (Planner.REQUESTED_CHANNEL_RATE == "auto")
+
+		# Give Both Loops the Highest Rate the Budget Allows, Keeping Their Ratio Fixed
+		if stream_auto and channel_auto:
+			stream_rate = budget / (stream_batches + Planner.CHANNEL_RATIO * channel_batches)
+			stream_rate = min(stream_rate, Planner.MAX_AUTO_RATE)
+			channel_rate = stream_rate * Planner.CHANNEL_RATIO
+
+		# Spend Whatever the Fixed Loop Leaves Over on the Automatic One
+		elif stream_auto:
+			channel_rate = float(Planner.REQUESTED_CHANNEL_RATE)
+			stream_rate = min((budget - channel_rate * channel_batches) / stream_batches, Planner.MAX_AUTO_RATE)
+
+		elif channel_auto:
+			stream_rate = float(Planner.REQUESTED_STREAM_RATE)
+			channel_rate = min((budget - stream_rate * stream_batches) / channel_batches, Planner.MAX_AUTO_RATE)
+
+		else:
+			stream_rate = float(Planner.REQUESTED_STREAM_RATE)
+			channel_rate = float(Planner.REQUESTED_CHANNEL_RATE)
+
+		# Clamp Plans That Don't Fit. Both Loops are Slowed Down by the Same Factor
+		cost = Planner.__cost(stream_rate, channel_rate, stream_batches, channel_batches)
+		if stream_rate <= 0 or channel_rate <= 0 or cost > budget:
+			requested = Planner.__cost(max(0, stream_rate), max(0, channel_rate), stream_batches, channel_batches)
+			factor = budget / requested if requested > 0 else 1
+
+			if stream_rate <= 0 or channel_rate <= 0:
+				stream_rate = channel_rate = budget / (stream_batches + channel_batches)
+			else:
+				stream_rate *= factor
+				channel_rate *= factor
+
+			Log.logger.warning(
+				"Requested Refresh Rates Need " + str(math.ceil(requested * 60)) + " Requests per Minute, but the Budget is " + str(math.floor(budget * 60)) +
+				". Clamping Refresh Rate to " + str(round(stream_rate, 3)) + " and Channel Refresh Rate to " + str(round(channel_rate, 3))
+			)
+
+		Planner.stream_rate = stream_rate
+		Planner.channel_rate = channel_rate
+
+		Log.logger.info(
+			"Refresh Plan: " + str(round(stream_rate, 3)) + " Stream Cycles/s (" + str(stream_batches) + " Requests Each), " +
+			str(round(channel_rate, 3)) + " Channel Cycles/s (Up to " + str(channel_batches) + " Requests Each). " +
+			"Up to " + str(round(Planner.__cost(stream_rate, channel_rate, stream_batches, channel_batches) * 60)) + " of " + str(TwitchAPI.rate_limit()) + " Requests per Minute. " +
+			"Worst-Case Detection Latency: " + str(round(1.0 / stream_rate, 2)) + "s (Live), " + str(round(1.0 / stream_rate + Notifications.LIVE_COOLDOWN, 2)) + "s (Offline), " +
+			str(round(1.0 / channel_rate, 2)) + "s (Title/Game/Ban)"
+		)
+
+
+
+	# Requests per Second for a Pair of Rates
+	def __cost(stream_rate, channel_rate, stream_batches, channel_batches):
+		return stream_rate * stream_batches + channel_rate * channel_batches
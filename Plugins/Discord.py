@@ -1,7 +1,8 @@
 from Validate import check_keys, ALERT_TYPES
-from Exceptions import ConfigFormatError
+from Exceptions import ConfigFormatError, BadResponseCodeError
 from Notifications import Notifications
 from Config import Config
+import asyncio
 import time
 
 
@@ -11,6 +12,19 @@ class Discord():
 	# Config File Key With Plugin's Settings
 	SETTINGS_KEY = "Discord Settings"
 
+	MAX_RATE_LIMIT_RETRIES = 5 # Times a Message is Re-Sent After a 429 Before Giving Up
+	MAX_EMBEDS = 10            # Discord's Limit for a Single Message
+	MAX_CONTENT = 2000         # Discord's Limit for a Message's Text
+	GLOBAL_ONLY_KEYS = ("Coalesce Max Wait", "Coalesce Max Embeds")
+
+	buckets = {}      # Webhook URL -> WebhookBucket. X-RateLimit-Bucket Leaves Out the Webhook ID, so It Can't Tell Webhooks Apart
+	global_reset = 0  # Every Webhook Waits Until This Time After a Global 429
+	batches = {}      # (Webhook URL, Username, Avatar URL) -> Batch of Alerts Waiting to be Sent Together
+	sending = set()   # Tasks Sending Closed Batches. The Event Loop Only Keeps Weak References to Tasks
+
+	# Settings Resolved Ahead of Time for Each Streamer and Alert Type
+	PREFERENCE_KEYS = ("Alerts", "Soon Cooldown", "Discord ID", "Message Text", "Webhook URL", "Bot Username", "Avatar URL", "Embeds")
+
 
 	# Makes Sure that the Plugin Settings Given in the Config File Are Valid
 	# Pre-Condition: Config File Has Been Loaded
@@ -26,18 +40,37 @@ class Discord():
 			"Webhook URL"   : {str, (dict,str)},
 			"Message Text"  : {str, (dict,str)},
 			"Discord ID"    : {str, (dict,str)},
-			"Embeds"        : {(list,dict), (dict,list,dict)}
+			"Embeds"        : {(list,dict), (dict,list,dict)},
+			"Coalesce Max Wait"   : {float, int},
+			"Coalesce Max Embeds" : int
 		}
 
 		# Check Key Datatypes
 		warnings = check_keys(Discord.SETTINGS_KEY, Config.config_file[Discord.SETTINGS_KEY],optional_keys=KEYS)
 		global_settings = Config.parse_preferences("GLOBAL", Discord)
+		Notifications.check_templates(global_settings, Discord.SETTINGS_KEY)
+
+		# Check Coalescing Limits
+		if global_settings.get("Coalesce Max Wait", 0) < 0:
+			raise ConfigFormatError("Coalesce Max Wait in " + Discord.SETTINGS_KEY + " Can't Be Negative")
+		if not 1 <= global_settings.get("Coalesce Max Embeds", Discord.MAX_EMBEDS) <= Discord.MAX_EMBEDS:
+			raise ConfigFormatError("Coalesce Max Embeds in " + Discord.SETTINGS_KEY + " Must Be Between 1 and " + str(Discord.MAX_EMBEDS))
+
+		# Each Alert Waiting in a Batch Holds an Alert Worker, so Too Few Workers Means Batches Never Fill Up
+		workers = Config.config_file.get("Alert Settings", {}).get("Alert Workers", 8)
+		if global_settings.get("Coalesce Max Wait", 0) > 0 and workers < global_settings.get("Coalesce Max Embeds", Discord.MAX_EMBEDS):
+			warnings.append("Alert Workers (" + str(workers) + ") is Smaller Than Coalesce Max Embeds, so Discord Batches Will Be Sent Before They're Full")
 
 		for streamer in Config.config_file["Streamers"]:
 			streamer_settings = Config.parse_preferences(streamer, Discord)
 
 			# Check Datatypes for Streamer-Specific Settings
 			warnings += check_keys(Discord.SETTINGS_KEY + "/" + streamer, streamer_settings, optional_keys=KEYS)
+			Notifications.check_templates(streamer_settings, Discord.SETTINGS_KEY + "/" + streamer)
+
+			for key in Discord.GLOBAL_ONLY_KEYS:
+				if key in streamer_settings:
+					warnings.append("\"" + key + "\" Can Only Be Set in Global " + Discord.SETTINGS_KEY + ". Ignoring It for " + streamer)
 
 			# Do a Dry-Run of Alerts
 			for alert in ALERT_TYPES :
@@ -71,10 +104,15 @@ class Discord():
 
 		# Parse Global Settings
 		Discord.GLOBAL_SETTINGS = Config.parse_preferences("GLOBAL", Discord)
+		Discord.COALESCE_WAIT = float(Discord.GLOBAL_SETTINGS.get("Coalesce Max Wait", 0))
+		Discord.COALESCE_EMBEDS = int(Discord.GLOBAL_SETTINGS.get("Coalesce Max Embeds", Discord.MAX_EMBEDS))
 
 		# Generate Streamer Settings
+		# Streamers With the Same Settings Share One Preference Table
+		cache = {}
 		for user in streamer_dict:
-			streamer_dict[user].module_preferences["Discord"] = Config.parse_preferences(user, Discord)
+			streamer_settings = Config.parse_preferences(streamer_dict[user].name, Discord)
+			streamer_dict[user].module_preferences["Discord"] = Notifications.preference_table(Discord.PREFERENCE_KEYS, Discord.GLOBAL_SETTINGS, streamer_settings, cache)
 			streamer_dict[user].module_last_change["Discord"] = 0
 
 
@@ -82,27 +120,31 @@ class Discord():
 	# Generate a Discord Notification
 	# Pre-Condition: An Alert Has Been Generated
 	# Post-Condition: A Valid Notification Payload Has Been Sent to Notifications.send()
+	# Returns False if the Alert Was Skipped Because of the User's Settings
 	async def alert(streamer_obj, message):
 
+		# Look Up the Resolved Settings for This Alert Type
+		settings = streamer_obj.module_preferences["Discord"][message]
+
 		# Don't Send Messages That the User Doesn't Want
-		if not Notifications.preference_resolver("Alerts", message, Discord.GLOBAL_SETTINGS, streamer_obj.module_preferences["Discord"]):
-			return
+		if not settings["Alerts"]:
+			return False
 
 		# Check & Reset the Soon Cooldown if Needed
 		elif message == "title" or message == "game":
 			
-			cooldown = Notifications.preference_resolver("Soon Cooldown", message, Discord.GLOBAL_SETTINGS, streamer_obj.module_preferences["Discord"])
+			cooldown = settings["Soon Cooldown"]
 			cooldown = float(cooldown) if cooldown != None else 0
 			
 			if time.time() > streamer_obj.module_last_change["Discord"] + cooldown:
 				streamer_obj.module_last_change["Discord"] = time.time()
 			else:
-				return
+				return False
 
 		# Resolve User Preferences
 		preferences = {}
 		for keyword in ("Discord ID", "Message Text", "Webhook URL", "Bot Username", "Avatar URL"):
-			preferences[keyword] = Notifications.preference_resolver(keyword, message, Discord.GLOBAL_SETTINGS, streamer_obj.module_preferences["Discord"])
+			preferences[keyword] = settings[keyword]
 
 		# Format Preferences
 		for pref in ("Discord ID", "Message Text", "Webhook URL", "Bot Username", "Avatar URL"):
@@ -119,7 +161,7 @@ class Discord():
 
 		# Format Embeds
 		# We Have to Hard Copy the Embed List so it looks a Bit Messy
-		embed_pref = Notifications.preference_resolver("Embeds", message, Discord.GLOBAL_SETTINGS, streamer_obj.module_preferences["Discord"])
+		embed_pref = settings["Embeds"]
 		if embed_pref != None:
 			out = []
 			for embed in embed_pref:
@@ -158,6 +200,260 @@ class Discord():
 			if preferences[config_key] != None:
 				data[req_param] = preferences[config_key]
 
-		# Send Message to Discord
-		coro = Notifications.requests.post(preferences["Webhook URL"], json=data, timeout=10)
-		await Notifications.send(coro)
+		# Send Message to Discord, Possibly Together With Other Alerts
+		if Discord.COALESCE_WAIT > 0:
+			await Discord.coalesce(preferences["Webhook URL"], data)
+		else:
+			await Discord.send(preferences["Webhook URL"], data)
+		return True
+
+
+
+	# Adds a Message to the Webhook's Current Batch and Waits for the Batch to be Sent
+	# A Batch is Sent When It's Full or Once its Oldest Message Has Waited 'Coalesce Max Wait' Seconds
+	# Only Messages With the Same Bot Username and Avatar Can Share a Batch
+	# Post-Condition: The Message Has Been Sent or An Error Occurred
+	async def coalesce(url, data):
+		key = (url, data.get("username"), data.get("avatar_url"))
+
+		# Send the Current Batch First if This Message Won't Fit
+		batch = Discord.batches.get(key)
+		if batch != None and not batch.fits(data):
+			batch.flush()
+			batch = None
+
+		# Start a New Batch
+		if batch == None:
+			batch = Batch(key)
+			Discord.batches[key] = batch
+
+		done = batch.add(data)
+		if len(batch.embeds) >= Discord.COALESCE_EMBEDS:
+			batch.flush()
+
+		await done
+
+
+
+	# Posts a Message to a Webhook Without Going Over Its Rate Limit
+	# Messages That Get a 429 Anyway are Re-Sent as Soon as the Limit Resets
+	# Post-Condition: The Message Has Been Sent or An Error Occurred
+	async def send(url, data):
+		for attempt in range(Discord.MAX_RATE_LIMIT_RETRIES + 1):
+			key = url.split("?")[0]
+			bucket = Discord.buckets.get(key)
+			if bucket == None:
+				bucket = Discord.buckets[key] = WebhookBucket()
+
+			await bucket.acquire()
+			try:
+				response = await Notifications.post(url, allowed_statuses=(429,), json=data, timeout=10)
+				bucket.update(response.headers)
+			finally:
+				bucket.release()
+
+			if response.status != 429:
+				return
+
+			# Find Out How Long Discord Wants Us to Wait
+			try: body = await response.json()
+			except: body = {}
+			if type(body) != dict: body = {}
+
+			retry_after = float(body.get("retry_after", response.headers.get("Retry-After", 1)))
+
+			if body.get("global") or response.headers.get("X-RateLimit-Global") == "true":
+				Discord.global_reset = max(Discord.global_reset, time.time() + retry_after)
+			else:
+				bucket.exhaust(retry_after)
+
+		raise BadResponseCodeError(response)
+
+
+
+# Alerts Waiting to be Merged Into a Single Webhook Message
+# Every Alert in the Batch Waits on the Same Future, so They All See the Result of the Combined Send
+class Batch():
+
+	def __init__(self, key):
+		self.key = key
+		self.url = key[0]
+		self.messages = []
+		self.contents = []
+		self.embeds = []
+		self.done = asyncio.get_running_loop().create_future()
+		self.timer = asyncio.get_running_loop().call_later(Discord.COALESCE_WAIT, self.flush)
+		self.sent = False
+
+
+
+	# Checks Whether a Message Can Join the Batch Without Breaking Discord's Limits
+	def fits(self, data):
+		content_length = sum([len(text) + 1 for text in self.contents]) + len(data.get("content") or "")
+		return len(self.embeds) + len(data.get("embeds") or []) <= Discord.COALESCE_EMBEDS and content_length <= Discord.MAX_CONTENT
+
+
+
+	# Adds a Message and Returns the Future That Completes When the Batch is Sent
+	def add(self, data):
+		self.messages.append(data)
+		if data.get("content") != None:
+			self.contents.append(data["content"])
+		self.embeds += data.get("embeds") or []
+
+		return asyncio.shield(self.done)
+
+
+
+	# Closes the Batch and Sends It in the Background
+	def flush(self):
+		if self.sent:
+			return
+		self.sent = True
+		self.timer.cancel()
+
+		if Discord.batches.get(self.key) is self:
+			del Discord.batches[self.key]
+
+		task = asyncio.get_running_loop().create_task(self.__send())
+		task.add_done_callback(Discord.sending.discard)
+		Discord.sending.add(task)
+
+
+
+	# Merges the Messages and Sends Them as One
+	async def __send(self):
+
+		# Lone Messages are Sent Unchanged
+		if len(self.messages) == 1:
+			data = self.messages[0]
+		else:
+			data = dict(self.messages[0])
+			data.pop("content", None)
+			data.pop("embeds", None)
+			if len(self.contents):
+				data["content"] = "\n".join(self.contents)
+			if len(self.embeds):
+				data["embeds"] = self.embeds
+
+		try:
+			await Discord.send(self.url, data)
+			self.done.set_result(None)
+		except asyncio.CancelledError:
+			self.done.cancel()
+			raise
+		except BaseException as err:
+			self.done.set_exception(err)
+
+
+
+# Rate-Limit State for One Discord Webhook (or a Group of Webhooks That Share a Bucket)
+# Sends are Released One at a Time, and Only While the Bucket Has Requests Left in the Current Window
+class WebhookBucket():
+
+	RESET_TOLERANCE = 0.1 # Seconds Two Reset Times Can Differ By and Still Belong to the Same Window
+
+
+	def __init__(self):
+		self.limit = None
+		self.remaining = None # Unknown Until the First Response
+		self.reset_at = 0     # When the Current Window Ends, According to Discord
+		self.window = 0       # Longest Reset-After Seen, Used to Guess When a Window We Started Ourselves Will End
+		self.refilled = False # True After We Assume a New Window Started, Until a Response Confirms It
+		self.lock = asyncio.Lock()
+
+		# Until We Know the Limit, Only One Request is Sent at a Time
+		self.known = asyncio.Event()
+		self.probing = False
+
+
+
+	# Waits Until a Request Can Be Sent Without Going Over the Limit, Then Takes It
+	async def acquire(self):
+		async with self.lock:
+
+			# Wait for the First Response to Tell Us the Limit
+			if self.remaining == None and self.probing:
+				await self.known.wait()
+			self.probing = self.probing or self.remaining == None
+
+			while True:
+				now = time.time()
+
+				# The Window Has Ended, so Start a New One Without Waiting for Discord to Confirm It
+				if self.remaining != None and self.limit != None and now >= self.__window_end():
+					self.remaining = self.limit
+					self.reset_at = now
+					self.refilled = True
+
+				delay = Discord.global_reset - now
+				if self.remaining != None and self.remaining <= 0:
+					delay = max(delay, self.__window_end() - now)
+
+				if delay <= 0:
+					break
+				await asyncio.sleep(delay)
+
+			if self.remaining != None:
+				self.remaining -= 1
+
+
+
+	# Lets Waiting Senders Continue if the Request Didn't Tell Us the Limit
+	def release(self):
+		self.known.set()
+
+
+
+	# Syncs the Bucket With a Response's X-RateLimit Headers
+	# Responses Can Arrive Out of Order, so Within a Window We Keep the Lowest Remaining Count
+	# Late Responses From a Window That Already Ended are Ignored
+	def update(self, headers):
+		if "X-RateLimit-Remaining" not in headers:
+			return
+
+		now = time.time()
+		remaining = int(headers["X-RateLimit-Remaining"])
+		reset_after = float(headers.get("X-RateLimit-Reset-After", 0))
+		reset_at = now + reset_after
+
+		if "X-RateLimit-Limit" in headers:
+			self.limit = int(headers["X-RateLimit-Limit"])
+		self.window = max(self.window, reset_after)
+
+		# First Response
+		if self.remaining == None:
+			self.remaining = remaining
+			self.reset_at = reset_at
+
+		# The Window We Assumed Has Been Confirmed. Our Own Count Already Includes Every Request Sent in It
+		elif self.refilled:
+			if reset_at > self.reset_at + WebhookBucket.RESET_TOLERANCE:
+				self.remaining = min(self.remaining, remaining)
+				self.reset_at = reset_at
+				self.refilled = False
+
+		# Same Window
+		elif reset_at <= self.reset_at + WebhookBucket.RESET_TOLERANCE:
+			self.remaining = min(self.remaining, remaining)
+
+		# A Window Started Without Us Noticing
+		else:
+			self.remaining = remaining
+			self.reset_at = reset_at
+
+		self.known.set()
+
+
+
+	# Marks the Bucket as Empty After a 429
+	def exhaust(self, retry_after):
+		self.remaining = 0
+		self.reset_at = max(self.__window_end(), time.time() + retry_after)
+		self.refilled = False
+
+
+
+	# When the Current Window Ends. For Windows We Started Ourselves, This is a Guess Based on Earlier Windows
+	def __window_end(self):
+		return self.reset_at + (self.window if self.refilled else 0)
@@ -9,6 +9,10 @@ import time
 class Pushover():
 
 	SETTINGS_KEY = "Pushover Settings"
+	API_URL = "https://api.pushover.net/1/messages.json"
+
+	# Settings Resolved Ahead of Time for Each Streamer and Alert Type
+	PREFERENCE_KEYS = ("Alerts", "Soon Cooldown", "Message Text", "API Token", "Group Key", "Embed URL", "URL Title", "Devices", "Message Title", "Priority", "Sound")
 
 
 	# Makes Sure that the Plugin Settings Given in the Config File Are Valid
@@ -28,18 +32,21 @@ class Pushover():
 			"URL Title"     : {str, (dict,str)},
 			"Message Text"  : {str, (dict,str)},
 			"Message Title" : {str, (dict,str)},
-			"Sound"         : {str, (dict,str)}
+			"Sound"         : {str, (dict,str)},
+			"API URL"       : str
 		}
 
 		# Check Key Datatypes
 		warnings = check_keys(Pushover.SETTINGS_KEY, Config.config_file[Pushover.SETTINGS_KEY], optional_keys=KEYS)
 		global_settings = Config.parse_preferences("GLOBAL", Pushover)
+		Notifications.check_templates(global_settings, Pushover.SETTINGS_KEY)
 
 		for streamer in Config.config_file["Streamers"]:
 			streamer_settings = Config.parse_preferences(streamer, Pushover)
 
 			# Check Datatypes for Streamer-Specific Settings
 			warnings += check_keys(Pushover.SETTINGS_KEY + "/" + streamer, streamer_settings, optional_keys=KEYS)
+			Notifications.check_templates(streamer_settings, Pushover.SETTINGS_KEY + "/" + streamer)
 
 			# Do a Dry-Run of Alerts
 			for alert in ALERT_TYPES :
@@ -60,11 +67,15 @@ class Pushover():
 
 		# Generate Global Settings
 		Pushover.GLOBAL_SETTINGS = Config.parse_preferences("GLOBAL", Pushover)
+		Pushover.API_URL = Pushover.GLOBAL_SETTINGS.get("API URL", Pushover.API_URL)
 
 		# Generate Streamer Settings
+		# Streamers With the Same Settings Share One Preference Table
+		cache = {}
 		for user in streamer_dict:
 
-			streamer_dict[user].module_preferences["Pushover"] = Config.parse_preferences(user, Pushover)
+			streamer_settings = Config.parse_preferences(streamer_dict[user].name, Pushover)
+			streamer_dict[user].module_preferences["Pushover"] = Notifications.preference_table(Pushover.PREFERENCE_KEYS, Pushover.GLOBAL_SETTINGS, streamer_settings, cache)
 			streamer_dict[user].module_last_change["Pushover"] = 0
 
 
@@ -72,27 +83,31 @@ class Pushover():
 	# Generate a Pushover Notification
 	# Pre-Condition: An Alert Has Been Generated
 	# Post-Condition: A Valid Notification Payload Has Been Sent to Notifications.send()
+	# Returns False if the Alert Was Skipped Because of the User's Settings
 	async def alert(streamer_obj, message):
 
+		# Look Up the Resolved Settings for This Alert Type
+		settings = streamer_obj.module_preferences["Pushover"][message]
+
 		# Don't Send Messages That the User Doesn't Want
-		if not Notifications.preference_resolver("Alerts", message, Pushover.GLOBAL_SETTINGS, streamer_obj.module_preferences["Pushover"]):
-			return
+		if not settings["Alerts"]:
+			return False
 
 		# Check & Reset the Soon Cooldown if Needed
 		elif message == "title" or message == "game":
 			
-			cooldown = Notifications.preference_resolver("Soon Cooldown", message, Pushover.GLOBAL_SETTINGS, streamer_obj.module_preferences["Pushover"])
+			cooldown = settings["Soon Cooldown"]
 			cooldown = float(cooldown) if cooldown != None else 0
 			
 			if time.time() > streamer_obj.module_last_change["Pushover"] + cooldown:
 				streamer_obj.module_last_change["Pushover"] = time.time()
 			else:
-				return
+				return False
 
 		# Get User Preferences
 		preferences = {}
 		for keyword in ("Message Text", "API Token", "Group Key", "Embed URL", "URL Title", "Devices", "Message Title", "Priority", "Sound"):
-			preferences[keyword] = Notifications.preference_resolver(keyword, message, Pushover.GLOBAL_SETTINGS, streamer_obj.module_preferences["Pushover"])
+			preferences[keyword] = settings[keyword]
 
 			# Format Message and Bot Username
 			if preferences[keyword] != None and type(preferences[keyword]) == str:
@@ -125,5 +140,5 @@ class Pushover():
 				payload[index] = preferences[pref]
 
 		# Send Message to Pushover
-		coro = Notifications.requests.post("https://api.pushover.net/1/messages.json", json=payload, timeout=10)
-		await Notifications.send(coro)
+		await Notifications.post(Pushover.API_URL, json=payload, timeout=10)
+		return True
@@ -0,0 +1,295 @@
+from TwitchAPI import TwitchAPI
+from EventSub import EventSub
+from Validate import validate
+from Streamer import Streamer
+from Planner import Planner
+from Shards import Shards
+from Cluster import Cluster
+from Config import Config
+from Exceptions import *
+from Logger import Log
+import ctypes.util
+import asyncio
+import ctypes
+import struct
+import os
+
+
+# A Class for Applying Edits to config.json Without Restarting
+# The File is Watched With inotify Where Available, and by Polling Its Modification Time Everywhere Else
+# Only the Parts of the Config That Changed are Applied. Polling and Queued Alerts Keep Running Throughout
+class Reloader():
+
+	POLL_INTERVAL = 2 # Seconds Between Modification Time Checks When inotify Isn't Available
+	DEBOUNCE = 0.5    # Seconds to Wait for an Editor to Finish Writing Before Reading the File
+
+	# inotify Constants (See inotify(7))
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_TO    = 0x00000080
+	IN_CREATE      = 0x00000100
+	IN_NONBLOCK    = 0o4000
+	IN_CLOEXEC     = 0o2000000
+
+	# Settings That Can't be Changed Without a Restart
+	RESTART_KEYS = ("Twitch Settings", "Logger Settings", "Alert Settings", "Metrics Settings", "Tracing Settings", "Shard Settings", "Cluster Settings")
+	HOT_TWITCH_KEYS = ("Refresh Rate", "Channel Refresh Rate")
+
+	task = None
+	changed = asyncio.Event()
+
+
+	# Starts Watching the Config File
+	# Pre-Condition: The Program Has Been Initialized
+	def start(streamer_dict):
+		Reloader.streamer_dict = streamer_dict
+		Reloader.last_mtime = Reloader.__mtime()
+		Reloader.task = asyncio.get_event_loop().create_task(Reloader.run())
+
+
+
+	# Stops Watching the Config File
+	async def stop():
+		if Reloader.task != None and not Reloader.task.done():
+			Reloader.task.cancel()
+			await asyncio.gather(Reloader.task, return_exceptions=True)
+
+
+
+	# Waits for the Config File to Change and Applies Each Change
+	# Errors Here Are Never Fatal. The Running Config Stays in Place
+	async def run():
+		fd = Reloader.__inotify_open()
+		watcher = None
+
+		try:
+			if fd == None:
+				watcher = asyncio.get_event_loop().create_task(Reloader.__poll_mtime())
+
+			while True:
+				await Reloader.changed.wait()
+
+				# Let the Writer Finish Before Reading
+				while Reloader.changed.is_set():
+					Reloader.changed.clear()
+					await asyncio.sleep(Reloader.DEBOUNCE)
+
+				# Skip Our Own Writes and Events for Unchanged Files
+				mtime = Reloader.__mtime()
+				if mtime == None or mtime == Reloader.last_mtime or mtime == Config.last_saved:
+					Reloader.last_mtime = mtime
+					continue
+				Reloader.last_mtime = mtime
+
+				try:
+					await Reloader.reload()
+				except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+					raise
+				except (ConfigFileError, ConfigFormatError) as err:
+					Log.logger.warning("Failed to Reload config.json. Keeping the Running Config.\nDetails: " + str(err))
+				except BaseException as err:
+					Log.logger.warning("Failed to Reload config.json. Keeping the Running Config.\nDetails:\n" + Error.exception_str(err))
+
+		finally:
+			if watcher != None:
+				watcher.cancel()
+			if fd != None:
+				asyncio.get_event_loop().remove_reader(fd)
+				os.close(fd)
+
+
+
+	# Reads, Validates, and Applies the Current Config File
+	# Pre-Condition: The Config File Has Changed on Disk
+	# Post-Condition: Config.config_file Holds the New Config and Every Change Has Been Applied, or the Old Config is Still in Place
+	async def reload():
+		old = Config.config_file
+		new = await Config.read()
+
+		# Nothing to Do for Whitespace or Formatting Edits
+		if new == old:
+			return
+
+		# Validate the New Config Exactly Like at Startup, Then Put the Old One Back if Anything's Wrong
+		Config.config_file = new
+		try:
+			warnings = validate() + Log.validate()
+			for module in Config.enabled_modules:
+				if hasattr(module, "validate"):
+					ret = module.validate()
+					if asyncio.iscoroutine(ret): ret = await ret
+					if type(ret) == list: warnings += ret
+		except:
+			Config.config_file = old
+			raise
+
+		for warning in warnings:
+			Log.logger.warning(warning)
+
+		await Reloader.__apply(old, new)
+
+
+
+	# Applies the Differences Between Two Validated Configs
+	async def __apply(old, new):
+		streamer_dict = Reloader.streamer_dict
+		summary = []
+
+		# Settings That Only Take Effect on Restart
+		for key in Reloader.RESTART_KEYS:
+			old_settings = dict([(k, v) for k, v in old.get(key, {}).items() if k not in Reloader.HOT_TWITCH_KEYS])
+			new_settings = dict([(k, v) for k, v in new.get(key, {}).items() if k not in Reloader.HOT_TWITCH_KEYS])
+			if old_settings != new_settings:
+				Log.logger.warning("Changes to " + key + " (Other Than Refresh Rates) Take Effect After a Restart")
+
+		# Match Streamers by User ID, Since Names Can Change
+		old_entries = dict([(old["Streamers"][name]["User ID"], (name, old["Streamers"][name])) for name in old["Streamers"]])
+		new_entries = dict([(new["Streamers"][name]["User ID"], (name, new["Streamers"][name])) for name in new["Streamers"]])
+
+		added = [id for id in new_entries if id not in old_entries]
+		removed = [id for id in old_entries if id not in new_entries]
+		kept = [id for id in new_entries if id in old_entries and id in streamer_dict]
+
+		# Remove Streamers
+		for id in removed:
+			Streamer.remove(streamer_dict, id)
+
+		# Names and Ban Statuses the User Edited by Hand
+		edited = []
+		for id in kept:
+			name, entry = new_entries[id]
+			streamer = streamer_dict[id]
+
+			if streamer.name != name or streamer.ban_status != entry["Ban Status"]:
+
+				# Unchanged Batches Aren't Decoded, so Make Sure the Hand Edit Gets Checked Against Twitch
+				TwitchAPI.recheck("Channel", id)
+				TwitchAPI.recheck("Stream", id)
+				edited.append(id)
+
+			if streamer.name != name:
+				if Streamer.names.get(streamer.name) == id:
+					del Streamer.names[streamer.name]
+				Streamer.names[name] = id
+				streamer.name = name
+
+			streamer.ban_status = entry["Ban Status"]
+
+		# Add Streamers. Only These are Requested From Twitch
+		# In Shard Mode, Their Shards Request Them When They Restart. In Cluster Mode, Their Owners Take Them Over (See Below)
+		await Streamer.add_all(streamer_dict, dict([new_entries[id] for id in added]), poll=not (Shards.enabled() or Cluster.enabled))
+
+		if len(added): summary.append(str(len(added)) + " Streamer(s) Added")
+		if len(removed): summary.append(str(len(removed)) + " Streamer(s) Removed")
+
+		# Re-Parse Preferences Only for the Plugins and Streamers That Changed
+		for module in Config.enabled_modules:
+			if not hasattr(module, "SETTINGS_KEY") or not hasattr(module, "init"):
+				continue
+			key = module.SETTINGS_KEY
+
+			changed = [id for id in kept if old_entries[id][1].get(key) != new_entries[id][1].get(key)]
+			if old.get(key) == new.get(key) and not len(changed) and not len(added):
+				continue
+
+			# Global Settings are Baked Into Every Streamer's Preference Table, so a Global Change Rebuilds Them All
+			if old.get(key) != new.get(key):
+				changed = [id for id in kept]
+
+			# Keep the Soon Cooldowns of Streamers That Already Existed
+			last_change = dict([(id, streamer_dict[id].module_last_change.get(module.__name__)) for id in changed])
+
+			ret = module.init(dict([(id, streamer_dict[id]) for id in changed + added if id in streamer_dict]))
+			if asyncio.iscoroutine(ret): await ret
+
+			for id in changed:
+				if last_change[id] != None:
+					streamer_dict[id].module_last_change[module.__name__] = last_change[id]
+
+			summary.append(module.__name__ + " Settings Updated for " + ("All Streamers" if old.get(key) != new.get(key) else str(len(changed) + len(added)) + " Streamer(s)"))
+
+		# The Watchlist or the Requested Rates Changed, so Plan Again
+		rates_changed = any([old["Twitch Settings"].get(key) != new["Twitch Settings"].get(key) for key in Reloader.HOT_TWITCH_KEYS])
+
+		# Shards Plan and Subscribe for Themselves, so Restart the Ones Affected With the New Config
+		if Shards.enabled():
+			if rates_changed or len(added + removed + edited):
+				Shards.restart(added + removed + edited, everything=rates_changed)
+
+		else:
+			if rates_changed:
+				Planner.init(new)
+
+			# The Cluster Plans Again Once the Streamers are Rebalanced
+			if Cluster.enabled and (len(added) or len(removed)):
+				Cluster.update(removed)
+				if rates_changed:
+					Planner.plan()
+
+			else:
+				if rates_changed or len(added) or len(removed):
+					Planner.plan()
+
+				if len(added) or len(removed):
+					EventSub.update()
+
+		Log.logger.info("Reloaded config.json" + (": " + ", ".join(summary) if len(summary) else ""))
+
+
+
+	# Returns the Config File's Modification Time, or None if It's Missing
+	def __mtime():
+		try:
+			return os.stat(Config.filename).st_mtime_ns
+		except OSError:
+			return None
+
+
+
+	# Checks the Modification Time Periodically. Used When inotify Isn't Available
+	async def __poll_mtime():
+		while True:
+			await asyncio.sleep(Reloader.POLL_INTERVAL)
+			if Reloader.__mtime() != Reloader.last_mtime:
+				Reloader.changed.set()
+
+
+
+	# Starts an inotify Watch on the Config File's Folder
+	# The Folder is Watched Instead of the File Since Editors (and Config.save()) Replace the File With a Rename
+	# Returns the inotify File Descriptor, or None if inotify Isn't Available
+	def __inotify_open():
+		try:
+			libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+			fd = libc.inotify_init1(Reloader.IN_NONBLOCK | Reloader.IN_CLOEXEC)
+			if fd < 0:
+				return None
+
+			folder = os.path.dirname(os.path.abspath(Config.filename))
+			if libc.inotify_add_watch(fd, folder.encode(), Reloader.IN_CLOSE_WRITE | Reloader.IN_MOVED_TO | Reloader.IN_CREATE) < 0:
+				os.close(fd)
+				return None
+
+		except (AttributeError, OSError, TypeError):
+			return None
+
+		asyncio.get_event_loop().add_reader(fd, Reloader.__inotify_read, fd)
+		return fd
+
+
+
+	# Reads Pending inotify Events and Flags the Config File if One of Them Names It
+	def __inotify_read(fd):
+		try:
+			data = os.read(fd, 64 * 1024)
+		except BlockingIOError:
+			return
+
+		filename = os.path.basename(Config.filename)
+		offset = 0
+		while offset + 16 <= len(data):
+			wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+			name = data[offset + 16 : offset + 16 + length].rstrip(b"\0").decode(errors="replace")
+			offset += 16 + length
+
+			if name == filename:
+				Reloader.changed.set()
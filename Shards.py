@@ -0,0 +1,378 @@
+from Notifications import Notifications
+from TwitchAPI import TwitchAPI
+from EventSub import EventSub
+from Streamer import Streamer
+from Planner import Planner
+from Tracing import Tracing
+from Metrics import Metrics
+from Config import Config
+from Logger import Log
+import collections
+import asyncio
+import logging
+import json
+import zlib
+import sys
+import os
+
+
+# A Class for Splitting the Watchlist Across Several Worker Processes
+# Each Shard Runs Its Own Twitch Session, EventSub Connection, and Polling Loops for Its Share of the Streamers
+# The Main Process Keeps Everything Else: config.json, the Outbox, Plugins, Alert Delivery, Reloading, and Metrics
+# Shards Report Alerts, Config Changes, Log Records, and Streamer State to the Main Process as JSON Lines Over Their stdout
+# The Main Process Sends Each Shard Its Config Over stdin, Then Keeps stdin Open. A Shard Exits When stdin Closes
+class Shards():
+
+	SETTINGS_KEY = "Shard Settings"
+	SCRIPT = os.path.abspath(__file__)
+	LINE_LIMIT = 64 * 1024 * 1024 # Longest Message Either Side Will Read
+	STATE_CHUNK = 1000 # Streamers per State Message
+	STOP_TIMEOUT = 5   # Seconds a Shard Gets to Exit Cleanly Before It's Killed
+
+	count = 1
+	supervisors = {} # Shard Index -> Task That Runs (and Restarts) the Shard
+	processes = {}   # Shard Index -> Running Process
+	ready = set()    # Shards That Have Reported Their Streamers Since They Last Started
+	restarting = set() # Shards Being Restarted on Purpose, so They Come Back Without the Cooldown
+	known = set()    # User ID's Whose State a Shard Has Reported. Only Their Changes are Alerted After a Restart
+	errors = collections.deque(maxlen=Notifications.Handler.MAX_ERRORS) # Exceptions Raised While Handling Shard Messages
+	stopping = False
+	streamer_dict = None
+
+	channel = None # The Pipe a Shard Writes Its Messages To
+
+
+	# Loads the Shard Settings
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	def init(config):
+		settings = config.get(Shards.SETTINGS_KEY, {})
+		Shards.count = int(settings.get("Shards", 1))
+		Shards.RESTART_COOLDOWN = float(settings.get("Restart Cooldown", 5))
+
+		Metrics.collect("Shards", Shards.metrics)
+
+
+
+	# Returns True if Polling Runs in Shard Processes
+	def enabled():
+		return Shards.count > 1
+
+
+
+	# Returns the Shard That Polls a Streamer. The Same User ID Always Lands on the Same Shard
+	def shard_of(user_id, count=None):
+		return zlib.crc32(str(user_id).encode()) % (count if count != None else Shards.count)
+
+
+
+	# Starts Every Shard
+	# Pre-Condition: The Main Process Has Been Initialized With poll=False Streamers (See Streamer.add_all())
+	def start(streamer_dict):
+		Shards.streamer_dict = streamer_dict
+		Shards.stopping = False
+
+		for index in range(Shards.count):
+			if index not in Shards.supervisors or Shards.supervisors[index].done():
+				Shards.supervisors[index] = asyncio.get_event_loop().create_task(Shards.__supervise(index))
+
+
+
+	# Stops Every Shard, Killing Any That Don't Exit in Time
+	async def stop():
+		Shards.stopping = True
+
+		for process in list(Shards.processes.values()):
+			Shards.__close(process)
+
+		for process in list(Shards.processes.values()):
+			try:
+				await asyncio.wait_for(process.wait(), Shards.STOP_TIMEOUT)
+			except asyncio.TimeoutError:
+				process.kill()
+
+		tasks = list(Shards.supervisors.values())
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		Shards.supervisors = {}
+
+
+
+	# Restarts the Shards That Poll 'user_ids' (or Every Shard) so They Pick Up the Current Config
+	# Used by the Reloader. The Streamers in 'user_ids' are Treated as New When Their Shard Reports Back
+	def restart(user_ids=(), everything=False):
+		Shards.known.difference_update(user_ids)
+
+		indexes = set([Shards.shard_of(user_id) for user_id in user_ids])
+		if everything:
+			indexes = set(range(Shards.count))
+
+		for index in indexes:
+			if index in Shards.processes:
+				Shards.restarting.add(index)
+				Shards.__close(Shards.processes[index])
+
+
+
+	# Raises the Oldest Exception From Handling a Shard Message, if There is One
+	# Post-Condition: The Oldest Exception (if Any) Has Been Raised and Removed
+	def check_tasks():
+		if len(Shards.errors):
+			raise Shards.errors.popleft()
+
+
+
+	# Returns Shard Gauges for the Metrics Endpoint
+	def metrics():
+		if not Shards.enabled():
+			return []
+		return [("fta_shards_ready", (), len(Shards.ready))]
+
+
+
+	# Runs One Shard, Starting It Again Whenever It Exits
+	# Shards That Crash are Restarted After the Restart Cooldown. Shards Restarted on Purpose Come Back Right Away
+	async def __supervise(index):
+		while not Shards.stopping:
+			process = await asyncio.create_subprocess_exec(
+				sys.executable, Shards.SCRIPT, str(index), str(Shards.count), Config.filename,
+				stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=Shards.LINE_LIMIT
+			)
+			Shards.processes[index] = process
+
+			# Only Send the Shard Its Own Streamers
+			config = dict(Config.config_file)
+			config["Streamers"] = dict([(name, entry) for name, entry in Config.config_file["Streamers"].items() if Shards.shard_of(entry["User ID"]) == index])
+			try:
+				process.stdin.write((json.dumps(config) + "\n").encode())
+			except (BrokenPipeError, ConnectionResetError):
+				pass
+
+			try:
+				while True:
+					line = await process.stdout.readline()
+					if not line:
+						break
+
+					try:
+						await Shards.__handle(index, json.loads(line))
+					except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+						raise
+					except BaseException as err:
+						Shards.errors.append(err)
+
+				code = await process.wait()
+
+			except asyncio.CancelledError:
+				if process.returncode == None:
+					process.kill()
+				raise
+
+			finally:
+				Shards.ready.discard(index)
+				if Shards.processes.get(index) is process:
+					del Shards.processes[index]
+
+			if Shards.stopping:
+				return
+
+			if index in Shards.restarting:
+				Shards.restarting.discard(index)
+				continue
+
+			Metrics.inc("fta_shard_restarts_total", (("shard", index),))
+			Log.logger.warning("Shard " + str(index) + " Stopped With Exit Code " + str(code) + ". Restarting in " + str(Shards.RESTART_COOLDOWN) + "s")
+			await asyncio.sleep(Shards.RESTART_COOLDOWN)
+
+
+
+	# Closes a Shard's stdin, Which Tells It to Exit
+	def __close(process):
+		try:
+			if not process.stdin.is_closing():
+				process.stdin.close()
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+
+
+
+	# Applies One Message From a Shard
+	async def __handle(index, message):
+		kind = message[0]
+		streamer_dict = Shards.streamer_dict
+
+		if kind == "log":
+			Log.logger.log(message[1], "Shard " + str(index) + ": " + message[2])
+
+		# Config Changes are Written Here, Since Only the Main Process Owns config.json
+		elif kind == "config":
+			entry = message[1]
+			streamer = streamer_dict.get(Streamer.names.get(entry[1]))
+
+			if entry[0] == "rename" and streamer != None:
+				await streamer.rename(entry[2])
+			elif entry[0] == "ban" and streamer != None:
+				await Config.update_ban_status(streamer.name, entry[2])
+
+		# Alerts Carry the Streamer's Title and Game so They're Formatted the Same as Without Shards
+		elif kind == "alert":
+			_, user_id, alert, started_at, title, game = message
+			streamer = streamer_dict.get(user_id)
+			if streamer == None:
+				return
+
+			is_live = {"live" : True, "offline" : False}.get(alert, streamer.is_live)
+			ban_status = {"ban" : True, "unban" : False}.get(alert, streamer.ban_status)
+			streamer.apply_state(title, game, is_live, ban_status)
+
+			Shards.known.add(user_id)
+			Notifications.Handler.new_alert(user_id, alert, started_at)
+
+		# The Shard's Streamers After It (Re)Started
+		# Streamers That Went Live or Offline While Their Shard Was Down Haven't Been Alerted Yet
+		elif kind == "state":
+			for user_id, title, game, is_live, ban_status in message[1]:
+				streamer = streamer_dict.get(user_id)
+				if streamer == None:
+					continue
+
+				if user_id in Shards.known and is_live != streamer.is_live and not ban_status:
+					Notifications.Handler.new_alert(user_id, "live" if is_live else "offline")
+
+				streamer.apply_state(title, game, is_live, ban_status)
+				Shards.known.add(user_id)
+
+		elif kind == "ready":
+			Shards.ready.add(index)
+			Log.logger.info("Shard " + str(index) + " is Polling " + str(message[1]) + " Streamer(s)")
+
+
+
+	# >>> Everything Below Runs in a Shard Process <<<
+
+
+	# Sends a Message to the Main Process
+	def send(message):
+		Shards.channel.write((json.dumps(message) + "\n").encode())
+		Shards.channel.flush()
+
+
+
+	# Entry Point for a Shard Process
+	# Returns the Exit Code: 0 When the Main Process Closed stdin, 1 After a Fatal Error
+	async def worker(index, count):
+		import Main
+
+		# stdout Carries Messages, so Anything Else That Gets Printed Goes to stderr
+		Shards.channel = sys.stdout.buffer
+		sys.stdout = sys.stderr
+
+		loop = asyncio.get_running_loop()
+		reader = asyncio.StreamReader(limit=Shards.LINE_LIMIT)
+		await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+		line = await reader.readline()
+		if not line:
+			return 0
+		config = json.loads(line)
+
+		# Send Alerts, Config Changes and Logs to the Main Process Instead of Handling Them Here
+		Config.config_file = config
+		Config.forward = lambda entry: Shards.send(["config", entry])
+		Notifications.Handler.forward = Shards.__forward_alert
+		Log.init(config, ShardLogHandler())
+
+		# Each Shard Gets an Equal Part of the Shared Rate Limit
+		Planner.BUDGET_SHARE = Planner.BUDGET_SHARE / count
+
+		polling = asyncio.ensure_future(Shards.__run(Main, index, config))
+		closed = asyncio.ensure_future(reader.read()) # Finishes When the Main Process Closes stdin or Exits
+
+		await asyncio.wait([polling, closed], return_when=asyncio.FIRST_COMPLETED)
+		for task in (polling, closed):
+			task.cancel()
+		await asyncio.gather(polling, closed, return_exceptions=True)
+
+		await EventSub.stop()
+		if hasattr(TwitchAPI, 'requests'):
+			await TwitchAPI.requests.close()
+		try: await Tracing.flush()
+		except: pass
+
+		return 1 if polling.done() and not polling.cancelled() and polling.result() else 0
+
+
+
+	# Initializes the Shard's Modules and Runs Its Polling Loops, Handling Errors the Same Way Main.py Does
+	# Returns True After a Fatal Error
+	async def __run(Main, index, config):
+		initialized = False
+
+		while True:
+			try:
+				if not initialized:
+					TwitchAPI.init(config)
+					EventSub.init(config)
+					Planner.init(config)
+					Tracing.init(config)
+
+					# Each Shard Writes Its Own Trace File
+					if Tracing.enabled:
+						root, extension = os.path.splitext(Tracing.filename)
+						Tracing.filename = root + ".shard" + str(index) + extension
+
+					Main.streamer_dict = await Streamer.init_all(config)
+					Planner.plan()
+					Shards.__send_state(Main.streamer_dict)
+
+					EventSub.start(Main.streamer_dict)
+					initialized = True
+
+				loops = [asyncio.ensure_future(Main.poll_streams()), asyncio.ensure_future(Main.poll_channels())]
+				try:
+					await asyncio.gather(*loops)
+				finally:
+					for task in loops:
+						task.cancel()
+					await asyncio.gather(*loops, return_exceptions=True)
+
+			except (KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+				raise
+			except BaseException as err:
+				if await Log.fail(err):
+					return True
+
+
+
+	# Reports Every Streamer in the Shard, a Chunk at a Time
+	def __send_state(streamer_dict):
+		rows = [[s.id, s.last_title, s.last_game, s.is_live, s.ban_status] for s in streamer_dict.values()]
+		for start in range(0, len(rows), Shards.STATE_CHUNK):
+			Shards.send(["state", rows[start : start + Shards.STATE_CHUNK]])
+		Shards.send(["ready", len(rows)])
+
+
+
+	# Passes an Alert to the Main Process, Along With the Title and Game It Should be Formatted With
+	def __forward_alert(user_id, alert, started_at, streamer):
+		title, game = (streamer.last_title, streamer.last_game) if streamer != None else ("", "")
+		Shards.send(["alert", user_id, alert, started_at, title, game])
+
+
+
+# Passes Log Records From a Shard to the Main Process, Which Writes Them to the Log File
+class ShardLogHandler(logging.Handler):
+
+	def emit(self, record):
+		try:
+			Shards.send(["log", record.levelno, self.format(record)])
+		except (BrokenPipeError, ValueError):
+			pass
+
+
+
+# Run a Shard: python Shards.py <Index> <Count> <Config File>
+if __name__ == "__main__":
+	from Shards import Shards as Module
+	Config.filename = sys.argv[3]
+	sys.exit(asyncio.run(Module.worker(int(sys.argv[1]), int(sys.argv[2]))))
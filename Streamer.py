@@ -1,13 +1,24 @@
 from Notifications import Notifications
-from TwitchAPI import TwitchAPI
+from TwitchAPI import TwitchAPI, Batches
+from Tracing import Tracing
 from Config import Config
 import asyncio
 import time
+import sys
 
 
 # A Class for Storing and Updating Streamer Data
+# Streamer Objects Use __slots__ and Share One Copy of Each Game Name, Since Watchlists Can Hold Hundreds of Thousands of Them
+# Utils/memory_report.py Measures What Each Streamer Costs
 class Streamer():
 
+	__slots__ = ("name", "id", "ban_status", "last_title", "last_game", "last_live", "is_live", "last_push", "module_preferences", "module_last_change")
+
+	PUSH_GRACE = 120 # Seconds That a stream.online/offline Event Takes Precedence Over Polled (Cached) Helix Data
+
+	names = {} # Secondary Index: Display Name -> User ID. The Streamer Dict Itself is Keyed by User ID
+	live = set() # User ID's of Streamers That are Live. Kept in Sync by __set_live(), add_all() and remove()
+
 
 	# Constructor for Individual Streamer Objects
 	def __init__(self, username, user_id, ban_status):
@@ -19,16 +30,94 @@ class Streamer():
 		self.last_game = ""
 		self.last_live = 0
 		self.is_live = False
+		self.last_push = 0
 
 		self.module_preferences = {}
 		self.module_last_change = {}
 
 
 
-	# Updates A Streamer Object's Internal Variables Given Fresh Data
-	# Pre-Condition: New Data Has Been Pulled from the Twitch API
+	# Returns the Shared Copy of a Game Name. Thousands of Streamers Play the Same Few Games
+	def intern(text):
+		return sys.intern(text) if type(text) == str else text
+
+
+
+	# Changes a Streamer's Display Name, Updating the Config File and the Name Index
+	# Pre-Condition: Twitch Reported a New Display Name for This User ID
+	# Post-Condition: The Name Has Been Updated Everywhere
+	async def rename(self, new_name):
+		await Config.update_username(self.name, new_name)
+
+		if Streamer.names.get(self.name) == self.id:
+			del Streamer.names[self.name]
+		Streamer.names[new_name] = self.id
+		self.name = new_name
+
+
+
+	# Sets the Live Flag and Keeps the /channels Batches in Sync With It
+	# Live Streamers Don't Need Channel Requests Since the Stream Payload Carries Their Title and Game
+	def __set_live(self, is_live):
+		if is_live == self.is_live:
+			return
+
+		self.is_live = is_live
+		if is_live:
+			Streamer.live.add(self.id)
+			TwitchAPI.batches["Channel"].remove(self.id)
+		else:
+			Streamer.live.discard(self.id)
+			TwitchAPI.batches["Channel"].add(self.id)
+
+
+
+	# Updates A Streamer Object's Live Status Given Fresh Data From the /streams Endpoint
+	# While Live, the Stream Payload Also Keeps the Title and Game Up to Date
+	# Pre-Condition: New Data Has Been Pulled from the Twitch API. stream_info is None if the Streamer is Offline
+	# Post-Condition: Streamer's Variables are Up To Date and Notifications (if any) Have Been Added to Queue
+	def __update_stream(self, stream_info, timestamp):
+
+		# Ban Status is Tracked by __update_channel()
+		if self.ban_status == True:
+			return
+
+		# Helix Responses Lag Behind EventSub, So Don't Let a Stale Response Undo a Fresh Live or Offline Event
+		is_live = (stream_info != None)
+		if is_live != self.is_live and timestamp < self.last_push + Streamer.PUSH_GRACE:
+			is_live = self.is_live
+
+		# Check Live Status
+		if is_live:
+
+			# Update the Stream Data
+			if stream_info != None:
+				self.last_title = stream_info["title"]
+				if stream_info["game_name"] != self.last_game:
+					self.last_game = Streamer.intern(stream_info["game_name"])
+
+			# Send a Live Notification if the Stream Just Started
+			if not self.is_live:
+				Notifications.Handler.new_alert(self.id, "live", stream_info["started_at"] if stream_info != None else None, streamer=self)
+
+			# Update State Variables
+			self.__set_live(True)
+			self.last_live = timestamp
+
+		elif timestamp > self.last_live + Notifications.LIVE_COOLDOWN:
+
+			# Send Offline Notification
+			if self.is_live:
+				Notifications.Handler.new_alert(self.id, "offline", streamer=self)
+
+			self.__set_live(False)
+
+
+
+	# Updates A Streamer Object's Ban Status, Title and Game Given Fresh Data From the /channels Endpoint
+	# Pre-Condition: New Data Has Been Pulled from the Twitch API and the Streamer Wasn't Live When it Was Requested
 	# Post-Condition: Streamer's Variables are Up To Date and Notifications (if any) Have Been Added to Queue
-	async def __update(self, is_live, timestamp, channel_info):
+	async def __update_channel(self, channel_info, timestamp):
 
 		# Check Ban Status
 		ban_status = (channel_info["delay"] == None)
@@ -36,97 +125,266 @@ class Streamer():
 		# If Ban Status Changes, Update Config File and Send a Notification
 		if ban_status != self.ban_status:
 			await Config.update_ban_status(self.name, ban_status)
-			Notifications.Handler.new_alert(self.name, "ban" if ban_status else "unban")
+			Notifications.Handler.new_alert(self.id, "ban" if ban_status else "unban", streamer=self)
 			self.ban_status = ban_status
 
 		if self.ban_status == True:
 			return
 
-		# Check Live Status
-		if is_live:
+		# Title and Game Changes Only Generate Alerts for Offline Streamers Once the Live Cooldown Has Passed
+		if not self.is_live and timestamp > self.last_live + Notifications.LIVE_COOLDOWN:
+			self.__check_channel(channel_info["title"], channel_info["game_name"])
 
-			# If the Stream was Already Live, Update the Stream Data
-			if self.is_live:
-				self.last_title = channel_info["title"]
-				self.last_game = channel_info["game_name"]
 
-			# Otherwise Send a Live Notification
-			else:
-				Notifications.Handler.new_alert(self.name, "live")
 
-			# Update State Variables
-			self.is_live = True
-			self.last_live = timestamp
+	# Sends a Game or Title Alert if the Offline Streamer's Channel Info Has Changed
+	# Only One Alert is Sent per Call. Any Other Change Will be Caught on the Next Call
+	def __check_channel(self, title, game):
 
-		elif timestamp > self.last_live + Notifications.LIVE_COOLDOWN:
+		# Check for Game Changes
+		if self.last_game != game:
+			self.last_game = Streamer.intern(game)
+			Notifications.Handler.new_alert(self.id, "game", streamer=self)
 
-			# Send Offline Notification
+		# Check for Title Changes
+		elif self.last_title != title:
+			self.last_title = title
+			Notifications.Handler.new_alert(self.id, "title", streamer=self)
+
+
+
+	# Applies a Stream Event Received Over EventSub
+	# Pre-Condition: The Streamer is Covered by an EventSub Subscription of Type 'event_type'
+	# Post-Condition: Streamer's Variables are Up To Date and Notifications (if any) Have Been Added to Queue
+	def push_event(self, event_type, event, timestamp):
+
+		# Banned Streamers Can't Stream. Unbans are Still Detected by Polling
+		if self.ban_status == True:
+			return
+
+		if event_type == "stream.online":
+			if not self.is_live:
+				Notifications.Handler.new_alert(self.id, "live", event.get("started_at"), streamer=self)
+
+			self.__set_live(True)
+			self.last_live = timestamp
+			self.last_push = timestamp
+
+		elif event_type == "stream.offline":
 			if self.is_live:
-				Notifications.Handler.new_alert(self.name, "offline")
+				Notifications.Handler.new_alert(self.id, "offline", streamer=self)
 
-			else:
-				
-				# Check for Game Changes
-				if self.last_game != channel_info["game_name"]:
-					self.last_game = channel_info["game_name"]
-					Notifications.Handler.new_alert(self.name, "game")
+			self.__set_live(False)
+			self.last_live = timestamp
+			self.last_push = timestamp
 
-				# Check for Title Changes
-				elif self.last_title != channel_info["title"]:
-					self.last_title = channel_info["title"]
-					Notifications.Handler.new_alert(self.name, "title")
+		elif event_type == "channel.update":
 
-			self.is_live = False
+			# Same Rules as Polling: Changes Only Generate Alerts Once the Live Cooldown Has Passed
+			if not self.is_live and timestamp > self.last_live + Notifications.LIVE_COOLDOWN:
+				self.__check_channel(event["title"], event["category_name"])
+			else:
+				self.last_title = event["title"]
+				self.last_game = Streamer.intern(event["category_name"])
 
 
 
-	# Generates Streamer Dictionary
+	# Generates Streamer Dictionary, Keyed by User ID
+	# With 'poll' Off, Streamers are Created Without Requesting Their State (See add_all())
 	# Pre-Condition: Config File Has Been Loaded and Validated
 	# Post-Condition: Streamer Dict. Has Been Populated with Streamer Objects
-	async def init_all(config):
+	async def init_all(config, poll=True):
 			
-		# Create A Dictionary of Every Streamer
+		# Start With Empty Batches and Add Every Streamer to Them
 		streamer_dict = {}
-		for user in config["Streamers"]:
-			ban_status = config["Streamers"][user]["Ban Status"]
-			id = config["Streamers"][user]["User ID"]
+		Streamer.names = {}
+		Streamer.live = set()
+		TwitchAPI.url_string_gen(streamer_dict)
+
+		await Streamer.add_all(streamer_dict, config["Streamers"], poll)
+		return streamer_dict
+
+
+
+	# Creates Streamer Objects for New Config Entries, Fetches Their Current State, and Adds Them to the Streamer Dict.
+	# Only the New Streamers are Requested, so This is Also Used to Add Streamers While the Program is Running
+	# In Shard Mode the Main Process Passes poll=False. The Shards Request and Poll the Streamers, and Report Their State (See apply_state())
+	# Pre-Condition: 'entries' Maps Display Names to Validated Streamer Objects From the Config File
+	# Post-Condition: The Streamers Have Been Added to the Streamer Dict., the Name Index, and the Request Batches
+	async def add_all(streamer_dict, entries, poll=True):
+		
+		# Create A Dictionary of the New Streamers
+		new_dict = {}
+		for user in entries:
+			ban_status = entries[user]["Ban Status"]
+			id = entries[user]["User ID"]
 			
-			streamer_dict[user] = Streamer(user, id, ban_status)
+			new_dict[id] = Streamer(user, id, ban_status)
 
-		# Init ID Strings
-		TwitchAPI.url_string_gen(streamer_dict)
+		if not len(new_dict):
+			return
+
+		if not poll:
+			for user, streamer in new_dict.items():
+				streamer_dict[user] = streamer
+				Streamer.names[streamer.name] = user
+			return
 
 		# Use the Dictionary to Generate Channel and Stream Responses
-		channel_response, stream_response = await TwitchAPI.get_response(streamer_dict)
+		url_strings = {
+			"Channel" : Batches("Channel", new_dict.keys()).urls,
+			"Stream" : Batches("Stream", new_dict.keys()).urls
+		}
+		channel_response, stream_response = await TwitchAPI.get_response(new_dict, url_strings=url_strings)
 
 		# Go Back to the Streamer Dict to Fill in More Info
-		for user in streamer_dict:
+		for user in new_dict:
+			streamer = new_dict[user]
+
+			# Update Stream State Variables
+			streamer.last_title = channel_response[user]["title"]
+			streamer.last_game  = Streamer.intern(channel_response[user]["game_name"])
+			streamer.is_live    = (user in stream_response)
 			
 			# Get Ban Status
 			ban_status = (channel_response[user]["delay"] == None)
-			if ban_status != streamer_dict[user].ban_status:
-				await Config.update_ban_status(user, ban_status)
-				Notifications.Handler.new_alert(user, "ban" if ban_status else "unban")
-				streamer_dict[user].ban_status = ban_status
+			if ban_status != streamer.ban_status:
+				await Config.update_ban_status(streamer.name, ban_status)
+				Notifications.Handler.new_alert(user, "ban" if ban_status else "unban", streamer=streamer)
+				streamer.ban_status = ban_status
 
-			# Update Stream State Variables
-			streamer_dict[user].last_title = channel_response[user]["title"]
-			streamer_dict[user].last_game  = channel_response[user]["game_name"]
-			streamer_dict[user].is_live    = (user in stream_response)
+			# Start Polling the Streamer
+			streamer_dict[user] = streamer
+			Streamer.names[streamer.name] = user
+			if streamer.is_live:
+				Streamer.live.add(user)
+			TwitchAPI.add_streamer(user, streamer.is_live)
 
-		return streamer_dict
 
 
+	# Copies State Reported by a Shard Into a Streamer Object in the Main Process
+	# The Main Process Doesn't Poll in Shard Mode. Its Streamer Objects are Only Kept Current for Alerts and Metrics
+	def apply_state(self, title, game, is_live, ban_status):
+		self.last_title = title
+		self.last_game = Streamer.intern(game)
+		self.ban_status = ban_status
+
+		self.is_live = is_live
+		if is_live:
+			Streamer.live.add(self.id)
+		else:
+			Streamer.live.discard(self.id)
+
+
+
+	# Removes a Streamer From the Streamer Dict., the Name Index, and the Request Batches
+	# Alerts That are Already Queued for the Streamer are Dropped
+	def remove(streamer_dict, user_id):
+		streamer = streamer_dict.pop(user_id, None)
+		if streamer == None:
+			return
+
+		if Streamer.names.get(streamer.name) == user_id:
+			del Streamer.names[streamer.name]
+		Streamer.live.discard(user_id)
+		TwitchAPI.remove_streamer(user_id)
+
 
-	# Updates the Entire Streamer Dict.
+
+	# Counts Tracked, Live, and Banned Streamers for the Metrics Endpoint
+	def metrics(streamer_dict):
+		streamers = list(streamer_dict.values())
+		return [
+			("fta_streamers", (("state", "tracked"),), len(streamers)),
+			("fta_streamers", (("state", "live"),), len(Streamer.live)),
+			("fta_streamers", (("state", "banned"),), len([s for s in streamers if s.ban_status]))
+		]
+
+
+
+	# Updates Every Streamer's Live Status. This is the Fast Loop That Drives Live/Offline Alerts
+	# Pre-Condition: The Streamer Dict. Has Been Generated by init_all()
+	# Post-Condition: New Data Has Been Pulled from the /streams Endpoint and Streamer Objects Have Been Updated
+	async def refresh_streams(streamer_dict):
+
+		# Generate Stream Responses from the Streamer Dictionary
+		stream_response, = await TwitchAPI.get_response(streamer_dict, ("Stream",))
+		Streamer.apply_streams(streamer_dict, stream_response, time.time())
+
+
+
+	# Compares a Whole Cycle of /streams Data With the Stored Live State in One Pass
+	# Only Streamers That are Live Now or Were Live Before Can Change, so Everyone Else is Skipped Without Being Looked At
+	# Pre-Condition: stream_response Maps the User ID of Every Live Streamer to Their Stream Data
+	# Post-Condition: Streamer Objects Have Been Updated and Notifications (if any) Have Been Added to Queue
+	def apply_streams(streamer_dict, stream_response, timestamp):
+		changed = Streamer.live.union(stream_response)
+
+		with Tracing.span("Update Streamers", (("streamers", len(changed)),)):
+			for user in changed:
+				streamer = streamer_dict.get(user)
+				if streamer != None:
+					streamer.__update_stream(stream_response.get(user), timestamp)
+
+
+
+	# Updates Ban Status, Title and Game for Every Offline Streamer. This is the Slow Loop
+	# Live Streamers are Skipped Since the Stream Payload Already Carries Their Title and Game
 	# Pre-Condition: The Streamer Dict. Has Been Generated by init_all()
-	# Post-Condition: New Data Has Been Pulled from the Twitch API and Streamer Objects Have Been Updated
-	async def refresh_all(streamer_dict):
+	# Post-Condition: New Data Has Been Pulled from the /channels Endpoint and Streamer Objects Have Been Updated
+	async def refresh_channels(streamer_dict):
+
+		# The Channel Batches Only Hold Streamers That Aren't Live (See __set_live())
+		if not len(TwitchAPI.URL_STRINGS["Channel"]):
+			return
+
+		channel_response, = await TwitchAPI.get_response(streamer_dict, ("Channel",))
+		await Streamer.apply_channels(streamer_dict, channel_response, time.time())
+
+
+
+	# Compares a Whole Cycle of /channels Data With the Stored Ban Status, Title and Game in One Pass
+	# Unchanged Channels are Skipped Synchronously. Only Ban Changes Need a Coroutine, Since They're Written to the Config File
+	# Batches That Haven't Changed Since the Last Cycle Aren't in channel_response at All (See TwitchAPI.REUSE_ROWS)
+	# Pre-Condition: channel_response Maps User ID's to Channel Data for Streamers That Weren't Live When it Was Requested
+	# Post-Condition: Streamer Objects Have Been Updated and Notifications (if any) Have Been Added to Queue
+	async def apply_channels(streamer_dict, channel_response, timestamp):
+		cooled = timestamp - Notifications.LIVE_COOLDOWN
+		coros = []
+		changed = [] # Streamers Whose Channel Didn't Match Their Stored State
+
+		with Tracing.span("Update Channels", (("streamers", len(channel_response)),)):
+			for user, channel_info in channel_response.items():
+
+				# Users May Have Been Removed While We Waited, so Look Them Up Again
+				streamer = streamer_dict.get(user)
+				if streamer == None:
+					continue
+
+				if not streamer.__channel_differs(channel_info):
+					continue
+				changed.append((streamer, channel_info))
+
+				if (channel_info["delay"] == None) != streamer.ban_status:
+					coros.append(streamer.__update_channel(channel_info, timestamp))
+
+				# Same Rules as __update_channel(), Which Isn't Needed Unless the Ban Status Changed
+				elif not streamer.is_live and streamer.last_live < cooled:
+					streamer.__check_channel(channel_info["title"], channel_info["game_name"])
+
+			await asyncio.gather(*coros)
+
+			# Changes Still Waiting on the Live Cooldown, or a Title Change Queued Behind a Game Change,
+			# Won't Show Up Again if the Batch Stays the Same, so Have It Decoded Again Next Cycle
+			for streamer, channel_info in changed:
+				if streamer.__channel_differs(channel_info):
+					TwitchAPI.recheck("Channel", streamer.id)
+
 
-		# Generate Channel and Stream Responses from the Streamer Dictionary
-		channel_response, stream_response = await TwitchAPI.get_response(streamer_dict)
-		timestamp = time.time()
 
-		# Have Each Streamer Object Compare the New Values to The Old Ones
-		coros = [streamer_dict[user].__update(user in stream_response, timestamp, channel_response[user]) for user in streamer_dict]
-		await asyncio.gather(*coros)
+	# Returns True if /channels Data Doesn't Match the Stored Ban Status, Title and Game
+	# Title and Game Aren't Tracked While a Streamer is Banned
+	def __channel_differs(self, channel_info):
+		if (channel_info["delay"] == None) != self.ban_status:
+			return True
+		return self.ban_status != True and (channel_info["title"] != self.last_title or channel_info["game_name"] != self.last_game)
@@ -0,0 +1,214 @@
+import contextvars
+import asyncio
+import random
+import json
+import time
+import os
+
+
+# A Class for Recording Where the Time in a Polling Cycle Goes
+# Each Cycle Builds a Tree of Spans. Slow Cycles (and a Random Sample of the Others) are Written to a JSON-Lines File
+# Every Line is One Event in the Chrome Trace Format. Utils/trace_view.py Turns the File Into Something a Trace Viewer Can Open
+# With Tracing Off (or Outside a Cycle), span() Returns a Shared Do-Nothing Object, so Instrumented Code Costs Almost Nothing
+class Tracing():
+
+	SETTINGS_KEY = "Tracing Settings"
+	DEFAULT_FILE = "traces.jsonl"
+
+	enabled = False
+	current = contextvars.ContextVar("span", default=None) # The Innermost Open Span. Tasks Inherit It When They're Created
+	next_id = 1
+	tracks = {} # Track Name -> Thread ID in the Trace Viewer. Kept for the Whole Run so Every Trace Uses the Same ID's
+
+	pending = []      # Lines Waiting to be Written
+	write_task = None
+
+
+	# Loads the Tracing Settings
+	# Relative Paths are Relative to the Folder With config.json
+	# Pre-Condition: The Config File Has Been Loaded and Validated
+	def init(config):
+		from Config import Config
+
+		Tracing.enabled = Tracing.SETTINGS_KEY in config
+		if not Tracing.enabled:
+			return
+
+		settings = config[Tracing.SETTINGS_KEY]
+		Tracing.filename = os.path.join(os.path.dirname(os.path.abspath(Config.filename)), settings.get("File", Tracing.DEFAULT_FILE))
+		Tracing.SAMPLE_RATE = float(settings.get("Sample Rate", 0))
+		Tracing.MAX_FILE_SIZE = float(settings.get("Max File Size", 10)) * 1024 * 1024
+		Tracing.BACKUPS = int(settings.get("Backups", 3))
+
+
+
+	# Starts the Root Span of a Polling Cycle
+	# The Trace is Kept if the Cycle Takes Longer Than 'budget' Seconds, or if It's Picked for the Random Sample
+	def cycle(name, budget):
+		if not Tracing.enabled:
+			return NULL_SPAN
+
+		trace = Trace(name, budget)
+		return trace.root
+
+
+
+	# Starts a Child of the Current Span. 'args' are (Name, Value) Pairs Like Metric Labels, Shown With the Span in the Trace Viewer
+	# Use as a Context Manager: with Tracing.span("Name"): ...
+	def span(name, args=()):
+		parent = Tracing.current.get()
+		if parent == None or parent.trace.done:
+			return NULL_SPAN
+
+		return Span(name, parent.trace, dict(args))
+
+
+
+	# Adds Arguments to the Current Span
+	def annotate(**args):
+		parent = Tracing.current.get()
+		if parent != None:
+			parent.args.update(args)
+
+
+
+	# Waits Until Every Kept Trace Has Been Written
+	async def flush():
+		while Tracing.write_task != None and not Tracing.write_task.done():
+			await asyncio.shield(Tracing.write_task)
+
+
+
+	# Queues a Finished Trace for Writing
+	def write(trace):
+		Tracing.pending += trace.events()
+		if Tracing.write_task == None or Tracing.write_task.done():
+			Tracing.write_task = asyncio.get_running_loop().create_task(Tracing.__writer())
+
+
+
+	# Appends Queued Lines to the Trace File (in a Worker Thread) Until There are None Left
+	# Tracing Must Never Break Polling, so Write Errors are Ignored
+	async def __writer():
+		while len(Tracing.pending):
+			lines, Tracing.pending = Tracing.pending, []
+			try:
+				await asyncio.get_running_loop().run_in_executor(None, Tracing.__append, lines)
+			except OSError:
+				pass
+
+
+
+	# Writes Lines to the Trace File, Rotating it First if It's Full
+	def __append(lines):
+		if os.path.exists(Tracing.filename) and os.path.getsize(Tracing.filename) >= Tracing.MAX_FILE_SIZE:
+			for index in range(Tracing.BACKUPS - 1, 0, -1):
+				if os.path.exists(Tracing.filename + "." + str(index)):
+					os.replace(Tracing.filename + "." + str(index), Tracing.filename + "." + str(index + 1))
+
+			if Tracing.BACKUPS > 0:
+				os.replace(Tracing.filename, Tracing.filename + ".1")
+			else:
+				os.remove(Tracing.filename)
+
+		with open(Tracing.filename, 'a') as file:
+			file.write("".join([line + "\n" for line in lines]))
+
+
+
+# The Spans Recorded for One Polling Cycle
+class Trace():
+
+	def __init__(self, name, budget):
+		self.id = Tracing.next_id
+		Tracing.next_id += 1
+
+		self.name = name
+		self.budget = budget
+		self.spans = []
+		self.done = False # Tasks Started During the Cycle Can Outlive It. Their Spans are Dropped
+		self.root = Span(name, self, {"budget" : round(budget, 6)}, root=True)
+
+
+
+	# Decides Whether to Keep the Trace Once the Root Span Ends
+	def finish(self):
+		self.done = True
+		duration = self.root.end - self.root.start
+		slow = duration > self.budget
+
+		if slow or random.random() < Tracing.SAMPLE_RATE:
+			self.root.args["slow"] = slow
+			Tracing.write(self)
+
+
+
+	# Converts the Spans to Chrome Trace Events (One JSON String Each)
+	# Spans Tagged With a Batch Get Their Own Track, Since Batches Run at the Same Time and Would Otherwise Overlap
+	def events(self):
+		pid = os.getpid()
+		tracks = {}
+		out = []
+
+		for span in self.spans:
+			track = self.name
+			if "batch" in span.args:
+				track = self.name + " / " + str(span.args.get("endpoint", "")) + " Batch " + str(span.args["batch"])
+			tid = tracks[track] = Tracing.tracks.setdefault(track, len(Tracing.tracks) + 1)
+
+			args = dict(span.args)
+			args["trace"] = self.id
+			out.append(json.dumps({"name" : span.name, "cat" : self.name, "ph" : "X", "ts" : int(span.start * 1e6), "dur" : int((span.end - span.start) * 1e6), "pid" : pid, "tid" : tid, "args" : args}, default=str))
+
+		# Name the Tracks
+		for track, tid in tracks.items():
+			out.append(json.dumps({"name" : "thread_name", "ph" : "M", "pid" : pid, "tid" : tid, "args" : {"name" : track}}))
+
+		return out
+
+
+
+# A Timed Section of a Cycle
+class Span():
+
+	def __init__(self, name, trace, args, root=False):
+		self.name = name
+		self.trace = trace
+		self.args = args
+		self.root = root
+
+
+
+	def __enter__(self):
+		self.start = time.time()
+		self.token = Tracing.current.set(self)
+		return self
+
+
+
+	def __exit__(self, exc_type, exc, tb):
+		self.end = time.time()
+		Tracing.current.reset(self.token)
+
+		if exc_type != None:
+			self.args["error"] = exc_type.__name__
+		if not self.trace.done:
+			self.trace.spans.append(self)
+
+		if self.root:
+			self.trace.finish()
+
+
+
+# Stands in for a Span When Nothing is Being Traced
+class NullSpan():
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		pass
+
+
+
+NULL_SPAN = NullSpan()
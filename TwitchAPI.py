@@ -1,75 +1,105 @@
 import concurrent.futures._base
-from Config import Config
+from Tracing import Tracing
+from Metrics import Metrics
 from Exceptions import *
+import hashlib
 import aiohttp
 import asyncio
+import json
 import time
 
 
 # A Class For Interacting With the Twitch API
 class TwitchAPI():
 
+	# Default Endpoints (Can Be Overridden in the Config File)
+	API_URL  = "https://api.twitch.tv/helix/"
+	AUTH_URL = "https://id.twitch.tv/oauth2/"
+
+	# Endpoint and Query Parameter for Each Request Type
+	REQUEST_PARAMS = {
+		"Channel" : ("channels", "broadcaster_id"),
+		"Stream"  : ("streams", "user_id")
+	}
+
+	# Polled Batches Whose Body Hasn't Changed Since the Last Cycle Aren't Decoded Again
+	# A Missing /streams Row Means the Streamer Went Offline, so Those Rows are Kept and Reused
+	# Unchanged /channels Batches are Left Out of the Output Instead. Use recheck() to Have One Decoded Again
+	REUSE_ROWS = {"Channel" : False, "Stream" : True}
+	bodies = {"Channel" : {}, "Stream" : {}} # Request Type -> {URL -> (Body Digest, Rows or None)}. Only Holds Last Cycle's URL's
+	rechecked = {"Channel" : set(), "Stream" : set()} # Request Type -> URL's recheck() Cleared While That Type's Poll Was in Flight
+
+
 	# Initialize Module
 	# Pre-Condition: The Config File Has Been Loaded and Validated
 	def init(config):
 
-		# OAuth Token Variables
-		TwitchAPI.reload_token = 0
-		TwitchAPI.auth_dict = None
+		# Load App Credentials. Each Gets Its Own Token and Rate-Limit Budget
+		TwitchAPI.credentials = []
+		if "Client ID" in config["Twitch Settings"]:
+			TwitchAPI.credentials.append( Credential(config["Twitch Settings"]["Client ID"], config["Twitch Settings"]["Secret"], len(TwitchAPI.credentials)) )
+		for credential in config["Twitch Settings"].get("Credentials", []):
+			TwitchAPI.credentials.append( Credential(credential["Client ID"], credential["Secret"], len(TwitchAPI.credentials)) )
 		
 		# Load Constants
-		TwitchAPI.CLIENT_ID = config["Twitch Settings"]["Client ID"]
-		TwitchAPI.SECRET = config["Twitch Settings"]["Secret"]
+		TwitchAPI.CLIENT_ID = TwitchAPI.credentials[0].client_id
 		TwitchAPI.RECONNECT_ATTEMPTS = config["Twitch Settings"]["Reconnect Attempts"]
 		TwitchAPI.RECONNECT_COOLDOWN = config["Twitch Settings"]["Reconnect Cooldown"]
 
+		# Load Endpoint Overrides (Used for Testing Against a Local Server)
+		TwitchAPI.API_URL  = config["Twitch Settings"].get("API URL",  TwitchAPI.API_URL)
+		TwitchAPI.AUTH_URL = config["Twitch Settings"].get("Auth URL", TwitchAPI.AUTH_URL)
+
 		# Start requests session
 		client_timeout = aiohttp.ClientTimeout(total=10)
 		TwitchAPI.requests = aiohttp.ClientSession(timeout=client_timeout)
 
+		Metrics.collect("TwitchAPI", TwitchAPI.__metrics)
 
 
-	# Generates A Dictionary of Lists With Strings of Request URL's to Feed to get_response()
+
+	# Generates the Request Batches for Every Streamer and Exposes Their URL's to get_response()
+	# The Batches are Patched in Place Afterwards (See add_streamer() and remove_streamer())
 	# Pre-Condition: The Streamer Dictionary Has Been Populated
-	# Post-Condition: URL_STRINGS Dictionary Has Been Filled
+	# Post-Condition: The batches and URL_STRINGS Dictionaries Have Been Filled
 	def url_string_gen(streamer_dict):
+		ids = list(streamer_dict.keys())
+
+		TwitchAPI.batches = {
+			"Channel" : Batches("Channel", ids),
+			"Stream" : Batches("Stream", ids)
+		}
+
+		# These are the Same List Objects the Batches Patch, so They Never Go Stale
+		TwitchAPI.URL_STRINGS = {
+			"Channel" : TwitchAPI.batches["Channel"].urls,
+			"Stream" : TwitchAPI.batches["Stream"].urls
+		}
 
-		channel_out = []
-		stream_out = []
-		
-		# Determine How Many API Calls Need to Be Made
-		# Twitch Limits Calls to 100 Users Each
-		streamers = list(streamer_dict.keys())
-		iterations = len(streamers) // 100 + (1 if len(streamers) % 100 > 0 else 0)
 
-		i = 0
-		while i < iterations:
-			i += 1
 
-			# Split The Array Into 100-User Segments
-			subarray = streamers[ (i-1)*100 : i*100 ]
+	# Adds a Streamer to the Request Batches. Live Streamers Don't Need Channel Requests
+	def add_streamer(user_id, is_live=False):
+		TwitchAPI.batches["Stream"].add(user_id)
+		if not is_live:
+			TwitchAPI.batches["Channel"].add(user_id)
 
-			# Generate the URL String
-			channel_url = "https://api.twitch.tv/helix/channels?"
-			stream_url  = "https://api.twitch.tv/helix/streams?"
-			for broadcaster in subarray:
-				channel_url += "&broadcaster_id=" + str(streamer_dict[broadcaster].id)
-				stream_url  += "&user_id=" + str(streamer_dict[broadcaster].id)
-			
-			# Add the String of ID's to their respective Lists
-			channel_out.append(channel_url.replace("&", "", 1))
-			stream_out.append(stream_url.replace("&", "", 1))
 
-			TwitchAPI.URL_STRINGS = {
-				"Channel" : channel_out,
-				"Stream" : stream_out
-			}
+
+	# Removes a Streamer From the Request Batches
+	def remove_streamer(user_id):
+		TwitchAPI.batches["Stream"].remove(user_id)
+		TwitchAPI.batches["Channel"].remove(user_id)
 
 
 
 	# Gets the OAuth token from Twitch and Allows the Program to Test the Internet Connection
+	# Refreshes the First Credential Unless Another One is Given
 	# Post-Condition: A Dictionary with the OAuth Information Has Been Created
-	async def get_token(initializing=False):
+	async def get_token(initializing=False, credential=None):
+
+		if credential == None:
+			credential = TwitchAPI.credentials[0]
 
 		# A negative reconnect limit denotes infinite attempts
 		no_reconnect_limit = TwitchAPI.RECONNECT_ATTEMPTS < 0 
@@ -82,9 +112,9 @@ class TwitchAPI():
 					await asyncio.sleep(TwitchAPI.RECONNECT_COOLDOWN)
 
 				# Make Request
-				request_body = ("https://id.twitch.tv/oauth2/token?" +
-							    "client_id=" + TwitchAPI.CLIENT_ID + 
-								"&client_secret=" + TwitchAPI.SECRET + 
+				request_body = (TwitchAPI.AUTH_URL + "token?" +
+							    "client_id=" + credential.client_id + 
+								"&client_secret=" + credential.secret + 
 								"&grant_type=client_credentials")
 				token = await TwitchAPI.requests.post(request_body, headers=None)
 
@@ -95,17 +125,23 @@ class TwitchAPI():
 				# Extract token and expiration time
 				token_json = await token.json_safe()
 				oauth_token = token_json["access_token"]
-				TwitchAPI.reload_token = time.time() + int(token_json["expires_in"]) - 3600
+				credential.reload_token = time.time() + int(token_json["expires_in"]) - 3600
 
 			# Handle Exceptions
-			except (KeyboardInterrupt, GeneratorExit, BadResponseCodeError, KeyError):
+			except (KeyboardInterrupt, GeneratorExit):
+				raise
+			except (BadResponseCodeError, KeyError):
+				Metrics.inc("fta_twitch_token_refreshes_total", (("result", "failure"),))
 				raise
 			except:
+				Metrics.inc("fta_twitch_token_refreshes_total", (("result", "failure"),))
 				attempts -= int(not no_reconnect_limit)
 			else:
+				Metrics.inc("fta_twitch_token_refreshes_total", (("result", "success"),))
+
 				# Generate Credential Dict.
-				TwitchAPI.auth_dict = {
-					'Client-ID' : TwitchAPI.CLIENT_ID,
+				credential.auth_dict = {
+					'Client-ID' : credential.client_id,
 					'Authorization' : 'Bearer ' + oauth_token
 				}
 				break
@@ -115,85 +151,464 @@ class TwitchAPI():
 
 
 	# Calls the Twitch API for Up-To-Date Streamer Information
+	# By Default Every Precomputed URL is Requested and Unchanged Batches are Skipped (See REUSE_ROWS)
+	# Pass 'url_strings' to Request a Different Set of Batches. Every One of Those is Decoded
 	# Pre-Condition: THe Streamer Dictionary Has Been Initialized
-	# Post-Condition: Data Has Been Received, Validated, and Stored in Output Dictionaries
-	async def get_response(streamer_dict):
+	# Post-Condition: Data Has Been Received, Validated, and Stored in Output Dictionaries (One per Request Type)
+	async def get_response(streamer_dict, req_types=("Channel", "Stream"), url_strings=None):
+
+		polling = (url_strings == None)
+		if polling:
+			url_strings = TwitchAPI.URL_STRINGS
+			for req_type in req_types:
+				TwitchAPI.rechecked[req_type] = set()
 		
-		# Reload OAuth Token if Necessary
-		if time.time() > TwitchAPI.reload_token:
-			await TwitchAPI.get_token(True)
+		# Reload OAuth Tokens if Necessary
+		with Tracing.span("Refresh Tokens"):
+			await TwitchAPI.refresh_tokens()
 
 		# Generate Coroutines Array for Requests
+		# The Batches May be Patched While We Wait, so Remember How Many URL's Each Type Had
 		coros = []
-		for req_type in ["Channel", "Stream"]:
-			coros += [TwitchAPI.requests.get(url, headers=TwitchAPI.auth_dict) for url in TwitchAPI.URL_STRINGS[req_type]]
+		counts = []
+		urls = []
+		labels = [] # Metric Labels (and Trace Arguments) for Each Batch
+		for req_type in req_types:
+			endpoint = ("endpoint", TwitchAPI.REQUEST_PARAMS[req_type][0])
+			for index, url in enumerate(url_strings[req_type]):
+				urls.append(url)
+				labels.append((endpoint, ("batch", index)))
+				coros.append(TwitchAPI.__request(url, labels[-1]))
+			counts.append(len(url_strings[req_type]))
 
 		# Call the Twitch API
 		try:
-			responses = await asyncio.gather(*coros, return_exceptions=False)
+			with Tracing.span("Helix Requests", (("batches", len(coros)),)):
+				responses = await asyncio.gather(*coros, return_exceptions=False)
 		except (KeyboardInterrupt, GeneratorExit):
 			raise
 		except BaseException as exception:
 			raise RequestsError(exception)
 
 		# Split the Response List and Check Individual Responses
-		split_responses = [responses[:int(len(responses)/2)], responses[int(len(responses)/2):]]
-		out = [{}, {}]
-
+		out = []
 		coros = []
-		for index, req_type in enumerate(["Channel", "Stream"]):
-			coros += [TwitchAPI.__check_response(streamer_dict, out[index], response, req_type) for response in split_responses[index]]
-		await asyncio.gather(*coros, return_exceptions=False)
-		
+		start = 0
+		bodies = {}
+		for req_type, count in zip(req_types, counts):
+			out.append({})
+			end = start + count
+
+			# Each Cycle Starts a New Body Cache so URL's of Batches That Were Patched Don't Pile Up
+			cache = None
+			if polling:
+				cache = (TwitchAPI.bodies[req_type], bodies.setdefault(req_type, {}))
+
+			coros += [TwitchAPI.__check_response(streamer_dict, out[-1], response, req_type, labels[index], urls[index], cache) for index, response in enumerate(responses[start:end], start)]
+			start = end
+
+		with Tracing.span("Check Responses"):
+			await asyncio.gather(*coros, return_exceptions=False)
+
+		# A Response Requested Before recheck() Was Called Can't Be Trusted, so Don't Store It
+		for req_type in bodies:
+			for url in TwitchAPI.rechecked[req_type]:
+				bodies[req_type].pop(url, None)
+
+		TwitchAPI.bodies.update(bodies)
+		return out
+
+
+
+	# Makes the Next Polling Cycle Decode the Batch Holding 'user_id' Even if Its Body Hasn't Changed
+	# Used for Changes That Couldn't be Applied Yet, Since Unchanged /channels Batches Aren't Returned
+	# If That Batch is Being Polled Right Now, the Response in Flight Isn't Stored Either
+	def recheck(req_type, user_id):
+		batches = TwitchAPI.batches[req_type]
+		if user_id in batches.location:
+			url = batches.urls[batches.location[user_id]]
+			TwitchAPI.bodies[req_type].pop(url, None)
+			TwitchAPI.rechecked[req_type].add(url)
+
+
+
+	# Refreshes Every Expired Token
+	# A Credential That Fails is Benched Until the Reconnect Cooldown Passes, as Long as Another Credential Still Works
+	# Post-Condition: At Least One Credential Has a Valid Token or an Error Was Raised
+	async def refresh_tokens():
+		now = time.time()
+		expired = [c for c in TwitchAPI.credentials if now > c.reload_token and now >= c.retry_at]
+		if not len(expired):
+			return
+
+		results = await asyncio.gather(*[TwitchAPI.get_token(True, c) for c in expired], return_exceptions=True)
+
+		errors = []
+		for credential, result in zip(expired, results):
+			if isinstance(result, (KeyboardInterrupt, GeneratorExit)):
+				raise result
+			elif isinstance(result, BaseException):
+				credential.bench(now + TwitchAPI.RECONNECT_COOLDOWN)
+				errors.append(result)
+
+		# Only Fail the Cycle if No Credential is Left
+		if len(errors):
+			if not len([c for c in TwitchAPI.credentials if c.usable()]):
+				raise errors[0]
+
+			from Logger import Log
+			Log.logger.warning(str(len(errors)) + " Twitch Credential(s) Failed to Get a Token. Their Requests Will Use the Other Credentials")
+
+
+
+	# Returns the Usable Credential With the Most Rate-Limit Budget Left
+	def __pick_credential():
+		usable = [c for c in TwitchAPI.credentials if c.usable()]
+		if not len(usable):
+			return TwitchAPI.credentials[0]
+
+		return max(usable, key=lambda c: c.governor.available())
+
+
+
+	# Returns the Combined Rate Limit (Points per Minute) of Every Usable Credential
+	def rate_limit():
+		usable = [c for c in TwitchAPI.credentials if c.usable()]
+		return sum([c.governor.limit for c in (usable if len(usable) else TwitchAPI.credentials)])
+
+
+
+	# Returns the Rate-Limit Budget Left for Each Credential, and Whether It's Being Throttled, for the Metrics Endpoint
+	def __metrics():
+		out = []
+		for credential in TwitchAPI.credentials:
+			out.append(("fta_helix_ratelimit_remaining", credential.governor.labels, max(0, int(credential.governor.available()))))
+			out.append(("fta_helix_throttling", credential.governor.labels, credential.governor.throttling))
 		return out
 
 
 
+	# Helper Function For get_response(). Makes a Single Helix Request Once a Credential's Governor Allows It
+	# 429's are Retried After Waiting Out the Limit Instead of Being Passed to the Error Handler
+	# With Several Credentials, Batches Go to Whichever Has the Most Budget, and Rejected Tokens Fail Over to the Others
+	# Latency is Recorded Under 'labels', Not Counting Time Spent Waiting for the Governor
+	async def __request(url, labels=()):
+		with Tracing.span("Helix Request", labels):
+			for attempt in range(Governor.MAX_RETRIES + 1):
+				credential = TwitchAPI.__pick_credential()
+				with Tracing.span("Governor Wait", labels):
+					await credential.governor.acquire()
+
+				sent = time.time()
+				response = await TwitchAPI.requests.get(url, headers=credential.auth_dict)
+				Metrics.observe("fta_helix_request_seconds", time.time() - sent, labels)
+				Tracing.annotate(status=response.status, attempts=attempt + 1)
+				credential.governor.update(response.headers)
+
+				# Token Was Rejected. Get a New One Next Cycle and Send This Batch Through Another Credential
+				if response.status == 401 and len([c for c in TwitchAPI.credentials if c.usable()]) > 1:
+					credential.bench(0)
+					response.release()
+					continue
+
+				if response.status != 429:
+					break
+
+				credential.governor.penalize(response.headers)
+				response.release()
+
+		return response
+
+
+
 	# Helper Function For get_response(). Validates an Individual Response and Adds Data to data_dict if Valid
+	# 'cache' is (Last Cycle's Bodies, This Cycle's Bodies) for the Request Type, or None to Always Decode
 	# Pre-Condition: get_response() Received Responses from Twitch
 	# Post-Condition: Valid Data Has Been Added to data_dict or an Error Was Raised
-	async def __check_response(streamer_dict, data_dict, response, resp_type):
+	async def __check_response(streamer_dict, data_dict, response, resp_type, labels=(), url=None, cache=None):
 		
 		# Check Response Code
 		if response.status // 100 != 2:
 			raise BadResponseCodeError(response)
 
+		# Skip Decoding if the Body is Byte-for-Byte the Same as Last Cycle
+		body = await response.read_safe()
+		if cache != None:
+			digest = hashlib.blake2b(body, digest_size=16).digest()
+			previous = cache[0].get(url)
+
+			if previous != None and previous[0] == digest:
+				cache[1][url] = previous
+				Metrics.inc("fta_helix_unchanged_batches_total", labels[:1])
+				if previous[1] != None:
+					data_dict.update(previous[1])
+				return
+
 		# Get JSON
-		resp_json = await response.json_safe()
+		with Tracing.span("Decode JSON", labels):
+			resp_json = json.loads(body)
 
-		try:
-			# Iterate Over Response JSON
-			for dictionary in resp_json["data"]:
+		with Tracing.span("Check Batch", labels):
+			rows = {}
+			try:
+				# Iterate Over Response JSON
+				name_key = "broadcaster_name" if resp_type == "Channel" else "user_name"
+				id_key   = "broadcaster_id"   if resp_type == "Channel" else "user_id"
+
+				for dictionary in resp_json["data"]:
 							
-				# Get Streamer's Display Name and ID
-				name = dictionary["broadcaster_name" if resp_type == "Channel" else "user_name"]
-				id   = dictionary["broadcaster_id"   if resp_type == "Channel" else "user_id"]
+					# Get Streamer's Display Name and ID
+					name = dictionary[name_key]
+					id   = dictionary[id_key]
+
+					# Skip Streamers That Were Removed While We Waited
+					if id not in streamer_dict:
+						continue
 						
-				# Update the Username if Necessary
-				# If a streamer's display name has changed, update it
-				if name not in streamer_dict:
-								
-					# Search the dict by user id
-					for streamer in streamer_dict:
-											
-						# If the id's match, change the key name and Streamer.name
-						# Also Update the Config File
-						if streamer_dict[streamer].id == id:
-							await Config.update_username(streamer, name)
-
-							streamer_dict[name] = streamer_dict[streamer]
-							del streamer_dict[streamer]
-												
-							streamer_dict[name].name = name
-							break
+					# Update the Username if Necessary
+					# If a streamer's display name has changed, update it (and the Config File)
+					if streamer_dict[id].name != name:
+						await streamer_dict[id].rename(name)
 				
-				# Add the Streamer to the Output Dict.
-				data_dict[name] = dict(dictionary)
+					# Add the Streamer to the Output Dict.
+					# The Decoded Row Isn't Used Anywhere Else, so It's Stored Without Copying
+					rows[id] = dictionary
+
+			except (KeyboardInterrupt, GeneratorExit):
+				raise
+			except BaseException as err:
+				raise MalformedResponseError(response, err)
+
+			data_dict.update(rows)
+			if cache != None:
+				cache[1][url] = (digest, rows if TwitchAPI.REUSE_ROWS[resp_type] else None)
+
+
+
+# A Token Bucket That Mirrors Twitch's Rate Limit Using the Ratelimit-* Response Headers
+# Requests Wait for a Token Instead of Hitting a 429, so Running Out of Budget Just Slows the Refresh Rate Down
+class Governor():
+
+	DEFAULT_LIMIT = 800 # Points per Minute for an App Access Token
+	REFILL_PERIOD = 60  # Seconds for an Empty Bucket to Refill
+	MAX_RETRIES = 3     # Attempts to Retry a Request After a 429
+
+
+	# Throttle Waits and 429's are Counted in Metrics Under 'labels'
+	def __init__(self, labels=()):
+		self.limit = Governor.DEFAULT_LIMIT
+		self.refill_rate = self.limit / Governor.REFILL_PERIOD
+		self.tokens = float(self.limit)
+		self.updated = time.time()
+		self.reset = 0
+
+		self.labels = labels
+		self.throttling = False
+
+
+
+	# Adds the Tokens That Have Refilled Since the Last Call
+	def __refill(self):
+		now = time.time()
+		self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.refill_rate)
+		self.updated = now
 
-		except (KeyboardInterrupt, GeneratorExit):
-			raise
-		except BaseException as err:
-			raise MalformedResponseError(response, err)
+
+
+	# Takes a Token, Waiting Until One Refills if the Bucket is Empty
+	# Tokens Can Go Negative, Which Queues Concurrent Callers Behind Each Other at the Refill Rate
+	async def acquire(self):
+		self.__refill()
+		self.tokens -= 1
+
+		if self.tokens < 0:
+			wait = -self.tokens / self.refill_rate
+			Metrics.inc("fta_helix_throttle_waits_total", self.labels)
+			Metrics.inc("fta_helix_throttled_seconds_total", self.labels, wait)
+			self.__log_throttle(True)
+			await asyncio.sleep(wait)
+
+		else:
+			self.__log_throttle(False)
+
+
+
+	# Logs When Throttling Starts and Stops (Not Every Throttled Request)
+	def __log_throttle(self, throttling):
+		if throttling == self.throttling:
+			return
+		self.throttling = throttling
+
+		from Logger import Log
+		if Log.logger == None:
+			return
+
+		if throttling:
+			Log.logger.warning("Helix Rate Limit Budget Exhausted. Slowing Requests to " + str(round(self.refill_rate, 2)) + " per Second")
+		else:
+			Log.logger.info("Helix Rate Limit Budget Recovered")
+
+
+
+	# Syncs the Bucket With the Budget Twitch Reports
+	def update(self, headers):
+		try:
+			limit = int(headers["Ratelimit-Limit"])
+			remaining = int(headers["Ratelimit-Remaining"])
+			reset = float(headers["Ratelimit-Reset"])
+		except (KeyError, ValueError):
+			return
+
+		self.__refill()
+		self.limit = limit
+		self.reset = reset
+		self.refill_rate = limit / Governor.REFILL_PERIOD
+
+		# Never Assume We Have More Than Twitch Says We Do
+		# Our Count Might Be Lower Because of Requests That Are Still in Flight
+		self.tokens = min(self.tokens, remaining)
+
+
+
+	# Empties the Bucket After a 429 so the Next Request Waits for a Refill
+	def penalize(self, headers):
+		Metrics.inc("fta_helix_rate_limited_total", self.labels)
+		self.update(headers)
+		self.tokens = min(self.tokens, 0)
+
+
+
+	# Returns the Number of Tokens in the Bucket Without Taking One
+	def available(self):
+		self.__refill()
+		return self.tokens
+
+
+
+# Request URL's for One Request Type, Split Into Batches of up to 100 User ID's
+# Adding or Removing a Streamer Only Rebuilds the URL of the Batch It Lives In
+class Batches():
+
+	BATCH_SIZE = 100 # Twitch Limits Calls to 100 Users Each
+
+
+	def __init__(self, req_type, ids=()):
+		self.endpoint, self.param = TwitchAPI.REQUEST_PARAMS[req_type]
+
+		self.batches = []  # Lists of User ID's
+		self.urls = []     # One URL per Batch
+		self.location = {} # User ID -> Batch Index
+		self.open = set()  # Indexes of Batches With Room Left
+
+		# Fill the Batches in Order
+		ids = list(ids)
+		for i in range(0, len(ids), Batches.BATCH_SIZE):
+			self.batches.append(ids[i : i+Batches.BATCH_SIZE])
+			self.urls.append(None)
+
+			index = len(self.batches) - 1
+			for user_id in self.batches[index]:
+				self.location[user_id] = index
+			self.__rebuild(index)
+
+
+
+	def __len__(self):
+		return len(self.location)
+
+
+
+	# Regenerates the URL for a Single Batch
+	def __rebuild(self, index):
+		batch = self.batches[index]
+		self.urls[index] = TwitchAPI.API_URL + self.endpoint + "?" + "&".join([self.param + "=" + str(user_id) for user_id in batch])
+
+		if len(batch) < Batches.BATCH_SIZE:
+			self.open.add(index)
+		else:
+			self.open.discard(index)
+
+
+
+	# Adds a User ID to a Batch With Room Left, or Starts a New Batch
+	def add(self, user_id):
+		if user_id in self.location:
+			return
+
+		if len(self.open):
+			index = max(self.open)
+		else:
+			self.batches.append([])
+			self.urls.append(None)
+			index = len(self.batches) - 1
+
+		self.batches[index].append(user_id)
+		self.location[user_id] = index
+
+		# Appending Only Needs One Copy of the Existing URL
+		if len(self.batches[index]) > 1:
+			self.urls[index] += "&" + self.param + "=" + str(user_id)
+			if len(self.batches[index]) >= Batches.BATCH_SIZE:
+				self.open.discard(index)
+		else:
+			self.__rebuild(index)
+
+
+
+	# Removes a User ID From Its Batch
+	# Empty Batches are Replaced by the Last Batch so the URL List Never Has Gaps
+	def remove(self, user_id):
+		if user_id not in self.location:
+			return
+
+		index = self.location.pop(user_id)
+		self.batches[index].remove(user_id)
+
+		if len(self.batches[index]):
+			self.__rebuild(index)
+			return
+
+		# Move the Last Batch Into the Empty Slot
+		last = len(self.batches) - 1
+		self.open.discard(last)
+		if index != last:
+			self.batches[index] = self.batches[last]
+			self.urls[index] = self.urls[last]
+			for moved_id in self.batches[index]:
+				self.location[moved_id] = index
+			self.__rebuild(index)
+
+		self.batches.pop()
+		self.urls.pop()
+
+
+
+# A Single Client ID/Secret Pair With Its Own OAuth Token and Rate-Limit Budget
+class Credential():
+
+	# 'index' is the Credential's Position in the Config, Used as Its Metrics Label
+	def __init__(self, client_id, secret, index=0):
+		self.client_id = client_id
+		self.secret = secret
+
+		self.auth_dict = None
+		self.reload_token = 0
+		self.retry_at = 0
+		self.governor = Governor((("credential", index),))
+
+
+
+	# Returns True if the Credential Has a Token We Can Use
+	def usable(self):
+		return self.auth_dict != None
+
+
+
+	# Drops the Token so No New Requests Use It. A New Token is Requested After 'retry_at'
+	def bench(self, retry_at):
+		self.auth_dict = None
+		self.reload_token = 0
+		self.retry_at = retry_at
 
 
 
@@ -205,4 +620,13 @@ async def json_safe(resp: ClientResponse):
 		raise RequestsError(err)
 	except: raise
 
-ClientResponse.json_safe = json_safe
\ No newline at end of file
+async def read_safe(resp: ClientResponse):
+	try: return await resp.read()
+
+	# Wraps Timeout Error in Request Error
+	except concurrent.futures._base.TimeoutError as err:
+		raise RequestsError(err)
+	except: raise
+
+ClientResponse.json_safe = json_safe
+ClientResponse.read_safe = read_safe
\ No newline at end of file
@@ -0,0 +1,267 @@
+import subprocess
+import tempfile
+import argparse
+import asyncio
+import aiohttp
+import random
+import socket
+import json
+import math
+import time
+import sys
+import os
+
+# Make the Main Program Importable From the Utils Folder
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+
+# End-to-End Detection-Latency Benchmark
+# Runs Main.init()/Main.poll() Against the Local Stand-In Server in mock_twitch.py, Flips Streamers Live, and Measures
+# the Time Between the State Change on the Server and the Alert Arriving at the Stand-In Webhook Targets
+#
+# Every Watchlist Size Gets a Fresh Server Process and a Fresh Client Process, so Module State Never Leaks Between Runs
+
+
+
+# Returns the Nearest-Rank Percentile of a Sorted List
+def percentile(values, pct):
+	if not len(values):
+		return None
+	return values[ max(0, math.ceil(pct / 100.0 * len(values)) - 1) ]
+
+
+
+# Returns an Unused Local Port
+def free_port():
+	sock = socket.socket()
+	sock.bind(("127.0.0.1", 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	return port
+
+
+
+# Generates a config.json for the Client That Points Every Endpoint at the Stand-In Server
+def make_config(args, base_url, log_path):
+	config = {
+		"Twitch Settings" : {
+			"Client ID" : "mock",
+			"Secret" : "mock",
+			"Reconnect Attempts" : 3,
+			"Reconnect Cooldown" : 1,
+			"Refresh Rate" : args.refresh_rate,
+			"API URL" : base_url + "/helix/",
+			"Auth URL" : base_url + "/oauth2/"
+		},
+		"Logger Settings" : {
+			"Log Level" : "WARNING",
+			"Log Filepath" : log_path
+		},
+		"Streamers" : {}
+	}
+
+	# Both Plugins Expect Their Settings to Exist, so Untested Targets Just Have Their Alerts Disabled
+	config["Discord Settings"] = {
+		"Alerts" : "live" if "discord" in args.targets else "none",
+		"Webhook URL" : base_url + "/webhook/benchmark",
+		"Message Text" : "{name}|{message}"
+	}
+	config["Pushover Settings"] = {
+		"Alerts" : "live" if "pushover" in args.targets else "none",
+		"API Token" : "mock",
+		"Group Key" : "mock",
+		"Message Text" : "{name}|{message}",
+		"API URL" : base_url + "/1/messages.json"
+	}
+
+	for i in range(args.client):
+		config["Streamers"]["streamer_" + str(i)] = {
+			"Ban Status" : False,
+			"User ID" : str(args.first_id + i)
+		}
+
+	return config
+
+
+
+# Matches Each Delivery to the Scripted Event That Caused It and Computes Latency Statistics
+def summarize(events, deliveries, targets):
+	went_live = dict([(event["name"], event["time"]) for event in events if event["op"] == "live"])
+	out = {"events" : len(went_live)}
+
+	for target in targets:
+		latencies = []
+		received = [d for d in deliveries if d["target"] == target]
+
+		for delivery in received:
+			text = delivery["body"].get("content" if target == "discord" else "message", "")
+			name, _, message = str(text).partition("|")
+
+			if message == "live" and name in went_live:
+				latencies.append(delivery["time"] - went_live.pop(name))
+
+		latencies.sort()
+		span = (max(d["time"] for d in received) - min(e["time"] for e in events)) if len(received) and len(events) else 0
+		out[target] = {
+			"delivered" : len(latencies),
+			"p50" : percentile(latencies, 50),
+			"p95" : percentile(latencies, 95),
+			"p99" : percentile(latencies, 99),
+			"alerts_per_sec" : (len(received) / span) if span > 0 else None
+		}
+
+		# Reset So the Next Target is Matched Against Every Event Again
+		went_live = dict([(event["name"], event["time"]) for event in events if event["op"] == "live"])
+
+	return out
+
+
+
+# Runs the Real Program Against the Stand-In Server (Executed in a Child Process)
+async def run_client(args):
+	import Main
+	from Notifications import Notifications
+	from Config import Config
+
+	base_url = "http://127.0.0.1:" + str(args.port)
+	workdir = tempfile.mkdtemp(prefix="fta_bench_")
+
+	# Point the Config Module at a Generated Config File
+	Config.filename = os.path.join(workdir, "config.json")
+	with open(Config.filename, "w") as file:
+		json.dump(make_config(args, base_url, os.path.join(workdir, "bench.log")), file)
+
+	# Initialize Exactly Like Main.main() Does
+	init_start = time.time()
+	Notifications.Handler.start(asyncio.get_running_loop())
+	await Main.init()
+	init_time = time.time() - init_start
+
+	poll = asyncio.get_running_loop().create_task(Main.poll())
+	await asyncio.sleep(args.warmup)
+
+	# Script the Go-Live Events, Spread Evenly Over the Test Duration
+	event_count = min(args.events, args.client)
+	chosen = random.sample(range(args.client), event_count)
+	start = time.time() + 0.5
+	actions = [{
+		"at" : start + args.duration * k / max(1, event_count),
+		"op" : "live",
+		"ids" : [str(args.first_id + index)]
+	} for k, index in enumerate(chosen)]
+
+	expected = event_count * len(args.targets)
+	async with aiohttp.ClientSession() as session:
+		await session.post(base_url + "/mock/schedule", json={"actions" : actions})
+
+		# Wait for Every Alert to Arrive (or Give Up)
+		deadline = start + args.duration + args.timeout
+		deliveries = []
+		while time.time() < deadline and not poll.done():
+			await asyncio.sleep(0.25)
+			async with session.get(base_url + "/mock/deliveries") as resp:
+				deliveries = (await resp.json())["deliveries"]
+			if len(deliveries) >= expected:
+				break
+
+		async with session.get(base_url + "/mock/events") as resp:
+			body = await resp.json()
+
+	# Surface Errors From the Poll Loop
+	error = None
+	if poll.done() and poll.exception():
+		error = repr(poll.exception())
+	poll.cancel()
+	await asyncio.gather(poll, return_exceptions=True)
+	queue = Notifications.Handler.stats()
+	await Main.shutdown()
+
+	result = summarize(body["events"], deliveries, args.targets)
+	result.update({"streamers" : args.client, "init_seconds" : init_time, "requests" : body["requests"], "alert_queue" : queue, "error" : error})
+	return result
+
+
+
+# Starts a Stand-In Server Process and a Client Process for One Watchlist Size
+def run_size(args, size):
+	port = free_port()
+	server = subprocess.Popen(
+		[sys.executable, os.path.join(ROOT_DIR, "Utils", "mock_twitch.py"), "--streamers", str(size), "--first-id", str(args.first_id), "--port", str(port)],
+		stdout=subprocess.DEVNULL
+	)
+
+	try:
+		# Wait for the Server to Accept Connections
+		for _ in range(100):
+			try:
+				socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+				break
+			except OSError:
+				time.sleep(0.1)
+
+		client = subprocess.run(
+			[sys.executable, os.path.abspath(__file__), "--client", str(size), "--port", str(port),
+			 "--refresh-rate", str(args.refresh_rate), "--events", str(args.events), "--duration", str(args.duration),
+			 "--warmup", str(args.warmup), "--timeout", str(args.timeout), "--first-id", str(args.first_id),
+			 "--targets"] + args.targets,
+			capture_output=True, text=True, cwd=ROOT_DIR
+		)
+		lines = client.stdout.strip().splitlines()
+		if client.returncode != 0 or not len(lines):
+			return {"streamers" : size, "error" : client.stderr.strip()[-500:]}
+		return json.loads(lines[-1])
+
+	finally:
+		server.terminate()
+		server.wait()
+
+
+
+# Prints One Row per Watchlist Size and Target
+def report(results, targets):
+	fmt = lambda x: "-" if x == None else ("%.3f" % x)
+
+	print("%10s %10s %10s %10s %10s %10s %12s %10s" % ("streamers", "target", "delivered", "p50 (s)", "p95 (s)", "p99 (s)", "alerts/sec", "init (s)"))
+	for result in results:
+		if result.get("error") and targets[0] not in result:
+			print("%10d  ERROR: %s" % (result["streamers"], result["error"]))
+			continue
+
+		for target in targets:
+			row = result[target]
+			print("%10d %10s %10s %10s %10s %10s %12s %10s" % (
+				result["streamers"], target, str(row["delivered"]) + "/" + str(result["events"]),
+				fmt(row["p50"]), fmt(row["p95"]), fmt(row["p99"]), fmt(row["alerts_per_sec"]), fmt(result["init_seconds"])
+			))
+
+		if result.get("error"):
+			print("%10s  poll loop stopped early: %s" % ("", result["error"]))
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Measure streamer-live -> alert-delivered latency against a local stand-in server")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="Watchlist sizes to test")
+	parser.add_argument("--refresh-rate", type=float, default=2, help="Refresh Rate written into the generated config")
+	parser.add_argument("--events", type=int, default=100, help="Number of streamers flipped live per run")
+	parser.add_argument("--duration", type=float, default=10, help="Seconds over which the go-live events are spread")
+	parser.add_argument("--warmup", type=float, default=2, help="Seconds to poll before the first event")
+	parser.add_argument("--timeout", type=float, default=30, help="Extra seconds to wait for late alerts")
+	parser.add_argument("--targets", nargs="+", default=["discord"], choices=["discord", "pushover"])
+	parser.add_argument("--first-id", type=int, default=1000000)
+	parser.add_argument("--json", action="store_true", help="Print raw JSON results instead of a table")
+
+	# Internal Flags Used for the Client Process
+	parser.add_argument("--client", type=int, default=0, help=argparse.SUPPRESS)
+	parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.client:
+		print(json.dumps(asyncio.run(run_client(args))))
+	else:
+		results = [run_size(args, size) for size in args.sizes]
+		if args.json:
+			print(json.dumps(results, indent="\t"))
+		else:
+			report(results, args.targets)
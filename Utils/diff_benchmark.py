@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import random
+import time
+import sys
+import os
+
+# Make the Main Program Importable From the Utils Folder
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from Notifications import Notifications
+from TwitchAPI import TwitchAPI
+from Streamer import Streamer
+
+
+# Micro-Benchmark for the Per-Cycle State Diff
+# Compares Streamer.apply_streams() and Streamer.apply_channels() Against the Original Per-Streamer Loops (Copied Below)
+# Only the CPU Time Spent Comparing Responses to Stored State is Measured. No Requests are Made
+
+
+
+# The Original Stream Update, Kept Here as a Baseline
+def legacy_streams(streamer_dict, stream_response, timestamp):
+	for user in list(streamer_dict):
+		streamer_dict[user]._Streamer__update_stream(stream_response.get(user), timestamp)
+
+
+
+# The Original Channel Update, Kept Here as a Baseline
+async def legacy_channels(streamer_dict, channel_response, timestamp):
+	coros = [streamer_dict[user]._Streamer__update_channel(channel_response[user], timestamp) for user in channel_response if user in streamer_dict]
+	await asyncio.gather(*coros)
+
+
+
+# Builds a Streamer Dict. Where 'live' of the Streamers are Live, Plus Responses Where 'churn' of the Streamers Changed
+# Changes are Split Between Going Live, Going Offline, and (for Offline Streamers) New Titles
+def build(size, live, churn, seed):
+	rng = random.Random(seed)
+	ids = [str(1000000 + index) for index in range(size)]
+
+	streamer_dict = {}
+	Streamer.names = {}
+	Streamer.live = set()
+	TwitchAPI.url_string_gen(streamer_dict)
+
+	for user in ids:
+		streamer = Streamer("streamer_" + user, user, False)
+		streamer.last_title = "Title " + user
+		streamer.last_game = "Just Chatting"
+		streamer.is_live = rng.random() < live
+
+		streamer_dict[user] = streamer
+		if streamer.is_live:
+			Streamer.live.add(user)
+		TwitchAPI.add_streamer(user, streamer.is_live)
+
+	stream_response = {}
+	channel_response = {}
+	for user in ids:
+		streamer = streamer_dict[user]
+		changed = rng.random() < churn
+		is_live = (not streamer.is_live) if changed and rng.random() < 0.5 else streamer.is_live
+		title = "New Title " + user if changed and not streamer.is_live else streamer.last_title
+
+		if is_live:
+			stream_response[user] = {"title" : title, "game_name" : streamer.last_game, "started_at" : "2021-03-10T15:04:21Z"}
+		if not streamer.is_live:
+			channel_response[user] = {"title" : title, "game_name" : streamer.last_game, "delay" : 0}
+
+	return streamer_dict, stream_response, channel_response
+
+
+
+# Runs One Cycle With Either Implementation on Fresh State
+# Returns the CPU Time Taken, the Resulting State, and the Alerts It Queued
+async def run_cycle(implementation, size, live, churn, seed):
+	streamer_dict, stream_response, channel_response = build(size, live, churn, seed)
+	timestamp = time.time() + 2 * Notifications.LIVE_COOLDOWN
+	Notifications.Handler.queue = asyncio.Queue()
+
+	start = time.process_time()
+	if implementation == "legacy":
+		legacy_streams(streamer_dict, stream_response, timestamp)
+		await legacy_channels(streamer_dict, channel_response, timestamp)
+	else:
+		Streamer.apply_streams(streamer_dict, stream_response, timestamp)
+		await Streamer.apply_channels(streamer_dict, channel_response, timestamp)
+	elapsed = time.process_time() - start
+
+	state = sorted([(user, s.is_live, s.last_title, s.last_game) for user, s in streamer_dict.items()])
+	alerts = []
+	while not Notifications.Handler.queue.empty():
+		alerts.append(Notifications.Handler.queue.get_nowait()[1:3])
+
+	return elapsed, state, sorted(alerts)
+
+
+
+async def main(args):
+	Notifications.LIVE_COOLDOWN = 15
+	Notifications.Handler.start(asyncio.get_running_loop())
+
+	print("%10s %8s %14s %14s %10s" % ("streamers", "alerts", "legacy (ms)", "batched (ms)", "speedup"))
+	for size in args.sizes:
+		times = {"legacy" : [], "batched" : []}
+
+		for repeat in range(args.repeat):
+			legacy, legacy_state, legacy_alerts = await run_cycle("legacy", size, args.live, args.churn, repeat)
+			batched, batched_state, batched_alerts = await run_cycle("batched", size, args.live, args.churn, repeat)
+
+			# Both Implementations Must Agree
+			assert legacy_state == batched_state and legacy_alerts == batched_alerts, size
+
+			times["legacy"].append(legacy)
+			times["batched"].append(batched)
+
+		legacy, batched = min(times["legacy"]), min(times["batched"])
+		print("%10d %8d %14.2f %14.2f %9.1fx" % (size, len(batched_alerts), legacy * 1e3, batched * 1e3, legacy / max(batched, 1e-9)))
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Compare the batched state diff against the original per-streamer updates")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Watchlist sizes to test")
+	parser.add_argument("--live", type=float, default=0.05, help="Fraction of streamers that are live (Default: 0.05)")
+	parser.add_argument("--churn", type=float, default=0.001, help="Fraction of streamers that change each cycle (Default: 0.001)")
+	parser.add_argument("--repeat", type=int, default=5, help="Cycles per size (the fastest is reported)")
+	args = parser.parse_args()
+
+	asyncio.run(main(args))
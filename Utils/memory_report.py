@@ -0,0 +1,126 @@
+import tracemalloc
+import argparse
+import random
+import json
+import gc
+import sys
+import os
+
+# Make the Main Program Importable From the Utils Folder
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from Streamer import Streamer
+
+
+# Reports the Memory Each Streamer Costs, Compared With the Original Streamer Class (Copied Below)
+# Streamers are Filled From a Decoded /channels Response so Their Strings are Allocated the Same Way as in the Program
+# Also Reports the Peak Memory of Collecting One Cycle of Responses, With and Without Copying Every Row
+
+
+
+# The Original Streamer Attributes, Kept Here as a Baseline
+class LegacyStreamer():
+
+	def __init__(self, username, user_id, ban_status):
+		self.name = username
+		self.id = user_id
+		self.ban_status = ban_status
+
+		self.last_title = ""
+		self.last_game = ""
+		self.last_live = 0
+		self.is_live = False
+		self.last_push = 0
+
+		self.module_preferences = {}
+		self.module_last_change = {}
+
+
+
+# Games Are Heavily Skewed Towards a Few Categories, Like on Twitch
+GAMES = ["Just Chatting", "Grand Theft Auto V", "League of Legends", "VALORANT", "Minecraft", "Counter-Strike", "Fortnite", "Dota 2"] + ["Game " + str(index) for index in range(500)]
+
+
+
+# Builds the Body of a /channels Response for 'size' Streamers
+def channel_body(size, seed):
+	rng = random.Random(seed)
+	rows = []
+	for index in range(size):
+		user = str(1000000 + index)
+		rows.append({
+			"broadcaster_id" : user,
+			"broadcaster_login" : "streamer_" + user,
+			"broadcaster_name" : "streamer_" + user,
+			"broadcaster_language" : "en",
+			"game_id" : "0",
+			"game_name" : GAMES[min(int(rng.expovariate(0.3)), len(GAMES) - 1)],
+			"title" : "Stream Title Number " + user + " " + "x" * rng.randint(0, 60),
+			"delay" : 0,
+			"tags" : []
+		})
+	return json.dumps({"data" : rows})
+
+
+
+# Returns the Bytes Still Allocated After Building a Streamer Dict. With 'cls'
+def streamer_memory(cls, body):
+	rows = json.loads(body)["data"]
+	gc.collect()
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+
+	streamer_dict = {}
+	for row in rows:
+		streamer = cls(row["broadcaster_name"], row["broadcaster_id"], False)
+		streamer.last_title = row["title"]
+		streamer.last_game = Streamer.intern(row["game_name"]) if cls == Streamer else row["game_name"]
+		streamer.module_preferences["Discord"] = None
+		streamer.module_last_change["Discord"] = 0
+		streamer_dict[row["broadcaster_id"]] = streamer
+
+	# Only What the Streamers Hold On to Should Count, so Drop the Response
+	del rows, row, streamer
+	gc.collect()
+
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return after - before, streamer_dict
+
+
+
+# Returns the Peak Bytes Allocated While Decoding a Response and Collecting Its Rows
+def cycle_peak(body, copy):
+	gc.collect()
+	tracemalloc.start()
+
+	data_dict = {}
+	for row in json.loads(body)["data"]:
+		data_dict[row["broadcaster_id"]] = dict(row) if copy else row
+
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return peak
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Report the memory used per streamer")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Watchlist sizes to test")
+	args = parser.parse_args()
+
+	print("%10s %16s %16s %20s %20s" % ("streamers", "legacy (B/each)", "slots (B/each)", "copied rows (MB)", "decoded rows (MB)"))
+	for size in args.sizes:
+		body = channel_body(size, size)
+
+		legacy, kept = streamer_memory(LegacyStreamer, body)
+		del kept
+		compact, kept = streamer_memory(Streamer, body)
+		del kept
+
+		copied = cycle_peak(body, True)
+		decoded = cycle_peak(body, False)
+
+		print("%10d %16.0f %16.0f %20.1f %20.1f" % (size, legacy / size, compact / size, copied / 2**20, decoded / 2**20))
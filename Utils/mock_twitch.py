@@ -0,0 +1,398 @@
+from aiohttp import web
+import argparse
+import asyncio
+import uuid
+import time
+
+
+# Formats Seconds Since the Epoch Like Twitch Does. EventSub Timestamps Have Fractional Seconds, Helix Timestamps Don't
+def twitch_time(seconds, fractional=False):
+	text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+	return text + (".%06dZ" % (int(seconds * 1e6) % 1000000) if fractional else "Z")
+
+
+
+# A Local Stand-In for the Twitch Helix/OAuth Endpoints and the Discord/Pushover Webhook Targets
+# Point "API URL"/"Auth URL" in Twitch Settings (and "API URL" in Pushover Settings) at This Server
+#
+# Scripting Endpoints:
+# 	POST /mock/schedule   -> {"actions" : [{"at" : epoch_seconds, "op" : "live"|"offline"|"title"|"game"|"ban"|"unban"|"reconnect"|"drop", "ids" : [...], "value" : "..."}]}
+#	GET  /mock/events     -> Every State Change Applied So Far (With the Time It Took Effect)
+#	GET  /mock/deliveries -> Every Webhook/Pushover Request Received (With the Time It Arrived)
+#	POST /mock/reset      -> Clears Events and Deliveries
+#
+# EventSub:
+#	GET  /ws                          -> WebSocket Session (Point "EventSub URL" Here)
+#	POST /helix/eventsub/subscriptions -> Creates Subscriptions, Enforcing 'max_cost'
+#	Scripted Ops "reconnect" and "drop" Send a session_reconnect Message or Kill Every Session
+class MockTwitch():
+
+	# Builds a Fake Watchlist of 'streamers' Users. User ID's Start at 'first_id'
+	def __init__(self, streamers, first_id=1000000, max_cost=10, keepalive=10, rate_limit=800, webhook_limit=0, webhook_window=2.0):
+		self.channels = {}
+		self.live = {}
+		self.started = {} # User ID -> When the Stream Started, in Seconds. EventSub Sends It With Fractional Seconds
+		self.events = []
+		self.deliveries = []
+		self.requests = {"channels" : 0, "streams" : 0, "token" : 0, "subscriptions" : 0, "rate_limited" : 0, "webhook_rate_limited" : 0}
+
+		# Helix Rate Limit (Points per Minute per Client ID, Refilled Continuously)
+		self.rate_limit = rate_limit
+		self.buckets = {}
+
+		# Discord Webhook Rate Limit ('webhook_limit' Requests per 'webhook_window' Seconds per Webhook, 0 to Disable)
+		self.webhook_limit = webhook_limit
+		self.webhook_window = webhook_window
+		self.webhook_buckets = {}
+
+		# EventSub State
+		self.max_cost = max_cost
+		self.keepalive = keepalive
+		self.sessions = {}
+		self.subscriptions = {}
+
+		for i in range(streamers):
+			user_id = str(first_id + i)
+			self.channels[user_id] = {
+				"broadcaster_id" : user_id,
+				"broadcaster_login" : "streamer_" + str(i),
+				"broadcaster_name" : "streamer_" + str(i),
+				"broadcaster_language" : "en",
+				"game_id" : "509658",
+				"game_name" : "Just Chatting",
+				"title" : "Offline Title " + str(i),
+				"delay" : 0
+			}
+
+		self.app = web.Application()
+		self.app.add_routes([
+			web.post("/oauth2/token", self.token),
+			web.get("/helix/channels", self.get_channels),
+			web.get("/helix/streams", self.get_streams),
+			web.post("/helix/eventsub/subscriptions", self.subscribe),
+			web.get("/ws", self.websocket),
+			web.post("/webhook/{webhook_id}", self.webhook),
+			web.post("/1/messages.json", self.pushover),
+			web.post("/mock/schedule", self.schedule),
+			web.get("/mock/events", self.get_events),
+			web.get("/mock/deliveries", self.get_deliveries),
+			web.post("/mock/reset", self.reset)
+		])
+
+
+
+	# Applies a Single Scripted State Change to a List of Users
+	def apply(self, op, ids, value=None):
+		now = time.time()
+
+		# Session-Level Ops
+		if op in {"reconnect", "drop"}:
+			for session_id in list(self.sessions):
+				if op == "reconnect":
+					self.send(session_id, "session_reconnect", {"session" : {
+						"id" : session_id, "status" : "reconnecting", "keepalive_timeout_seconds" : None,
+						"reconnect_url" : self.sessions[session_id]["base"] + "/ws?reconnect=" + session_id
+					}})
+				else:
+					asyncio.get_running_loop().create_task(self.sessions[session_id]["ws"].close())
+			self.events.append({"time" : now, "op" : op, "id" : None, "name" : None})
+			return
+
+		for user_id in ids:
+			user_id = str(user_id)
+			if user_id not in self.channels:
+				continue
+
+			channel = self.channels[user_id]
+			if op == "live":
+				self.live[user_id] = twitch_time(now)
+				self.started[user_id] = now
+			elif op == "offline":
+				self.live.pop(user_id, None)
+			elif op == "title":
+				channel["title"] = str(value)
+			elif op == "game":
+				channel["game_name"] = str(value)
+			elif op == "ban":
+				channel["delay"] = None
+				self.live.pop(user_id, None)
+			elif op == "unban":
+				channel["delay"] = 0
+			else:
+				continue
+
+			self.events.append({"time" : now, "op" : op, "id" : user_id, "name" : channel["broadcaster_name"]})
+			self.push(op, user_id)
+
+
+
+	# Sends EventSub Notifications for a State Change to Every Subscribed Session
+	def push(self, op, user_id):
+		sub_type = {"live" : "stream.online", "offline" : "stream.offline", "ban" : "stream.offline", "title" : "channel.update", "game" : "channel.update"}.get(op)
+		channel = self.channels[user_id]
+
+		for sub_id, sub in self.subscriptions.items():
+			if sub["type"] != sub_type or sub["condition"]["broadcaster_user_id"] != user_id:
+				continue
+
+			event = {
+				"broadcaster_user_id" : user_id,
+				"broadcaster_user_login" : channel["broadcaster_login"],
+				"broadcaster_user_name" : channel["broadcaster_name"]
+			}
+			if sub_type == "stream.online":
+				event.update({"id" : "4" + user_id, "type" : "live", "started_at" : twitch_time(self.started.get(user_id, time.time()), True)})
+			elif sub_type == "channel.update":
+				event.update({"title" : channel["title"], "language" : "en", "category_id" : channel["game_id"], "category_name" : channel["game_name"], "content_classification_labels" : []})
+
+			self.send(sub["transport"]["session_id"], "notification", {"subscription" : sub, "event" : event})
+
+
+
+	# Queues a Message on an Open WebSocket Session
+	def send(self, session_id, message_type, payload):
+		if session_id not in self.sessions:
+			return
+
+		message = {
+			"metadata" : {
+				"message_id" : str(uuid.uuid4()),
+				"message_type" : message_type,
+				"message_timestamp" : twitch_time(time.time(), True)
+			},
+			"payload" : payload
+		}
+		if message_type == "notification":
+			message["metadata"]["subscription_type"] = payload["subscription"]["type"]
+			message["metadata"]["subscription_version"] = payload["subscription"]["version"]
+
+		asyncio.get_running_loop().create_task(self.sessions[session_id]["ws"].send_json(message))
+
+
+
+	# Waits Until 'at' and Then Applies the Action
+	async def run_action(self, action):
+		await asyncio.sleep(max(0, float(action.get("at", 0)) - time.time()))
+		self.apply(action["op"], action.get("ids", []), action.get("value"))
+
+
+
+	# Takes a Point From the Requesting Client's Rate-Limit Bucket
+	# Returns the Ratelimit-* Headers and Whether the Request is Allowed
+	def take_point(self, request):
+		now = time.time()
+		client_id = request.headers.get("Client-ID", "")
+		tokens, refilled = self.buckets.get(client_id, (float(self.rate_limit), now))
+		tokens = min(self.rate_limit, tokens + (now - refilled) * self.rate_limit / 60.0)
+
+		allowed = tokens >= 1
+		if allowed:
+			tokens -= 1
+		else:
+			self.requests["rate_limited"] += 1
+		self.buckets[client_id] = (tokens, now)
+
+		headers = {
+			"Ratelimit-Limit" : str(self.rate_limit),
+			"Ratelimit-Remaining" : str(int(tokens)),
+			"Ratelimit-Reset" : str(int(now + (self.rate_limit - tokens) * 60.0 / self.rate_limit) + 1)
+		}
+		return allowed, headers
+
+
+
+	# *** Twitch Endpoints ***
+
+	async def token(self, request):
+		self.requests["token"] += 1
+
+		# Client ID's Starting With "bad" are Rejected, for Testing Credential Failover
+		if request.query.get("client_id", "").startswith("bad"):
+			return web.json_response({"status" : 403, "message" : "invalid client secret"}, status=403)
+
+		return web.json_response({"access_token" : "mock-token", "expires_in" : 5000000, "token_type" : "bearer"})
+
+
+	async def get_channels(self, request):
+		self.requests["channels"] += 1
+		allowed, headers = self.take_point(request)
+		if not allowed:
+			return web.json_response({"error" : "Too Many Requests", "status" : 429, "message" : ""}, status=429, headers=headers)
+
+		data = [self.channels[user_id] for user_id in request.query.getall("broadcaster_id", []) if user_id in self.channels]
+		return web.json_response({"data" : data}, headers=headers)
+
+
+	async def get_streams(self, request):
+		self.requests["streams"] += 1
+		allowed, headers = self.take_point(request)
+		if not allowed:
+			return web.json_response({"error" : "Too Many Requests", "status" : 429, "message" : ""}, status=429, headers=headers)
+
+		data = []
+		for user_id in request.query.getall("user_id", []):
+			if user_id not in self.live:
+				continue
+
+			channel = self.channels[user_id]
+			data.append({
+				"id" : "4" + user_id,
+				"user_id" : user_id,
+				"user_login" : channel["broadcaster_login"],
+				"user_name" : channel["broadcaster_name"],
+				"game_id" : channel["game_id"],
+				"game_name" : channel["game_name"],
+				"type" : "live",
+				"title" : channel["title"],
+				"viewer_count" : 1,
+				"started_at" : self.live[user_id],
+				"language" : "en",
+				"thumbnail_url" : "",
+				"tag_ids" : [],
+				"is_mature" : False
+			})
+
+		return web.json_response({"data" : data, "pagination" : {}}, headers=headers)
+
+
+
+	# *** EventSub Endpoints ***
+
+	async def websocket(self, request):
+		ws = web.WebSocketResponse()
+		await ws.prepare(request)
+
+		# Reconnects Keep Their Session ID (and Subscriptions)
+		session_id = request.query.get("reconnect", str(uuid.uuid4()))
+		old = self.sessions.get(session_id)
+		self.sessions[session_id] = {"ws" : ws, "base" : "ws://" + request.host}
+
+		self.send(session_id, "session_welcome", {"session" : {
+			"id" : session_id, "status" : "connected", "keepalive_timeout_seconds" : self.keepalive, "reconnect_url" : None,
+			"connected_at" : twitch_time(time.time(), True)
+		}})
+
+		# Twitch Closes the Old Connection Once the New One is Welcomed
+		if old != None:
+			await old["ws"].close()
+
+		# Send Keepalives Whenever the Connection Goes Quiet
+		try:
+			while not ws.closed:
+				try:
+					await asyncio.wait_for(ws.receive(), self.keepalive)
+				except asyncio.TimeoutError:
+					self.send(session_id, "session_keepalive", {})
+		finally:
+			# Subscriptions Die With the Session (Unless It Was Replaced by a Reconnect)
+			if self.sessions.get(session_id, {}).get("ws") is ws:
+				del self.sessions[session_id]
+				for sub_id in [s for s in self.subscriptions if self.subscriptions[s]["transport"]["session_id"] == session_id]:
+					del self.subscriptions[sub_id]
+
+		return ws
+
+
+	async def subscribe(self, request):
+		self.requests["subscriptions"] += 1
+		body = await request.json()
+
+		if body["transport"].get("session_id") not in self.sessions:
+			return web.json_response({"error" : "Bad Request", "status" : 400, "message" : "websocket transport session does not exist or has already disconnected"}, status=400)
+
+		total_cost = len(self.subscriptions)
+		if total_cost + 1 > self.max_cost:
+			return web.json_response({"error" : "Too Many Requests", "status" : 429, "message" : "subscription cost exceeds maximum"}, status=429)
+
+		for sub in self.subscriptions.values():
+			if sub["type"] == body["type"] and sub["condition"] == body["condition"] and sub["transport"]["session_id"] == body["transport"]["session_id"]:
+				return web.json_response({"error" : "Conflict", "status" : 409, "message" : "subscription already exists"}, status=409)
+
+		sub_id = str(uuid.uuid4())
+		self.subscriptions[sub_id] = {
+			"id" : sub_id, "status" : "enabled", "type" : body["type"], "version" : body["version"], "cost" : 1,
+			"condition" : body["condition"], "transport" : body["transport"], "created_at" : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+		}
+		return web.json_response({"data" : [self.subscriptions[sub_id]], "total" : total_cost + 1, "total_cost" : total_cost + 1, "max_total_cost" : self.max_cost}, status=202)
+
+
+
+	# *** Notification Endpoints ***
+
+	async def webhook(self, request):
+		if not self.webhook_limit:
+			self.deliveries.append({"time" : time.time(), "target" : "discord", "body" : await request.json()})
+			return web.Response(status=204)
+
+		# Fixed Windows per Webhook, With the Same Headers Discord Sends
+		# Like Discord's, the Bucket ID Leaves Out the Webhook ID, so Every Webhook Reports the Same One
+		now = time.time()
+		webhook_id = request.match_info["webhook_id"]
+		used, window_start = self.webhook_buckets.get(webhook_id, (0, now))
+		if now >= window_start + self.webhook_window:
+			used, window_start = 0, now
+
+		reset_after = window_start + self.webhook_window - now
+		headers = {
+			"X-RateLimit-Bucket" : "mock-webhooks",
+			"X-RateLimit-Limit" : str(self.webhook_limit),
+			"X-RateLimit-Reset" : "%.3f" % (window_start + self.webhook_window),
+			"X-RateLimit-Reset-After" : "%.3f" % reset_after
+		}
+
+		if used >= self.webhook_limit:
+			self.requests["webhook_rate_limited"] += 1
+			headers.update({"X-RateLimit-Remaining" : "0", "Retry-After" : "%.3f" % reset_after})
+			return web.json_response({"message" : "You are being rate limited.", "retry_after" : reset_after, "global" : False}, status=429, headers=headers)
+
+		self.webhook_buckets[webhook_id] = (used + 1, window_start)
+		headers["X-RateLimit-Remaining"] = str(self.webhook_limit - used - 1)
+		self.deliveries.append({"time" : now, "target" : "discord", "body" : await request.json()})
+		return web.Response(status=204, headers=headers)
+
+
+	async def pushover(self, request):
+		self.deliveries.append({"time" : time.time(), "target" : "pushover", "body" : await request.json()})
+		return web.json_response({"status" : 1, "request" : "mock"})
+
+
+
+	# *** Scripting Endpoints ***
+
+	async def schedule(self, request):
+		body = await request.json()
+		for action in body["actions"]:
+			asyncio.get_running_loop().create_task(self.run_action(action))
+		return web.json_response({"scheduled" : len(body["actions"])})
+
+
+	async def get_events(self, request):
+		return web.json_response({"events" : self.events, "requests" : self.requests})
+
+
+	async def get_deliveries(self, request):
+		return web.json_response({"deliveries" : self.deliveries})
+
+
+	async def reset(self, request):
+		self.events = []
+		self.deliveries = []
+		return web.json_response({})
+
+
+
+# Run the Server Standalone
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Local stand-in for the Twitch, Discord and Pushover APIs")
+	parser.add_argument("--streamers", type=int, default=100, help="Number of fake streamers to serve")
+	parser.add_argument("--first-id", type=int, default=1000000, help="User ID of the first fake streamer")
+	parser.add_argument("--max-cost", type=int, default=10, help="EventSub max_total_cost (each subscription costs 1)")
+	parser.add_argument("--keepalive", type=int, default=10, help="EventSub keepalive_timeout_seconds")
+	parser.add_argument("--rate-limit", type=int, default=800, help="Helix points per minute")
+	parser.add_argument("--webhook-limit", type=int, default=0, help="Discord webhook requests per window (0 disables webhook rate limiting)")
+	parser.add_argument("--webhook-window", type=float, default=2.0, help="Discord webhook rate-limit window in seconds")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8089)
+	args = parser.parse_args()
+
+	web.run_app(MockTwitch(args.streamers, args.first_id, args.max_cost, args.keepalive, args.rate_limit, args.webhook_limit, args.webhook_window).app, host=args.host, port=args.port, print=None, access_log=None)
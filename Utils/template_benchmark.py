@@ -0,0 +1,87 @@
+import argparse
+import timeit
+import time
+import sys
+import os
+
+# Make the Main Program Importable From the Utils Folder
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from Notifications import Notifications
+
+
+# Micro-Benchmark for Notifications.special_format()
+# Compares the Compiled, Cached Templates Against the Original Scan-and-eval() Implementation (Copied Below)
+
+
+
+# The Original special_format(), Kept Here as a Baseline
+def legacy_format(format_string, **replace_vars):
+
+	# Define Some Extra Local Variables
+	replace_vars['time'] = time.localtime()
+	replace_vars['nl'] = "\n"
+	replace_vars['tb'] = "\t"
+	replace_vars['dq'] = "\""
+	replace_vars["sq"] = "\'"
+
+	out_string = str(format_string)
+
+	start_index = 0
+	while 1:
+
+		# Search for open brackets
+		open_index = format_string.find('{', start_index)
+		if open_index == -1:
+			break
+
+		# Search for closed brackets
+		close_index = format_string.find('}', open_index)
+		if close_index == -1:
+			raise Exception
+
+		# Evaluate the contents of the brackets and replace the brackets w/ the new string
+		eval_str = str(eval(format_string[open_index+1 : close_index], replace_vars))
+		out_string = out_string.replace( format_string[open_index : close_index+1], eval_str)
+
+		start_index = close_index
+
+	return out_string
+
+
+
+# Templates Similar to the Ones in the README Examples
+TEMPLATES = {
+	"plain" : "Someone Went Live!",
+	"simple" : "{name} is {message}",
+	"typical" : "{name} is Streaming {game}!{nl}{title}{nl}https://twitch.tv/{name.lower()}",
+	"heavy" : "{dq}{title}{dq} ({game}){nl}{name} {message} at {time.tm_hour}:{time.tm_min} {name.upper()} {name.lower()} {len(title)} {message.capitalize()}",
+	"duplicates" : "{name} {name} {name} {name} {title} {title} {game} {game}"
+}
+
+VARIABLES = {
+	"name" : "SomeStreamer",
+	"title" : "Playing Through the Whole Game Tonight",
+	"game" : "Just Chatting",
+	"message" : "live"
+}
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Compare compiled template rendering against the original special_format()")
+	parser.add_argument("--number", type=int, default=20000, help="Renders per measurement")
+	parser.add_argument("--repeat", type=int, default=5, help="Measurements per template (the fastest is reported)")
+	args = parser.parse_args()
+
+	print("%12s %14s %14s %10s" % ("template", "legacy (us)", "compiled (us)", "speedup"))
+	for label, template in TEMPLATES.items():
+
+		# Both Implementations Must Agree
+		assert legacy_format(template, **VARIABLES) == Notifications.special_format(template, **VARIABLES), label
+
+		legacy = min(timeit.repeat(lambda: legacy_format(template, **VARIABLES), number=args.number, repeat=args.repeat)) / args.number
+		compiled = min(timeit.repeat(lambda: Notifications.special_format(template, **VARIABLES), number=args.number, repeat=args.repeat)) / args.number
+
+		print("%12s %14.2f %14.2f %9.1fx" % (label, legacy * 1e6, compiled * 1e6, legacy / compiled))
@@ -0,0 +1,71 @@
+import argparse
+import json
+import sys
+import os
+
+
+# Converts the JSON-Lines Trace File Written by Tracing.py Into a Chrome Trace File
+# Open the Output in https://ui.perfetto.dev or chrome://tracing. Also Prints Where the Time Went in the Kept Cycles
+
+
+
+# Reads Every Event From the Trace File and Its Rotated Backups (Oldest First)
+def read_events(filename, backups):
+	events = []
+	for path in [filename + "." + str(index) for index in range(backups, 0, -1)] + [filename]:
+		if not os.path.exists(path):
+			continue
+
+		with open(path) as file:
+			for line in file:
+				if line.strip():
+					events.append(json.loads(line))
+	return events
+
+
+
+# Prints the Total and Worst Duration of Each Span Name, Slowest First
+def summarize(events):
+	spans = {}
+	for event in events:
+		if event["ph"] == "X":
+			spans.setdefault(event["cat"] + " / " + event["name"], []).append(event["dur"] / 1000.0)
+
+	cycles = len([event for event in events if event["ph"] == "X" and event["name"] == event["cat"]])
+	print("%d cycles" % cycles)
+	print("%-45s %8s %12s %12s" % ("span", "count", "total (ms)", "max (ms)"))
+	for name, durations in sorted(spans.items(), key=lambda item: -sum(item[1])):
+		print("%-45s %8d %12.1f %12.1f" % (name, len(durations), sum(durations), max(durations)))
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Convert a trace file written by Tracing.py for a trace viewer")
+	parser.add_argument("trace_file", help="Path to the trace file (traces.jsonl by default)")
+	parser.add_argument("--out", default=None, help="Where to write the Chrome trace (Default: <trace_file>.json)")
+	parser.add_argument("--backups", type=int, default=3, help="Rotated backups to include (Default: 3)")
+	parser.add_argument("--slow-only", action="store_true", help="Leave out cycles that were only kept by sampling")
+	args = parser.parse_args()
+
+	events = read_events(args.trace_file, args.backups)
+	if not len(events):
+		sys.exit("No Events Found in " + args.trace_file)
+
+	# Root Spans Say Whether Their Cycle Was Slow
+	if args.slow_only:
+		slow = set([event["args"]["trace"] for event in events if event["ph"] == "X" and event["args"].get("slow")])
+		events = [event for event in events if event["ph"] == "M" or event["args"].get("trace") in slow]
+
+	# Track Names are Repeated in Every Trace. Keep One of Each
+	names = {}
+	for event in events:
+		if event["ph"] == "M":
+			names[(event["pid"], event["tid"])] = event
+	events = [event for event in events if event["ph"] != "M"] + list(names.values())
+
+	out = args.out if args.out != None else args.trace_file + ".json"
+	with open(out, "w") as file:
+		json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, file)
+
+	summarize(events)
+	print("Wrote " + out)
@@ -0,0 +1,97 @@
+from aiohttp import web
+import tempfile
+import argparse
+import asyncio
+import time
+import sys
+import os
+
+# Make the Main Program Importable From the Utils Folder
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "Plugins"))
+
+from mock_twitch import MockTwitch
+from Notifications import Notifications
+from Discord import Discord
+from Config import Config
+from Outbox import Outbox
+
+
+# Checks That the Discord Plugin Keeps Webhooks' Rate Limits Apart
+# The Stand-In Server Reports the Same X-RateLimit-Bucket for Every Webhook, Like Discord Does, so Webhooks Sharing a
+# Bucket ID Must Not Share a Limit or Wait on Each Other
+# Exits With a Non-Zero Status if a Check Fails
+
+
+
+# Sends 'count' Messages to a Webhook at Once. Returns the Seconds It Took, or None if They Didn't Finish in Time
+async def burst(base_url, webhook, count, timeout):
+	start = time.time()
+	sends = [Discord.send(base_url + "/webhook/" + webhook, {"content" : webhook + "|" + str(i)}) for i in range(count)]
+	try:
+		await asyncio.wait_for(asyncio.gather(*sends), timeout)
+	except asyncio.TimeoutError:
+		return None
+	return time.time() - start
+
+
+
+async def main(args):
+	mock = MockTwitch(1, webhook_limit=args.limit, webhook_window=args.window)
+	runner = web.AppRunner(mock.app)
+	await runner.setup()
+	await web.TCPSite(runner, "127.0.0.1", args.port).start()
+	base_url = "http://127.0.0.1:" + str(args.port)
+
+	# The Outbox Isn't Used, but Notifications.init() Opens It Next to config.json
+	Config.filename = os.path.join(tempfile.mkdtemp(), "config.json")
+	Notifications.Handler.start(asyncio.get_running_loop())
+	Notifications.init({})
+
+	failures = []
+	try:
+		# Webhook A Reports the Shared Bucket ID First
+		if await burst(base_url, "a", 1, args.timeout) == None:
+			failures.append("The First Message to Webhook A Never Finished")
+
+		# A New Webhook Reporting the Same Bucket ID Must Not Hang
+		if await burst(base_url, "b", 2, args.timeout) == None:
+			failures.append("Concurrent Messages to Webhook B Hung After Webhook A Reported the Same Bucket ID")
+
+		# Each Webhook Gets Its Own Limit, so Full Windows on Both Take About as Long as One
+		mock.requests["webhook_rate_limited"] = 0
+		await asyncio.sleep(args.window)
+		one = await burst(base_url, "c", args.limit, args.timeout)
+		both = await asyncio.gather(burst(base_url, "d", args.limit, args.timeout), burst(base_url, "e", args.limit, args.timeout))
+
+		if one == None or None in both:
+			failures.append("A Full Window of Messages Never Finished")
+		elif max(both) > one + args.window / 2:
+			failures.append("Webhooks D and E Throttled Each Other (%.2fs for Both vs %.2fs for One)" % (max(both), one))
+
+		if mock.requests["webhook_rate_limited"]:
+			failures.append(str(mock.requests["webhook_rate_limited"]) + " Message(s) Got a 429")
+
+	finally:
+		await Notifications.requests.close()
+		await Outbox.close()
+		await runner.cleanup()
+
+	for failure in failures:
+		print("FAIL: " + failure)
+	if not len(failures):
+		print("OK: " + str(len(mock.deliveries)) + " Messages Delivered Across 5 Webhooks Sharing One Bucket ID")
+	return len(failures) == 0
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Check that Discord webhooks sharing a rate-limit bucket ID don't hang or throttle each other")
+	parser.add_argument("--port", type=int, default=8790, help="Port for the stand-in server (Default: 8790)")
+	parser.add_argument("--limit", type=int, default=5, help="Messages per window per webhook (Default: 5)")
+	parser.add_argument("--window", type=float, default=2.0, help="Rate-limit window in seconds (Default: 2)")
+	parser.add_argument("--timeout", type=float, default=10.0, help="Seconds before a send counts as hung (Default: 10)")
+	args = parser.parse_args()
+
+	sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -9,16 +9,78 @@ REQUIRED_KEYS = {
 }
 OPTIONAL_KEYS = {
 	"Discord Settings"  : dict,
-	"Pushover Settings" : dict
+	"Pushover Settings" : dict,
+	"Alert Settings"    : dict,
+	"Metrics Settings"  : dict,
+	"Tracing Settings"  : dict,
+	"Shard Settings"    : dict,
+	"Cluster Settings"  : dict
 }
 
 # Twitch Keys
 TWITCH_REQUIRED_KEYS = {
-	"Client ID"          : str,
-	"Secret"             : str,
 	"Reconnect Attempts" : int,
 	"Reconnect Cooldown" : {float, int},
-	"Refresh Rate"       : {float, int}
+	"Refresh Rate"       : {float, int, str}
+}
+TWITCH_OPTIONAL_KEYS = {
+	"Client ID"            : str,
+	"Secret"               : str,
+	"Credentials"          : (list, dict),
+	"API URL"              : str,
+	"Auth URL"             : str,
+	"EventSub Token"       : str,
+	"EventSub URL"         : str,
+	"Reconciliation Rate"  : {float, int},
+	"Channel Refresh Rate" : {float, int, str}
+}
+
+# Keys for Each Entry in "Credentials"
+CREDENTIAL_REQUIRED_KEYS = {
+	"Client ID" : str,
+	"Secret"    : str
+}
+
+# Alert Delivery Keys
+ALERT_SETTINGS_OPTIONAL_KEYS = {
+	"Alert Workers"           : int,
+	"Destination Concurrency" : int,
+	"Outbox File"             : str,
+	"Outbox Max Age"          : {float, int},
+	"Retry Attempts"          : int,
+	"Retry Base Delay"        : {float, int},
+	"Retry Max Delay"         : {float, int},
+	"Live Alert SLO"          : {float, int}
+}
+
+# Metrics Endpoint Keys
+METRICS_SETTINGS_OPTIONAL_KEYS = {
+	"Host" : str,
+	"Port" : int
+}
+
+# Tracing Keys
+TRACING_SETTINGS_OPTIONAL_KEYS = {
+	"File"          : str,
+	"Sample Rate"   : {float, int},
+	"Max File Size" : {float, int},
+	"Backups"       : int
+}
+
+# Shard Keys
+SHARD_SETTINGS_OPTIONAL_KEYS = {
+	"Shards"           : int,
+	"Restart Cooldown" : {float, int}
+}
+
+# Cluster Keys
+CLUSTER_SETTINGS_OPTIONAL_KEYS = {
+	"Node ID"       : str,
+	"Coordinator"   : str,
+	"Database"      : str,
+	"Heartbeat"     : {float, int},
+	"Node Timeout"  : {float, int},
+	"Virtual Nodes" : int
 }
 
 # Streamer Keys
@@ -181,14 +243,86 @@ def validate():
 
 	# Check Primary Keys
 	setting_keys = dict([(module.SETTINGS_KEY, dict) for module in Config.enabled_modules if hasattr(module, "SETTINGS_KEY")])
-	warnings = check_keys("config.json", Config.config_file, REQUIRED_KEYS, setting_keys)
+	warnings = check_keys("config.json", Config.config_file, REQUIRED_KEYS, dict(OPTIONAL_KEYS, **setting_keys))
 
 	# Check Twitch Keys
-	warnings += check_keys("Twitch Settings", Config.config_file["Twitch Settings"], TWITCH_REQUIRED_KEYS)
-
-	# Validate Refresh Rate
-	if Config.config_file["Twitch Settings"]["Refresh Rate"] <= 0:
-		raise ConfigFormatError("Refresh Rate Must Be Greter Than Zero")
+	warnings += check_keys("Twitch Settings", Config.config_file["Twitch Settings"], TWITCH_REQUIRED_KEYS, TWITCH_OPTIONAL_KEYS)
+
+	# Check Credentials. We Need at Least One Client ID/Secret Pair
+	if ("Client ID" in Config.config_file["Twitch Settings"]) != ("Secret" in Config.config_file["Twitch Settings"]):
+		raise ConfigFormatError("\"Client ID\" and \"Secret\" Must Be Given Together in Twitch Settings")
+
+	for index, credential in enumerate(Config.config_file["Twitch Settings"].get("Credentials", [])):
+		warnings += check_keys("Twitch Settings/Credentials/" + str(index), credential, CREDENTIAL_REQUIRED_KEYS)
+
+	if "Client ID" not in Config.config_file["Twitch Settings"] and not len(Config.config_file["Twitch Settings"].get("Credentials", [])):
+		raise ConfigFormatError("Twitch Settings Needs a \"Client ID\" and \"Secret\" or a List of \"Credentials\"")
+
+	# Validate Refresh Rates
+	for key in ("Refresh Rate", "Channel Refresh Rate"):
+		rate = Config.config_file["Twitch Settings"].get(key, "auto")
+		if type(rate) == str and rate != "auto":
+			raise ConfigFormatError(key + " Must Be a Number or \"auto\"")
+		if type(rate) != str and rate <= 0:
+			raise ConfigFormatError(key + " Must Be Greter Than Zero")
+	if Config.config_file["Twitch Settings"].get("Reconciliation Rate", 1) <= 0:
+		raise ConfigFormatError("Reconciliation Rate Must Be Greater Than Zero")
+
+	# Check Alert Delivery Keys
+	if "Alert Settings" in Config.config_file:
+		warnings += check_keys("Alert Settings", Config.config_file["Alert Settings"], optional_keys=ALERT_SETTINGS_OPTIONAL_KEYS)
+		for key in ("Alert Workers", "Destination Concurrency", "Outbox Max Age", "Retry Attempts", "Retry Base Delay", "Retry Max Delay", "Live Alert SLO"):
+			if Config.config_file["Alert Settings"].get(key, 1) <= 0:
+				raise ConfigFormatError(key + " Must Be Greater Than Zero")
+		if not len(Config.config_file["Alert Settings"].get("Outbox File", "outbox.db")):
+			raise ConfigFormatError("Outbox File Can't Be Empty")
+
+	# Check Metrics Endpoint Keys
+	if "Metrics Settings" in Config.config_file:
+		warnings += check_keys("Metrics Settings", Config.config_file["Metrics Settings"], optional_keys=METRICS_SETTINGS_OPTIONAL_KEYS)
+		if not 0 < Config.config_file["Metrics Settings"].get("Port", 9180) < 65536:
+			raise ConfigFormatError("Port in Metrics Settings Must Be Between 1 and 65535")
+
+	# Check Tracing Keys
+	if "Tracing Settings" in Config.config_file:
+		settings = Config.config_file["Tracing Settings"]
+		warnings += check_keys("Tracing Settings", settings, optional_keys=TRACING_SETTINGS_OPTIONAL_KEYS)
+		if not 0 <= settings.get("Sample Rate", 0) <= 1:
+			raise ConfigFormatError("Sample Rate in Tracing Settings Must Be Between 0 and 1")
+		if settings.get("Max File Size", 10) <= 0:
+			raise ConfigFormatError("Max File Size in Tracing Settings Must Be Greater Than Zero")
+		if settings.get("Backups", 3) < 0:
+			raise ConfigFormatError("Backups in Tracing Settings Can't Be Negative")
+		if not len(settings.get("File", "traces.jsonl")):
+			raise ConfigFormatError("File in Tracing Settings Can't Be Empty")
+
+	# Check Shard Keys
+	if "Shard Settings" in Config.config_file:
+		settings = Config.config_file["Shard Settings"]
+		warnings += check_keys("Shard Settings", settings, optional_keys=SHARD_SETTINGS_OPTIONAL_KEYS)
+		if settings.get("Shards", 1) < 1:
+			raise ConfigFormatError("Shards Must Be at Least 1")
+		if settings.get("Restart Cooldown", 5) < 0:
+			raise ConfigFormatError("Restart Cooldown in Shard Settings Can't Be Negative")
+
+	# Check Cluster Keys
+	if "Cluster Settings" in Config.config_file:
+		from Cluster import COORDINATORS
+		settings = Config.config_file["Cluster Settings"]
+		warnings += check_keys("Cluster Settings", settings, optional_keys=CLUSTER_SETTINGS_OPTIONAL_KEYS)
+
+		if settings.get("Coordinator", "SQLite") not in COORDINATORS:
+			raise ConfigFormatError("Coordinator in Cluster Settings Must Be One of: " + ", ".join(COORDINATORS))
+		if not len(settings.get("Node ID", "-")) or not len(settings.get("Database", "-")):
+			raise ConfigFormatError("Node ID and Database in Cluster Settings Can't Be Empty")
+		if settings.get("Heartbeat", 5) <= 0:
+			raise ConfigFormatError("Heartbeat in Cluster Settings Must Be Greater Than Zero")
+		if settings.get("Node Timeout", 3 * settings.get("Heartbeat", 5)) <= settings.get("Heartbeat", 5):
+			raise ConfigFormatError("Node Timeout in Cluster Settings Must Be Longer Than the Heartbeat")
+		if settings.get("Virtual Nodes", 64) < 1:
+			raise ConfigFormatError("Virtual Nodes in Cluster Settings Must Be at Least 1")
+		if Config.config_file.get("Shard Settings", {}).get("Shards", 1) > 1:
+			raise ConfigFormatError("Cluster Settings Can't Be Used With More Than One Shard")
 
 	# Check Length of "Streamers" Array
 	if not len(Config.config_file["Streamers"]):